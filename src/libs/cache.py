@@ -0,0 +1,589 @@
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import partial, wraps
+from urllib.parse import unquote, urlsplit
+
+from fastapi import Response
+
+from src.libs.circuit import CircuitOpenError
+from src.libs.coalesce import (
+    SingleFlight,
+    endpoint_request,
+    request_accept_encoding,
+    request_key,
+)
+from src.libs.compression import (
+    compress_all,
+    compress_all_off_loop,
+    decompress,
+    levels_for,
+)
+from src.libs.deadline import request_deadline_seconds, set_deadline
+from src.libs.responses import EncodedResponse
+
+# Upper bound on the total size of all cached entries held in process, in bytes.
+response_cache_max_bytes = int(
+    os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+
+# When set (e.g. "redis://10.0.0.3:6379/0"), cached responses are stored in a
+# Redis-protocol server shared by every API instance rather than in process.
+response_cache_url = os.environ.get("RESPONSE_CACHE_URL")
+
+
+class CacheEntry:
+    __slots__ = ("_body", "encodings", "raw_headers", "status_code", "stored_at")
+
+    def __init__(
+        self,
+        body: bytes | None,
+        status_code: int,
+        raw_headers: list[tuple[bytes, bytes]],
+        stored_at: float | None = None,
+        encodings: dict[str, bytes] | None = None,
+    ):
+        """A rendered API response held in the response cache.
+
+        The body is compressed once, when the entry is created, with each coding in
+        src.libs.compression.supported_encodings. Cache hits are served the
+        compressed body the client accepts as is, with no encoding or compression.
+
+        Args:
+            body (bytes | None): The encoded response body. May be None if encodings
+            holds a gzip body.
+            status_code (int): The HTTP status code of the response.
+            raw_headers (list): The response headers as (name, value) byte pairs.
+            stored_at (float, optional): Wall clock time the response was cached.
+            Defaults to now.
+            encodings (dict[str, bytes] | None, optional): The already compressed body
+            by content coding. Defaults to None, compressing body.
+        """
+        if encodings is None:
+            encodings = compress_all(body)
+
+        self._body = body
+        self.encodings = encodings
+        self.status_code = status_code
+        self.raw_headers = raw_headers
+        self.stored_at = time.time() if stored_at is None else stored_at
+
+    @property
+    def body(self) -> bytes:
+        """The uncompressed response body."""
+        if self._body is None:
+            self._body = decompress(self.encodings["gzip"], "gzip")
+        return self._body
+
+    @property
+    def age(self) -> float:
+        """Seconds since this entry was cached."""
+        return time.time() - self.stored_at
+
+    @classmethod
+    def from_response(cls, response: Response) -> "CacheEntry":
+        return cls(
+            body=bytes(response.body),
+            status_code=response.status_code,
+            raw_headers=list(response.raw_headers),
+        )
+
+    @classmethod
+    async def compress_response(
+        cls, response: Response, levels: dict[str, int] | None = None
+    ) -> "CacheEntry":
+        """Build an entry from response, compressing a large body on a worker thread.
+
+        Args:
+            response (Response): The response to cache.
+            levels (dict[str, int] | None, optional): The compression level by content
+            coding, see src.libs.compression.levels_for(). Defaults to None.
+        """
+        body = bytes(response.body)
+        return cls(
+            body=body,
+            status_code=response.status_code,
+            raw_headers=list(response.raw_headers),
+            encodings=await compress_all_off_loop(body, levels),
+        )
+
+    def to_response(self, accept_encoding: str = "") -> EncodedResponse:
+        """Build a response to a request with the given Accept-Encoding header."""
+        encodings = self.encodings
+        if not encodings or self._body is not None:
+            encodings = {**encodings, "identity": self.body}
+        return EncodedResponse(
+            encodings, self.status_code, list(self.raw_headers), accept_encoding
+        )
+
+    def dumps(self) -> bytes:
+        """Serialize this entry for storage in a cache backend. Only the compressed
+        bodies are stored, unless the body was too small to compress.
+        """
+        bodies = list(self.encodings.items()) or [("identity", self.body)]
+        header = json.dumps(
+            {
+                "statusCode": self.status_code,
+                "headers": [
+                    [name.decode("latin-1"), value.decode("latin-1")]
+                    for name, value in self.raw_headers
+                ],
+                "storedAt": self.stored_at,
+                "encodings": [[name, len(body)] for name, body in bodies],
+            }
+        )
+        return header.encode() + b"\n" + b"".join(body for _, body in bodies)
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CacheEntry":
+        """Deserialize an entry produced by dumps()."""
+        header, body = data.split(b"\n", 1)
+        metadata = json.loads(header)
+
+        bodies = {}
+        position = 0
+        for name, length in metadata["encodings"]:
+            bodies[name] = body[position : position + length]
+            position += length
+
+        return cls(
+            body=bodies.pop("identity", None),
+            status_code=metadata["statusCode"],
+            raw_headers=[
+                (name.encode("latin-1"), value.encode("latin-1"))
+                for name, value in metadata["headers"]
+            ],
+            stored_at=metadata["storedAt"],
+            encodings=bodies,
+        )
+
+
+class CacheBackend(ABC):
+    """Storage for serialized cache entries. Backends must never raise for an
+    unavailable store; a failed get is a miss and a failed set is dropped, so the
+    cache can only ever make a request faster, never fail it.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        """Return the stored value for key, or None if missing or expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        """Store value under key for ttl seconds."""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Remove every stored value."""
+
+    def stats(self) -> dict:
+        """Backend specific counters."""
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_bytes: int):
+        """An in-process cache backend bounded by the total size of the stored values
+        rather than the number of entries, as inventory payloads range from a few bytes
+        (no inventory) to several megabytes. When full, the least recently used values
+        are evicted.
+
+        Args:
+            max_bytes (int): Upper bound on the total size of all stored values.
+        """
+        self.max_bytes = max_bytes
+        self._values: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    async def get(self, key: str) -> bytes | None:
+        stored = self._values.get(key)
+        if stored is None:
+            return None
+
+        value, expires_at = stored
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+
+        self._values.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        if key in self._values:
+            self._remove(key)
+
+        # A value larger than the whole cache would evict everything and still not
+        # fit.
+        if len(value) > self.max_bytes:
+            return
+
+        self._values[key] = (value, time.monotonic() + ttl)
+        self._bytes += len(value)
+
+        while self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._values))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    async def clear(self) -> None:
+        self._values.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "evictions": self.evictions,
+            "entries": len(self._values),
+            "bytes": self._bytes,
+            "maxBytes": self.max_bytes,
+        }
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._values.pop(key)
+        self._bytes -= len(value)
+
+
+class RedisError(Exception):
+    """An error reply from a Redis-protocol server."""
+
+
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str, timeout: float = 0.5, max_idle_connections: int = 8):
+        """A cache backend speaking the Redis protocol (RESP), so cached responses are
+        shared by every API instance. Works with Redis, Memorystore, Valkey or any
+        other server implementing GET and SET.
+
+        Args:
+            url (str): Server location, e.g. "redis://:password@10.0.0.3:6379/0".
+            timeout (float, optional): How long to wait on the server before treating
+            a get as a miss. Defaults to 0.5.
+            max_idle_connections (int, optional): How many idle connections to keep
+            open for reuse. Defaults to 8.
+        """
+        parsed = urlsplit(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.max_idle_connections = max_idle_connections
+        self.errors = 0
+
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def get(self, key: str) -> bytes | None:
+        try:
+            return await self._command(b"GET", key.encode())
+        except OSError, TimeoutError, RedisError:
+            self.errors += 1
+            return None
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        try:
+            await self._command(
+                b"SET", key.encode(), value, b"PX", str(int(ttl * 1000)).encode()
+            )
+        except OSError, TimeoutError, RedisError:
+            self.errors += 1
+
+    async def clear(self) -> None:
+        try:
+            await self._command(b"FLUSHDB")
+        except OSError, TimeoutError, RedisError:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "errors": self.errors,
+        }
+
+    async def _command(self, *args: bytes):
+        reader, writer = await self._acquire()
+        try:
+            async with asyncio.timeout(self.timeout):
+                writer.write(encode_command(*args))
+                await writer.drain()
+                reply = await read_reply(reader)
+        except BaseException:
+            # The connection may be part way through a reply, so it can't be reused
+            writer.close()
+            raise
+
+        self._release(reader, writer)
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    async def _acquire(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        # Connections are bound to the event loop which opened them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._idle = []
+            self._loop = loop
+
+        if self._idle:
+            return self._idle.pop()
+
+        async with asyncio.timeout(self.timeout):
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+
+            setup = []
+            if self.password:
+                setup.append(encode_command(b"AUTH", self.password.encode()))
+            if self.db:
+                setup.append(encode_command(b"SELECT", str(self.db).encode()))
+
+            try:
+                for command in setup:
+                    writer.write(command)
+                    await writer.drain()
+                    reply = await read_reply(reader)
+                    if isinstance(reply, RedisError):
+                        raise reply
+            except BaseException:
+                # A connection which failed its setup is never returned, so close it
+                writer.close()
+                raise
+
+        return reader, writer
+
+    def _release(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        if len(self._idle) < self.max_idle_connections:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+
+
+def encode_command(*args: bytes) -> bytes:
+    """Encode a command as a RESP array of bulk strings."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Read a single RESP reply. Error replies are returned, not raised, so the
+    caller can finish reading the connection before deciding what to do.
+    """
+    line = await reader.readuntil(b"\r\n")
+    prefix, payload = line[:1], line[1:-2]
+
+    if prefix == b"+":
+        return payload
+    if prefix == b"-":
+        return RedisError(payload.decode())
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+
+    raise RedisError(f"Unexpected reply from server: {line!r}")
+
+
+class ResponseCache:
+    def __init__(self, backend: CacheBackend):
+        """A cache of rendered API responses stored in a pluggable backend.
+
+        Args:
+            backend (CacheBackend): Where serialized entries are stored.
+        """
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    async def get(self, key: str) -> CacheEntry | None:
+        """Return the cached entry for key, or None on a cache miss."""
+        data = await self.backend.get(key)
+
+        entry = None
+        if data is not None:
+            try:
+                entry = CacheEntry.loads(data)
+            except ValueError, KeyError, OSError:
+                entry = None
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry, ttl: float) -> None:
+        await self.backend.set(key, entry.dumps(), ttl)
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+
+    def stats(self) -> dict:
+        """Cache counters, e.g. for exposing through an API endpoint."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "staleHits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "refreshErrors": self.refresh_errors,
+            **self.backend.stats(),
+        }
+
+
+def create_backend(url: str | None) -> CacheBackend:
+    """Return the backend for a RESPONSE_CACHE_URL value, defaulting to in process."""
+    if url and urlsplit(url).scheme in ("redis", "valkey"):
+        return RedisBackend(url)
+    return MemoryBackend(max_bytes=response_cache_max_bytes)
+
+
+response_cache = ResponseCache(backend=create_backend(response_cache_url))
+
+# Background refreshes of stale entries, so each key is refreshed at most once at a
+# time however many requests are served the stale entry meanwhile.
+refresh_flights = SingleFlight()
+_refresh_tasks: set[asyncio.Task] = set()
+
+
+async def fetch_and_cache(
+    key: str,
+    fetch,
+    ttl: float,
+    levels: dict[str, int] | None = None,
+    accept_encoding: str = "",
+):
+    """Call the endpoint and cache its response if successful.
+
+    Args:
+        key (str): The cache key for this request.
+        fetch (Callable): A zero argument coroutine function returning the response.
+        ttl (float): How long, in seconds, the cache backend keeps the response.
+        levels (dict[str, int] | None, optional): The compression level by content
+        coding for the cached body. Defaults to None.
+        accept_encoding (str, optional): The request's Accept-Encoding header.
+        Defaults to "".
+
+    Returns:
+        The endpoint's response. A successful response is returned as the cache entry
+        would serve it, compressed in the coding the client prefers.
+    """
+    response = await fetch()
+
+    if isinstance(response, Response) and response.status_code == 200:
+        entry = await CacheEntry.compress_response(response, levels)
+        await response_cache.set(key, entry, ttl=ttl)
+        return entry.to_response(accept_encoding)
+
+    return response
+
+
+async def refresh_in_background(
+    key: str,
+    fetch,
+    ttl: float,
+    levels: dict[str, int] | None = None,
+    stale: CacheEntry | None = None,
+    stale_ttl: float = 0,
+) -> None:
+    """Refresh a stale cache entry. A failed refresh leaves the stale entry in place
+    to be served until it expires. While the manufacturer API's circuit is open (see
+    src.libs.circuit) the stale entry is kept for a further stale_ttl, so the last
+    good response is served for as long as the API is down.
+
+    The refresh runs after the request which started it has been answered, so is
+    given a deadline of its own (see src.libs.deadline).
+    """
+    set_deadline(request_deadline_seconds)
+    try:
+        await refresh_flights.do(key, partial(fetch_and_cache, key, fetch, ttl, levels))
+        response_cache.refreshes += 1
+    except CircuitOpenError:
+        response_cache.refresh_errors += 1
+        if stale is not None and stale_ttl > 0:
+            await response_cache.set(key, stale, ttl=stale_ttl)
+    except Exception as e:
+        response_cache.refresh_errors += 1
+        print(f"Background refresh of {key} failed: {e!r}")
+
+
+def cache_response(manufacturer: str, ttl: float, stale_ttl: float = 0):
+    """Decorator for FastAPI endpoints which serves repeated requests from the
+    response cache, skipping the manufacturer API entirely.
+
+    Responses are keyed on the manufacturer and query parameters (see
+    src.libs.coalesce.request_key). Only successful (200) responses are cached; errors
+    are raised as HTTPExceptions and never reach the cache. Cached responses are
+    compressed once, at the route's levels (see src.libs.compression.levels_for()),
+    and sent in the coding the request's Accept-Encoding prefers.
+
+    Once an entry is older than ttl it is stale. For a further stale_ttl seconds a
+    stale entry is still served immediately while it is refreshed in the background,
+    so a slow manufacturer API only delays the refresh, not the user. After that the
+    entry expires and the next request waits on the manufacturer API, unless the API
+    is down and its circuit open, in which case the stale entry is kept and served.
+
+    Args:
+        manufacturer (str): The manufacturer served by the decorated endpoint.
+        ttl (float): How long, in seconds, a cached response is fresh for.
+        stale_ttl (float, optional): How long, in seconds, a stale response may be
+        served while it is refreshed. Defaults to 0.
+    """
+    hard_ttl = ttl + stale_ttl
+
+    def decorator(endpoint):
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            key = request_key(manufacturer, kwargs)
+            encoding = request_accept_encoding(kwargs)
+            req = endpoint_request(kwargs)
+            levels = levels_for(req.url.path) if req is not None else None
+            fetch = partial(endpoint, *args, **kwargs)
+
+            entry = await response_cache.get(key)
+            if entry is None:
+                return await fetch_and_cache(
+                    key, fetch, ttl=hard_ttl, levels=levels, accept_encoding=encoding
+                )
+
+            if entry.age >= ttl:
+                response_cache.stale_hits += 1
+                if not refresh_flights.in_flight(key):
+                    task = asyncio.get_running_loop().create_task(
+                        refresh_in_background(
+                            key,
+                            fetch,
+                            ttl=hard_ttl,
+                            levels=levels,
+                            stale=entry,
+                            stale_ttl=stale_ttl,
+                        )
+                    )
+                    # Hold a reference so the task isn't garbage collected mid refresh
+                    _refresh_tasks.add(task)
+                    task.add_done_callback(_refresh_tasks.discard)
+
+            return entry.to_response(encoding)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,143 @@
+import os
+import time
+
+import httpx
+from fastapi import HTTPException
+
+from src.libs.deadline import DeadlineExceeded
+
+# Consecutive failed requests to a manufacturer API which open its circuit
+circuit_failure_threshold = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+
+# How long, in seconds, a circuit stays open before a trial request is let through
+circuit_recovery_time = float(os.environ.get("CIRCUIT_RECOVERY_TIME", "30"))
+
+
+class CircuitOpenError(HTTPException):
+    def __init__(self, base_url: str, retry_after: float):
+        """Raised in place of a request to a manufacturer API whose circuit is open.
+        A HTTPException, so an endpoint which doesn't handle it fails with a 503 in
+        the same shape as error_response().
+        """
+        super().__init__(
+            status_code=503,
+            detail={
+                "errorMessage": "The manufacturer's inventory service is unavailable.",
+                "errorData": f"Requests to {base_url} are suspended after repeated "
+                "failures.",
+            },
+            headers={"Retry-After": str(max(1, round(retry_after)))},
+        )
+        self.base_url = base_url
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        base_url: str,
+        failure_threshold: int = circuit_failure_threshold,
+        recovery_time: float = circuit_recovery_time,
+    ):
+        """Stops requests to a manufacturer API which is down, rather than have every
+        request wait out its timeout.
+
+        The circuit starts closed, letting requests through. After failure_threshold
+        consecutive requests fail with a timeout, a network error or a 5xx status, or
+        are cut off by the request's deadline while waiting on the API, it opens, and requests fail at once with CircuitOpenError. After recovery_time it
+        is half-open: a single trial request is let through, closing the circuit if it
+        succeeds and opening it again if it fails.
+
+        Call before_request() before each request to the API, and after_request()
+        once it is done.
+
+        Args:
+            base_url (str): The manufacturer base URL the circuit is for.
+            failure_threshold (int, optional): Consecutive failures which open the
+            circuit. Defaults to circuit_failure_threshold.
+            recovery_time (float, optional): How long, in seconds, the circuit stays
+            open. Defaults to circuit_recovery_time.
+        """
+        self.base_url = base_url
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+
+    def before_request(self) -> bool:
+        """Let a request through, or reject it if the circuit is open.
+
+        Raises:
+            CircuitOpenError: The circuit is open, or half-open with a trial request
+            already in flight.
+
+        Returns:
+            bool: Whether this request is the trial request of a half-open circuit.
+        """
+        if self.state == "open":
+            retry_after = self.opened_at + self.recovery_time - time.monotonic()
+            if retry_after > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.base_url, retry_after)
+            self.state = "half-open"
+
+        if self.state == "half-open":
+            if self.trial_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.base_url, self.recovery_time)
+            self.trial_in_flight = True
+            return True
+
+        return False
+
+    def after_request(self, error: BaseException | None, trial: bool) -> None:
+        """Record the outcome of a request let through by before_request().
+
+        Args:
+            error (BaseException | None): What the request failed with, or None if it
+            succeeded.
+            trial (bool): What before_request() returned for the request.
+        """
+        if trial:
+            self.trial_in_flight = False
+
+        if error is None or (
+            isinstance(error, httpx.HTTPStatusError)
+            and error.response.status_code < 500
+        ):
+            # The API answered, so it is up
+            self.failures = 0
+            self.state = "closed"
+        elif self.trips(error):
+            self.failures += 1
+            if trial or (
+                self.state == "closed" and self.failures >= self.failure_threshold
+            ):
+                print(f"Opening the circuit to {self.base_url}: {error!r}")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.opened += 1
+        # A cancelled request, or one never sent for lack of time, says nothing about
+        # the API, so leaves the circuit as is
+
+    @staticmethod
+    def trips(error: BaseException) -> bool:
+        """Whether a request which failed with error counts against the circuit."""
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        if isinstance(error, DeadlineExceeded):
+            # The API hung until the deadline, as good as a timeout
+            return error.in_flight
+        # Timeouts, network errors and protocol errors
+        return isinstance(error, httpx.TransportError)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+from collections.abc import Awaitable, Callable
+from functools import partial, wraps
+from typing import Any
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+from src.libs.common_query_params import CommonInventoryQueryParams
+from src.libs.deadline import (
+    DeadlineExceeded,
+    remaining,
+    request_deadline_seconds,
+    set_deadline,
+)
+from src.libs.responses import EncodedResponse
+
+
+class SingleFlight:
+    def __init__(self):
+        """Coalesces concurrent calls which share a key into a single in-flight call.
+
+        The first caller for a key runs the work; every caller arriving while that work
+        is in flight awaits the same result (or exception) instead of starting its own.
+        Once the work completes the key is released, so later callers start fresh.
+
+        The shared work doesn't inherit the first caller's deadline (see
+        src.libs.deadline), but gets a full request_deadline_seconds of its own. Each
+        caller stops waiting at its own deadline instead.
+        """
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    def in_flight(self, key: str) -> bool:
+        """Is there work currently in flight for key?"""
+        task = self._in_flight.get(key)
+        return task is not None and not task.done()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn, or join the in-flight run of fn for the same key.
+
+        Args:
+            key (str): Identifies calls which are interchangeable with each other.
+            fn (Callable): A zero argument coroutine function doing the work.
+
+        Raises:
+            DeadlineExceeded: The caller's deadline passed before the work finished.
+
+        Returns:
+            Any: The value returned by the single in-flight call of fn.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._in_flight.get(key)
+
+        if task is None or task.done() or task.get_loop() is not loop:
+            context = contextvars.copy_context()
+            context.run(set_deadline, request_deadline_seconds)
+            task = loop.create_task(fn(), context=context)
+            self._in_flight[key] = task
+            task.add_done_callback(partial(self._release, key))
+
+        # Shield the shared work so one caller disconnecting, or reaching its deadline,
+        # does not cancel the upstream fetch every other caller is waiting on.
+        budget = remaining()
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), budget)
+        except TimeoutError:
+            if budget is None or task.done():
+                raise
+            raise DeadlineExceeded(f"Still waiting on {key} at the deadline.") from None
+
+    def _release(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+        # Mark any exception as retrieved, in case every caller went away before the
+        # work finished.
+        if not task.cancelled():
+            task.exception()
+
+
+inventory_flights = SingleFlight()
+
+
+def request_key(manufacturer: str, endpoint_kwargs: dict) -> str:
+    """Build a key identifying an API request by manufacturer and query parameters.
+
+    When the endpoint takes CommonInventoryQueryParams, its validated values are used
+    (e.g. the zero padded zip code), so "501" and "00501" produce the same key. Any
+    other query parameters (e.g. Audi's geo) are included as sent.
+
+    Args:
+        manufacturer (str): The manufacturer, e.g. "hyundai".
+        endpoint_kwargs (dict): The keyword arguments FastAPI passed to the endpoint.
+
+    Returns:
+        str: A key such as "hyundai?model=Ioniq+5&radius=100&year=2025&zip=90210".
+    """
+    req = None
+    common_params = None
+    for value in endpoint_kwargs.values():
+        if isinstance(value, Request):
+            req = value
+        elif isinstance(value, CommonInventoryQueryParams):
+            common_params = value
+
+    params = dict(req.query_params) if req is not None else {}
+    if common_params is not None:
+        params.update(
+            zip=common_params.zip,
+            year=common_params.year,
+            radius=common_params.radius,
+            model=common_params.model,
+        )
+
+    return f"{manufacturer}?{urlencode(sorted(params.items()))}"
+
+
+def endpoint_request(endpoint_kwargs: dict) -> Request | None:
+    """Return the request among an endpoint's keyword arguments, if any."""
+    for value in endpoint_kwargs.values():
+        if isinstance(value, Request):
+            return value
+    return None
+
+
+def request_accept_encoding(endpoint_kwargs: dict) -> str:
+    """Return the Accept-Encoding header of the request among an endpoint's keyword
+    arguments, or "" if there is none.
+    """
+    req = endpoint_request(endpoint_kwargs)
+    return req.headers.get("Accept-Encoding", "") if req is not None else ""
+
+
+def clone_response(response: Any, accept_encoding: str = "") -> Any:
+    """Return an independent copy of a rendered Response.
+
+    Middleware (e.g. CORS and compression) edits the headers of the response it sends in
+    place, so a Response object must never be sent to more than one caller. An
+    EncodedResponse is sent in the coding accept_encoding prefers, as the callers
+    sharing it may accept different codings.
+    """
+    if isinstance(response, EncodedResponse):
+        return response.negotiate(accept_encoding)
+    if not isinstance(response, Response):
+        return response
+
+    clone = Response(content=response.body, status_code=response.status_code)
+    clone.raw_headers = list(response.raw_headers)
+    return clone
+
+
+def coalesce_requests(manufacturer: str):
+    """Decorator for FastAPI endpoints which coalesces concurrent identical requests.
+
+    Requests for the same manufacturer with the same query parameters which arrive
+    while an earlier one is still fetching from the manufacturer share its result,
+    rather than each fanning out their own upstream calls.
+
+    Args:
+        manufacturer (str): The manufacturer served by the decorated endpoint.
+    """
+
+    def decorator(endpoint):
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            key = request_key(manufacturer, kwargs)
+            response = await inventory_flights.do(
+                key, partial(endpoint, *args, **kwargs)
+            )
+            return clone_response(response, request_accept_encoding(kwargs))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,269 @@
+import asyncio
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Brotli and zstd compress inventory JSON to around half the size of gzip. brotli is
+# a project dependency and zstd comes from the compression.zstd module (Python 3.14+)
+# or the zstandard package. The imports stay guarded so a stripped down install
+# still serves gzip.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content codings which responses are compressed with, most preferred first
+supported_encodings: tuple[str, ...] = tuple(
+    encoding
+    for encoding, available in (
+        ("br", brotli is not None),
+        ("zstd", zstd is not None or zstandard is not None),
+        ("gzip", True),
+    )
+    if available
+)
+
+# Bodies smaller than this are not worth compressing
+compress_min_bytes = 1000
+
+# Bodies of at least this many bytes are compressed on a worker thread rather than on
+# the event loop
+compress_offload_bytes = 128 * 1024
+
+# Compression levels by content coding. The defaults favour speed, as most responses
+# are compressed once per request.
+compression_levels = {"gzip": 6, "br": 4, "zstd": 3}
+
+# Compression levels for the routes under each path prefix, overriding
+# compression_levels. Inventory and VIN responses are cached, and compressed once per
+# cache entry rather than per request, so are worth compressing harder.
+route_compression_levels: dict[str, dict[str, int]] = {
+    "/api/inventory/": {"br": 7, "zstd": 6},
+    "/api/vin/": {"br": 7, "zstd": 6},
+}
+
+
+def levels_for(path: str) -> dict[str, int]:
+    """Return the compression levels for the route at path.
+
+    Args:
+        path (str): The request path, e.g. "/api/inventory/bmw".
+
+    Returns:
+        dict[str, int]: The compression level by content coding.
+    """
+    levels = dict(compression_levels)
+    for prefix, overrides in route_compression_levels.items():
+        if path.startswith(prefix):
+            levels.update(overrides)
+    return levels
+
+
+def compress(body: bytes, encoding: str, level: int | None = None) -> bytes:
+    """Compress body with a content coding in supported_encodings.
+
+    Args:
+        body (bytes): The response body.
+        encoding (str): The content coding, "br", "zstd" or "gzip".
+        level (int | None, optional): The compression level. Defaults to None, for
+        the level in compression_levels.
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if level is None:
+        level = compression_levels[encoding]
+
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    if encoding == "zstd":
+        if zstd is not None:
+            return zstd.compress(body, level=level)
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    """Reverse compress()."""
+    if encoding == "br":
+        return brotli.decompress(body)
+    if encoding == "zstd":
+        if zstd is not None:
+            return zstd.decompress(body)
+        return zstandard.ZstdDecompressor().decompress(body)
+    return gzip.decompress(body)
+
+
+def compress_all(body: bytes, levels: dict[str, int] | None = None) -> dict[str, bytes]:
+    """Compress body with every coding in supported_encodings.
+
+    Args:
+        body (bytes): The response body.
+        levels (dict[str, int] | None, optional): The compression level by content
+        coding. Defaults to None, for compression_levels.
+
+    Returns:
+        dict[str, bytes]: The compressed body by content coding, or an empty dict if
+        body is smaller than compress_min_bytes.
+    """
+    if len(body) < compress_min_bytes:
+        return {}
+    levels = levels or compression_levels
+    return {e: compress(body, e, levels.get(e)) for e in supported_encodings}
+
+
+async def compress_all_off_loop(
+    body: bytes, levels: dict[str, int] | None = None
+) -> dict[str, bytes]:
+    """compress_all(), on a worker thread if body is compress_offload_bytes or more"""
+    if len(body) >= compress_offload_bytes:
+        return await asyncio.to_thread(compress_all, body, levels)
+    return compress_all(body, levels)
+
+
+def encoding_weights(accept_encoding: str) -> dict[str, float]:
+    """Parse an Accept-Encoding header into the q-value of each content coding it
+    lists. Codings without a q-value, or with one which doesn't parse, get 1.
+
+    Args:
+        accept_encoding (str): The Accept-Encoding header, e.g. "gzip, br;q=0.9".
+
+    Returns:
+        dict[str, float]: The q-value by content coding, e.g. {"gzip": 1.0, "br": 0.9}.
+    """
+    weights = {}
+    for coding in accept_encoding.lower().split(","):
+        name, *params = (part.strip() for part in coding.split(";"))
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = min(1.0, max(0.0, float(value)))
+                except ValueError:
+                    pass
+        weights[name] = quality
+    return weights
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    """Parse an Accept-Encoding header into the set of content codings the client
+    accepts, leaving out any refused with q=0.
+
+    Args:
+        accept_encoding (str): The Accept-Encoding header, e.g. "gzip, br;q=0.9".
+
+    Returns:
+        set[str]: The accepted content codings, e.g. {"gzip", "br"}.
+    """
+    return {
+        name
+        for name, quality in encoding_weights(accept_encoding).items()
+        if quality > 0
+    }
+
+
+def preferred_encoding(accept_encoding: str, available) -> str:
+    """Choose the content coding to send a response body in: the one with the highest
+    q-value, with ties going to the first in supported_encodings. Codings the header
+    doesn't list get the q-value of "*", if it has one, and codings with q=0 are never
+    chosen.
+
+    Args:
+        accept_encoding (str): The request's Accept-Encoding header.
+        available (Iterable[str]): The content codings the body is available in.
+
+    Returns:
+        str: The most preferred coding in both, or "identity" for none.
+    """
+    weights = encoding_weights(accept_encoding)
+    default = weights.get("*", 0.0)
+    best, best_quality = "identity", 0.0
+    for encoding in supported_encodings:
+        if encoding not in available:
+            continue
+        quality = weights.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = compress_min_bytes):
+        """Compresses JSON and text responses with brotli, zstd or gzip, whichever
+        the client prefers of those in supported_encodings, at the levels for the
+        route (see levels_for()). Large bodies are compressed on a worker thread.
+
+        Responses which already have a Content-Encoding, such as cached responses
+        (see src.libs.cache), are sent as they are.
+
+        Args:
+            app (ASGIApp): The application to compress the responses of.
+            minimum_size (int, optional): Bodies smaller than this many bytes are sent
+            uncompressed. Defaults to compress_min_bytes.
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = preferred_encoding(
+            Headers(scope=scope).get("Accept-Encoding", ""), supported_encodings
+        )
+        start: Message | None = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Hold the headers until the body shows whether to compress
+                start = message
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            media_type = headers.get("Content-Type", "")
+            if (
+                message.get("more_body")
+                or "Content-Encoding" in headers
+                or len(body) < self.minimum_size
+                or not media_type.startswith(("application/json", "text/"))
+            ):
+                await send(start)
+                start = None
+                await send(message)
+                return
+
+            headers.add_vary_header("Accept-Encoding")
+            if encoding != "identity":
+                level = levels_for(scope["path"]).get(encoding)
+                if len(body) >= compress_offload_bytes:
+                    body = await asyncio.to_thread(compress, body, encoding, level)
+                else:
+                    body = compress(body, encoding, level)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+
+            await send(start)
+            start = None
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,108 @@
+import asyncio
+import os
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.libs.responses import FastJSONResponse
+
+# How long, in seconds, the API has to answer a request, across every manufacturer
+# API request made for it. Kept under the frontend's own timeout, so the user sees a
+# timeout error from us rather than a hung search.
+request_deadline_seconds = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "25"))
+
+# The event loop time by which the current request must be answered, if any
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+# How long, in seconds, DeadlineMiddleware waits past a request's deadline before
+# cancelling it. Manufacturer API requests are cut off at the deadline itself, so they
+# fail with DeadlineExceeded, and count against the API's circuit breaker, rather than
+# being cancelled along with the endpoint.
+deadline_grace_seconds = 0.1
+
+deadline_error_message = "The search took too long to complete."
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self, error_data: str, in_flight: bool = False):
+        """Raised in place of a manufacturer API request made once the request's
+        deadline has passed. A HTTPException, so an endpoint which doesn't handle it
+        fails with a 504 in the same shape as error_response().
+
+        in_flight is True when the deadline cut off a request the manufacturer API
+        was still answering, rather than one which was never sent. Only those count
+        against the API's circuit breaker (see src.libs.circuit).
+        """
+        super().__init__(
+            status_code=504,
+            detail={"errorMessage": deadline_error_message, "errorData": error_data},
+        )
+        self.in_flight = in_flight
+
+
+def set_deadline(seconds: float) -> float:
+    """Set the deadline for the current request, and any tasks it starts, to seconds
+    from now. Returns the deadline as an event loop time.
+    """
+    deadline = asyncio.get_running_loop().time() + seconds
+    _deadline.set(deadline)
+    return deadline
+
+
+def remaining() -> float | None:
+    """Return the seconds left until the current request's deadline, or None if the
+    request has no deadline. Past the deadline the value is zero or negative.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+class DeadlineMiddleware:
+    def __init__(self, app: ASGIApp, seconds: float = request_deadline_seconds):
+        """Gives each request a deadline, seconds from when it arrives. Manufacturer
+        API requests made for it are limited to the time remaining (see
+        src.libs.http.AsyncHTTPClient), and shortly after the deadline passes (see
+        deadline_grace_seconds) the endpoint and every request it is waiting on is
+        cancelled and a 504 sent.
+
+        Args:
+            app (ASGIApp): The application to apply deadlines to.
+            seconds (float, optional): How long each request may take, in seconds.
+            Defaults to request_deadline_seconds.
+        """
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = False
+
+        async def send_started(message) -> None:
+            nonlocal started
+            started = True
+            await send(message)
+
+        deadline = set_deadline(self.seconds)
+        try:
+            async with asyncio.timeout_at(deadline + deadline_grace_seconds):
+                await self.app(scope, receive, send_started)
+        except TimeoutError:
+            if started:
+                raise
+            print(f"Deadline exceeded for {scope['path']}")
+            response = FastJSONResponse(
+                {
+                    "detail": {
+                        "errorMessage": deadline_error_message,
+                        "errorData": f"No response within {self.seconds:g} seconds.",
+                    }
+                },
+                status_code=504,
+            )
+            await response(scope, receive, send)
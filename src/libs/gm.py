@@ -0,0 +1,203 @@
+import asyncio
+
+import httpx
+from fastapi import HTTPException
+
+from src.libs.http import AsyncHTTPClient
+from src.libs.http_pool import client_registry
+from src.libs.pagination import CursorPaginator
+from src.libs.responses import error_response
+from src.libs.retry import RetryPolicy
+
+# The Chevrolet, GMC and Cadillac inventory sites are all served by GM's discovery
+# API, under each brand's own base URL.
+search_uri = "/aec-cp-discovery-api/p/v1/vehicles/search"
+facets_uri = "/aec-cp-discovery-api/p/v1/vehicles/facets"
+
+# Connection pool limits for each GM brand's base URL. Every inventory search fans
+# out to a facets request and several search pages at once.
+gm_pool_limits = httpx.Limits(max_connections=20, max_keepalive_connections=20)
+
+# Keys of each search hit which the frontend never reads. They are dropped before the
+# response is cached and sent.
+unused_hit_keys = frozenset({"disclaimers", "legalText"})
+
+
+def discovery_headers(program_id: str, user_agent: str | None, referer: str) -> dict:
+    """Build the HTTP headers the GM discovery API requires.
+
+    Args:
+        program_id (str): The GM brand, e.g. "CHEVROLET", "GMC" or "CADILLAC".
+        user_agent (str | None): The User-Agent of the requesting browser.
+        referer (str): The brand inventory page to send as the Referer.
+
+    Returns:
+        dict: HTTP headers for discovery API requests.
+    """
+    return {
+        "User-Agent": user_agent,
+        "Referer": referer,
+        "client": "T1_VSR",
+        "tenantId": "0",
+        "dealerId": "0",
+        "oemId": "GM",
+        "programId": program_id,
+    }
+
+
+def slim_hit(hit: dict) -> dict:
+    """Drop the keys in unused_hit_keys from a search hit"""
+    return {k: v for k, v in hit.items() if k not in unused_hit_keys}
+
+
+async def fetch_facets(http, headers: dict, post_data: dict) -> dict | None:
+    """Fetch the facets (vehicle detail such as trims and colors) for a search. The
+    facets are supplementary, so a failure returns None rather than failing the search.
+    """
+    try:
+        f = await http.post(uri=facets_uri, headers=headers, post_data=post_data)
+        return await http.decode(f)
+    except HTTPException, AttributeError, ValueError:
+        return None
+
+
+async def search_with_facets(
+    http, headers: dict, search_post_data: dict, facets_post_data: dict
+) -> tuple[dict, dict | None]:
+    """Run an inventory search, fetching every page of results, with the facets
+    request for the same search in flight at the same time.
+
+    Args:
+        http (AsyncHTTPClient): The HTTP client for the brand's discovery API.
+        headers (dict): HTTP headers, see discovery_headers().
+        search_post_data (dict): The vehicles/search POST body.
+        facets_post_data (dict): The vehicles/facets POST body.
+
+    Raises:
+        ValueError: The search response was not JSON. The message is the response body.
+
+    Returns:
+        tuple[dict, dict | None]: The search response, with the hits from every page,
+        and the facets response.
+    """
+    facets_task = asyncio.create_task(fetch_facets(http, headers, facets_post_data))
+
+    try:
+        i = await http.post(uri=search_uri, headers=headers, post_data=search_post_data)
+        try:
+            inventory = await http.decode(i)
+        except ValueError:
+            raise ValueError(i.text)
+
+        # Results beyond the first page are fetched while facets is still in flight
+        paginator = CursorPaginator(
+            http=http, uri=search_uri, headers=headers, post_data=search_post_data
+        )
+        remaining = await paginator.fetch_remaining(inventory)
+        if remaining:
+            inventory["data"]["hits"].extend(remaining)
+    except BaseException:
+        facets_task.cancel()
+        raise
+
+    return inventory, await facets_task
+
+
+class GMInventory:
+    def __init__(
+        self,
+        program_id: str,
+        base_url: str,
+        error_message: str,
+        page_size: int = 100,
+        limits: httpx.Limits = gm_pool_limits,
+    ):
+        """Inventory search for a GM brand through the GM discovery API.
+
+        Handles the request headers and bodies, fetching the facets concurrently
+        with every page of the search, detecting the API's not found response and
+        slimming the returned hits, so each GM router only supplies its filters.
+
+        Args:
+            program_id (str): The GM brand, e.g. "CHEVROLET", "GMC" or "CADILLAC".
+            base_url (str): The brand's shopping API base URL.
+            error_message (str): The error message returned when the search fails.
+            page_size (int, optional): The page size to request. The API caps the size
+            it actually returns. Defaults to 100.
+            limits (httpx.Limits, optional): Connection pool limits for base_url.
+            Defaults to gm_pool_limits.
+        """
+        self.program_id = program_id
+        self.base_url = base_url
+        self.error_message = error_message
+        self.page_size = page_size
+        # Discovery API searches are POSTs which change nothing, so are safe to retry
+        client_registry.configure(
+            base_url, limits=limits, retry_policy=RetryPolicy(methods=("get", "post"))
+        )
+
+    def search_post_data(self, filters: dict) -> dict:
+        return {
+            "filters": filters,
+            "sort": {"name": "distance", "order": "ASC"},
+            "paymentTypes": ["CASH"],
+            "pagination": {"size": self.page_size},
+        }
+
+    def facets_post_data(self, filters: dict | None) -> dict:
+        return {"filters": filters} if filters else {}
+
+    async def search(
+        self,
+        user_agent: str | None,
+        referer: str,
+        filters: dict,
+        facets_filters: dict | None = None,
+        verify: bool = True,
+    ) -> dict:
+        """Search the brand's inventory.
+
+        Args:
+            user_agent (str | None): The User-Agent of the requesting browser.
+            referer (str): The brand inventory page to send as the Referer.
+            filters (dict): The search filters, e.g. model, year and geo.
+            facets_filters (dict | None, optional): The facets filters. Defaults to
+            None, fetching the facets unfiltered.
+            verify (bool, optional): Whether to verify SSL certificates. Defaults to
+            True.
+
+        Raises:
+            HTTPException: The search failed, via error_response().
+
+        Returns:
+            dict: The search response with every page of hits and the facets, or an
+            empty dict if no vehicles were found.
+        """
+        headers = discovery_headers(self.program_id, user_agent, referer)
+
+        async with AsyncHTTPClient(
+            base_url=self.base_url, timeout_value=30.0, verify=verify
+        ) as http:
+            try:
+                inventory, facets = await search_with_facets(
+                    http,
+                    headers,
+                    self.search_post_data(filters),
+                    self.facets_post_data(facets_filters),
+                )
+            except ValueError as e:
+                return error_response(error_message=f"{self.error_message}: {e}")
+
+        hits = (inventory.get("data") or {}).get("hits")
+        if hits is None:
+            # The API returns an errorDetails.key, e.g. inventory.notFound, when no
+            # vehicles match the search
+            if (inventory.get("errorDetails") or {}).get("key"):
+                return {}
+            return error_response(
+                error_message=self.error_message, error_data=inventory, status_code=500
+            )
+
+        inventory["data"]["hits"] = [slim_hit(hit) for hit in hits]
+        inventory["facets"] = facets
+        return inventory
@@ -0,0 +1,211 @@
+import hashlib
+import json
+
+import httpx
+from fastapi import HTTPException
+
+from src.libs.circuit import CircuitOpenError
+from src.libs.deadline import DeadlineExceeded
+from src.libs.jsonlib import dumps, loads
+
+# Whether a GraphQL API accepts persisted (hashed) queries, keyed by base URL. Learned
+# at runtime by post_operation() and kept for the life of the process.
+persisted_query_support: dict[str, bool] = {}
+
+# Consecutive persisted queries a GraphQL API has answered with errors other than the
+# Apollo ones, keyed by base URL. After persisted_query_max_errors of them the API is
+# taken not to accept persisted queries.
+persisted_query_errors: dict[str, int] = {}
+persisted_query_max_errors = 3
+
+
+def query_template(query: str) -> bytes:
+    """Serialize a query document holding %(name)s placeholders as a JSON POST body,
+    for APIs which take their arguments inline rather than as variables. Fill in the
+    placeholders per request with fill_query_template().
+    """
+    return dumps({"query": query})
+
+
+def fill_query_template(template: bytes, **values: str | int) -> bytes:
+    """Substitute values into a query_template() body. Strings are inserted as GraphQL
+    string literals and numbers as they are, escaped for the JSON body.
+    """
+    return template % {name.encode(): _literal(value) for name, value in values.items()}
+
+
+def _literal(value: str | int) -> bytes:
+    literal = json.dumps(value) if type(value) is str else str(int(value))
+    return json.dumps(literal)[1:-1].encode()
+
+
+class GraphQLOperation:
+    def __init__(self, query: str, operation_name: str | None = None):
+        """A GraphQL query document, built once at import.
+
+        The part of each request body which never changes (the operation name and
+        the query, or in persisted mode the query's hash) is serialized to bytes up
+        front, so building a request body only serializes its variables.
+
+        Args:
+            query (str): The GraphQL query document.
+            operation_name (str | None, optional): The operation to run. Defaults to
+            None.
+        """
+        self.query = query
+        self.operation_name = operation_name
+        self.sha256_hash = hashlib.sha256(query.encode()).hexdigest()
+
+        head = {"operationName": operation_name} if operation_name else {}
+        persisted_query = {"version": 1, "sha256Hash": self.sha256_hash}
+        extensions = {"persistedQuery": persisted_query}
+        self._prefix = dumps({**head, "query": query})[:-1] + b',"variables":'
+        self._persisted_prefix = (
+            dumps({**head, "extensions": extensions})[:-1] + b',"variables":'
+        )
+        self._register_prefix = (
+            dumps({**head, "query": query, "extensions": extensions})[:-1]
+            + b',"variables":'
+        )
+
+    def body(
+        self,
+        variables: dict | None = None,
+        persisted: bool = False,
+        register: bool = False,
+    ) -> bytes:
+        """Return the JSON POST body for this operation.
+
+        Args:
+            variables (dict | None, optional): The operation variables. Defaults to
+            None.
+            persisted (bool, optional): Send the query's sha256 hash in place of the
+            query, as an Apollo automatic persisted query. Defaults to False.
+            register (bool, optional): Send both the query and its sha256 hash, which
+            registers the hash with an Apollo server for later persisted queries.
+            Defaults to False.
+
+        Returns:
+            bytes: The serialized POST body.
+        """
+        if register:
+            prefix = self._register_prefix
+        elif persisted:
+            prefix = self._persisted_prefix
+        else:
+            prefix = self._prefix
+        return prefix + dumps(variables) + b"}"
+
+
+async def post_operation(
+    http,
+    uri: str,
+    headers: dict,
+    operation: GraphQLOperation,
+    variables: dict | None = None,
+    persisted: bool = False,
+    batch: bool = False,
+) -> httpx.Response:
+    """POST a GraphQL operation.
+
+    In persisted mode only the query's hash is sent. If the API has not seen the query
+    before, it's sent again in full alongside the hash, which registers it for later
+    requests. If the API does not accept persisted queries at all, that's remembered
+    per base URL in persisted_query_support and later requests send the full query
+    straight away. An API is taken not to accept them when it answers that it doesn't,
+    rejects the hashed request with a 4xx status, or answers persisted_query_max_errors
+    hashed requests in a row with other errors. A 5xx status or a network error falls
+    back to the full query for this request only.
+
+    Args:
+        http (AsyncHTTPClient): The HTTP client for the GraphQL API.
+        uri (str): The GraphQL URI to POST to.
+        headers (dict): HTTP headers to include with the request.
+        operation (GraphQLOperation): The operation to run.
+        variables (dict | None, optional): The operation variables. Defaults to None.
+        persisted (bool, optional): Try sending the query as a persisted query.
+        Defaults to False.
+        batch (bool, optional): Send the operation as a batch of one, for APIs which
+        expect a JSON array. Defaults to False.
+
+    Returns:
+        httpx.Response: The HTTP response to the operation.
+    """
+    register = False
+    if persisted and persisted_query_support.get(http.base_url, True):
+        try:
+            response = await http.post(
+                uri=uri,
+                headers=headers,
+                post_data=_batch(operation.body(variables, persisted=True), batch),
+            )
+        except CircuitOpenError, DeadlineExceeded:
+            # The API is down or the request is out of time, which says nothing about
+            # persisted query support
+            raise
+        except HTTPException as e:
+            # An API which rejects a request without a query outright doesn't accept
+            # persisted queries. A transient failure says nothing about them, so just
+            # this request is sent again with the full query.
+            if _rejected(e):
+                persisted_query_support[http.base_url] = False
+        else:
+            error = _persisted_query_error(response)
+            if error is None:
+                persisted_query_support[http.base_url] = True
+                persisted_query_errors.pop(http.base_url, None)
+                return response
+            if error == "error":
+                errors = persisted_query_errors.get(http.base_url, 0) + 1
+                persisted_query_errors[http.base_url] = errors
+                if errors >= persisted_query_max_errors:
+                    persisted_query_support[http.base_url] = False
+            if error == "PersistedQueryNotSupported":
+                persisted_query_support[http.base_url] = False
+            register = error == "PersistedQueryNotFound"
+
+    return await http.post(
+        uri=uri,
+        headers=headers,
+        post_data=_batch(operation.body(variables, register=register), batch),
+    )
+
+
+def _batch(body: bytes, batch: bool) -> bytes:
+    return b"[" + body + b"]" if batch else body
+
+
+def _rejected(error: HTTPException) -> bool:
+    """Whether the HTTPException raised for a request (see
+    src.libs.http.AsyncHTTPClient.fetch_api_data) was a 4xx response from the API,
+    other than a timeout or rate limit.
+    """
+    cause = error.__cause__ or error.__context__
+    if not isinstance(cause, httpx.HTTPStatusError):
+        return False
+    status_code = cause.response.status_code
+    return 400 <= status_code < 500 and status_code not in (408, 429)
+
+
+def _persisted_query_error(response: httpx.Response) -> str | None:
+    """Return why the API answered a persisted query with errors in place of data:
+    "PersistedQueryNotFound" for a query it has not seen, "PersistedQueryNotSupported"
+    if it does not accept persisted queries, or "error" for any other error. Returns
+    None if the API answered with data.
+    """
+    if b'"errors"' not in response.content:
+        return None
+
+    try:
+        result = loads(response.content)
+    except ValueError:
+        return None
+    if type(result) is list:
+        result = result[0] if result else {}
+    if result.get("data") or not result.get("errors"):
+        return None
+
+    for error in ("PersistedQueryNotFound", "PersistedQueryNotSupported"):
+        if error.encode() in response.content:
+            return error
+    return "error"
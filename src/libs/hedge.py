@@ -0,0 +1,83 @@
+import math
+from collections import deque
+
+
+class HedgePolicy:
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        max_hedge_rate: float = 0.05,
+        min_delay: float = 0.1,
+        min_samples: int = 50,
+        window: int = 500,
+        methods: tuple[str, ...] = ("get",),
+    ):
+        """When to hedge a request to a manufacturer API: send a second, identical
+        request once the first has taken longer than most requests to the API do,
+        and use whichever response arrives first.
+
+        The threshold is a percentile of the API's recent response times, so only
+        requests stuck in the tail are hedged. The share of requests hedged is capped
+        by max_hedge_rate, so an API which slows down across the board is not sent
+        twice the traffic.
+
+        Args:
+            percentile (float, optional): The response time percentile after which a
+            request is hedged. Defaults to 0.95.
+            max_hedge_rate (float, optional): The most requests hedged, as a share of
+            all requests. Defaults to 0.05.
+            min_delay (float, optional): The shortest time, in seconds, to wait before
+            hedging. Defaults to 0.1.
+            min_samples (int, optional): How many response times to measure before
+            hedging at all. Defaults to 50.
+            window (int, optional): How many of the most recent response times the
+            percentile is taken over. Defaults to 500.
+            methods (tuple[str, ...], optional): The HTTP methods which are safe to
+            send twice. Defaults to ("get",).
+        """
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.methods = methods
+        self.latencies: deque[float] = deque(maxlen=window)
+
+        # Like src.libs.retry.RetryBudget: each request earns max_hedge_rate of a
+        # hedge, and each hedge spends a whole one.
+        self.balance = 1.0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, latency: float) -> None:
+        """Record the response time, in seconds, of a successful request."""
+        self.latencies.append(latency)
+
+    def delay(self, method: str) -> float | None:
+        """Return how long to wait on a request before hedging it, or None if the
+        request is not to be hedged.
+        """
+        self.requests += 1
+        self.balance = min(1.0, self.balance + self.max_hedge_rate)
+        if method not in self.methods or len(self.latencies) < self.min_samples:
+            return None
+
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        return max(self.min_delay, ordered[index])
+
+    def allow_hedge(self) -> bool:
+        """Take a hedge from the hedge rate cap. Returns False if the cap is reached."""
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        self.hedges += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedgeWins": self.hedge_wins,
+            "samples": len(self.latencies),
+        }
@@ -1,12 +1,23 @@
 import asyncio
+import re
 import time
+import uuid
 from typing import Literal
 
 import httpx
 
+from src.libs.deadline import DeadlineExceeded, remaining
+from src.libs.hedge import HedgePolicy
+from src.libs.http_pool import client_registry
+from src.libs.jsonlib import dumps, loads
 from src.libs.responses import error_response
+from src.libs.retry import retry_budget
 from src.routers.logger import send_error_to_gcp
 
+# Response bodies of at least this many bytes are decoded on a worker thread, so
+# decoding one large inventory response does not stall every other request.
+decode_offload_bytes = 1024 * 1024
+
 
 class AsyncHTTPClient:
     def __init__(
@@ -20,6 +31,10 @@ class AsyncHTTPClient:
         is designed to be called directly or used as a context manager and is async
         compatible.
 
+        Requests are issued through a pooled httpx.AsyncClient shared by every
+        AsyncHTTPClient with the same base_url (see src.libs.http_pool), so open
+        connections to a manufacturer are reused across requests.
+
         Args:
             base_url (str): A URL to use as the base when building request URLs.
             timeout_value (float): How long to wait for an HTTP response. Accepts float
@@ -33,13 +48,12 @@ class AsyncHTTPClient:
         self.timeout_value = timeout_value
         self.verify = verify
 
-        timeouts = httpx.Timeout(10.0, read=self.timeout_value)
+        # The pooled client is shared across routers, so the read timeout is applied
+        # per request rather than on the client itself.
+        self.timeouts = httpx.Timeout(10.0, read=self.timeout_value)
 
-        self.client = httpx.AsyncClient(
-            http2=use_http2,
-            base_url=base_url,
-            timeout=timeouts,
-            verify=verify,
+        self.client = client_registry.get_client(
+            base_url=base_url, use_http2=use_http2, verify=verify
         )
 
         self.start_time = time.perf_counter()
@@ -50,10 +64,34 @@ class AsyncHTTPClient:
     async def __aexit__(self, exception_type, exception_value, traceback):
         end_time = time.perf_counter()
         print(f"{end_time - self.start_time} sec - {self.base_url}")
-        await self.client.aclose()
 
     async def close(self):
-        await self.client.aclose()
+        """Release this helper. The pooled client and its connections stay open for
+        reuse by later requests, and are closed on application shutdown.
+        """
+
+    async def decode(self, response: httpx.Response, projection=None):
+        """Decode a JSON response body with the fastest available JSON library (see
+        src.libs.jsonlib). Bodies of decode_offload_bytes or more are decoded on a
+        worker thread rather than on the event loop.
+
+        Args:
+            response (httpx.Response): The HTTP response to decode.
+            projection (VehicleProjection | None, optional): Decode an inventory
+            search response keeping only the vehicle fields the UI renders, see
+            src.libs.projection. Defaults to None, decoding the whole body.
+
+        Raises:
+            ValueError: The response body is not valid JSON.
+
+        Returns:
+            The decoded response body.
+        """
+        decoder = projection.loads if projection is not None else loads
+        content = response.content
+        if len(content) >= decode_offload_bytes:
+            return await asyncio.to_thread(decoder, content)
+        return decoder(content)
 
     async def get(
         self, uri: str | list, headers: dict | None = None, params: dict | None = None
@@ -108,7 +146,7 @@ class AsyncHTTPClient:
         self,
         uri: str | list,
         headers: dict | None = None,
-        post_data: dict | None = None,
+        post_data: dict | bytes | None = None,
     ) -> list | httpx.Response:
         """Wrap the asyncio coroutine into a Task and schedule its execution.
 
@@ -119,8 +157,9 @@ class AsyncHTTPClient:
             headers (dict | None, optional): HTTP headers to include with this request.
             Defaults to None.
 
-            post_data (dict | None, optional): HTTP POST data to include with this request.
-            Defaults to None.
+            post_data (dict | bytes | None, optional): HTTP POST data to include with
+            this request. A dict is serialized as JSON; bytes are sent as is, as an
+            already serialized JSON body. Defaults to None.
 
         Returns:
             (list | httpx.Response): The result of an asyncio Task object.
@@ -210,7 +249,7 @@ class AsyncHTTPClient:
         self,
         uri: str,
         headers: dict,
-        params: dict | None = None,
+        params: dict | bytes | None = None,
         method: Literal["get", "post"] = "get",
     ) -> dict:
         """Helper function to issue API requests through HTTPX
@@ -220,8 +259,8 @@ class AsyncHTTPClient:
 
             headers (dict): HTTP headers to include with this request.
 
-            params (dict | None, optional): HTTP query parameters or an HTTP POST body
-            to include with this request.
+            params (dict | bytes | None, optional): HTTP query parameters or an HTTP
+            POST body to include with this request.
             Defaults to None
 
             method (str): Which HTTP method to use for this request. get and post are accepted.
@@ -233,11 +272,7 @@ class AsyncHTTPClient:
         error_message = "An error occurred obtaining vehicle inventory for this search."
 
         try:
-            if method == "get":
-                resp = await self.client.get(url=uri, headers=headers, params=params)
-            elif method == "post":
-                resp = await self.client.post(url=uri, headers=headers, json=params)
-            resp.raise_for_status()
+            resp = await self.send_through_circuit(uri, headers, params, method)
 
         except (httpx.TimeoutException, httpx.ReadTimeout) as e:
             error_data = f"The request to {e.request.url!r} timed out."
@@ -335,3 +370,250 @@ class AsyncHTTPClient:
 
         else:
             return resp
+
+    async def send_through_circuit(
+        self,
+        uri: str,
+        headers: dict,
+        params: dict | bytes | None,
+        method: Literal["get", "post"],
+    ) -> httpx.Response:
+        """Issue a request through the circuit breaker for this base_url (see
+        src.libs.circuit), failing at once while the manufacturer API is down.
+
+        Raises:
+            CircuitOpenError: The circuit for this base_url is open.
+            httpx.HTTPError: The request failed, see send_with_retries().
+
+        Returns:
+            httpx.Response: The successful response.
+        """
+        breaker = client_registry.circuit_breaker_for(self.base_url)
+        trial = breaker.before_request()
+        try:
+            resp = await self.send_with_retries(uri, headers, params, method)
+        except BaseException as e:
+            breaker.after_request(e, trial)
+            raise
+        breaker.after_request(None, trial)
+        return resp
+
+    async def send_with_retries(
+        self,
+        uri: str,
+        headers: dict,
+        params: dict | bytes | None,
+        method: Literal["get", "post"],
+    ) -> httpx.Response:
+        """Issue a request, retrying transient failures per the retry policy for this
+        base_url (see src.libs.retry), as far as the process-wide retry budget and the
+        request's deadline allow.
+
+        Raises:
+            httpx.HTTPError: The last attempt failed, or the failure was not one to
+            retry.
+
+        Returns:
+            httpx.Response: The successful response.
+        """
+        policy = client_registry.retry_policy_for(self.base_url)
+        hedge_policy = client_registry.hedge_policy_for(self.base_url)
+        retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            try:
+                if hedge_policy is not None:
+                    return await self.send_hedged(
+                        uri, headers, params, method, hedge_policy
+                    )
+                return await self.send(uri, headers, params, method)
+            except httpx.HTTPError as e:
+                attempt += 1
+                delay = policy.delay(attempt - 1)
+                budget = remaining()
+                if (
+                    attempt >= policy.max_attempts
+                    or not policy.retryable(method, e)
+                    or (budget is not None and delay >= budget)
+                    or not retry_budget.withdraw()
+                ):
+                    raise
+                print(f"Retrying {method.upper()} {self.base_url}{uri}: {e!r}")
+                await asyncio.sleep(delay)
+
+    async def send_hedged(
+        self,
+        uri: str,
+        headers: dict,
+        params: dict | bytes | None,
+        method: Literal["get", "post"],
+        policy: HedgePolicy,
+    ) -> httpx.Response:
+        """Issue a request and, if it is still outstanding after the hedge delay for
+        this base_url (see src.libs.hedge), issue a duplicate, returning whichever
+        succeeds first and cancelling the other.
+
+        Raises:
+            httpx.HTTPError: Every request issued failed.
+
+        Returns:
+            httpx.Response: The first successful response.
+        """
+        delay = policy.delay(method)
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(self.send(uri, headers, params, method))
+        pending = {primary}
+        try:
+            if delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if not done and policy.allow_hedge():
+                    print(f"Hedging {method.upper()} {self.base_url}{uri}")
+                    hedge_started = time.perf_counter()
+                    hedge = asyncio.ensure_future(
+                        self.send(uri, headers, params, method)
+                    )
+                    pending = {primary, hedge}
+                else:
+                    pending = {primary}
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is primary:
+                        policy.record(time.perf_counter() - started)
+                    else:
+                        policy.record(time.perf_counter() - hedge_started)
+                        policy.hedge_wins += 1
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def send(
+        self,
+        uri: str,
+        headers: dict,
+        params: dict | bytes | None,
+        method: Literal["get", "post"],
+    ) -> httpx.Response:
+        """Issue a single request, raising httpx.HTTPStatusError for error statuses.
+        Waits for the request limiter for this base_url (see src.libs.ratelimit).
+
+        When the incoming request has a deadline (see src.libs.deadline), the
+        request, including any wait for the limiter, is given only the time remaining
+        and is cancelled when the deadline passes.
+
+        Raises:
+            DeadlineExceeded: The deadline passed before the request completed.
+        """
+        budget = remaining()
+        if budget is None:
+            timeouts = self.timeouts
+        elif budget <= 0:
+            raise DeadlineExceeded(f"No time was left to request {self.base_url}{uri}.")
+        else:
+            timeouts = httpx.Timeout(
+                min(10.0, budget), read=min(self.timeout_value, budget)
+            )
+
+        sent = False
+        try:
+            async with asyncio.timeout(budget):
+                async with client_registry.limiter_for(self.base_url):
+                    sent = True
+                    resp = await self._request(uri, headers, params, method, timeouts)
+        except TimeoutError as e:
+            # A request cut off while the API was answering counts against its
+            # circuit breaker, one still waiting on the limiter doesn't
+            raise DeadlineExceeded(
+                f"The request to {self.base_url}{uri} ran past the deadline.",
+                in_flight=sent,
+            ) from e
+        resp.raise_for_status()
+        return resp
+
+    async def _request(
+        self,
+        uri: str,
+        headers: dict,
+        params: dict | bytes | None,
+        method: Literal["get", "post"],
+        timeouts: httpx.Timeout,
+    ) -> httpx.Response:
+        if method == "get":
+            resp = await self.client.get(
+                url=uri, headers=headers, params=params, timeout=timeouts
+            )
+        elif type(params) is bytes:
+            resp = await self.client.post(
+                url=uri,
+                headers={"Content-Type": "application/json", **(headers or {})},
+                content=params,
+                timeout=timeouts,
+            )
+        else:
+            resp = await self.client.post(
+                url=uri, headers=headers, json=params, timeout=timeouts
+            )
+        return resp
+
+
+class BodyTemplate:
+    def __init__(self, body: dict, **slots: tuple[str, ...]):
+        """A JSON request body serialized once, with slots for the fields which vary
+        between requests, such as a page number, offset or cursor token. Rendering the
+        template serializes just the slot values and splices them into the cached
+        encoding, rather than encoding the whole body again for every page.
+
+        Args:
+            body (dict): The request body. The values at the slot paths are replaced.
+            **slots (tuple[str, ...]): The path of keys to each varying field, by slot
+            name, e.g. page=("page",) or paging=("searchParameter", "paging").
+        """
+        marker = uuid.uuid4().hex
+        for name, path in slots.items():
+            body = _replace_path(body, path, f"{marker}:{name}")
+
+        encoded = dumps(body)
+        self.segments = []
+        self.names = []
+        position = 0
+        for slot in re.finditer(rb'"%s:(\w+)"' % marker.encode(), encoded):
+            self.segments.append(encoded[position : slot.start()])
+            self.names.append(slot.group(1).decode())
+            position = slot.end()
+        self.segments.append(encoded[position:])
+
+    def render(self, **values) -> bytes:
+        """Return the encoded body with the slot values filled in.
+
+        Args:
+            **values: A value for each slot, by slot name.
+
+        Returns:
+            bytes: The encoded JSON body, to pass to AsyncHTTPClient.post().
+        """
+        parts = [self.segments[0]]
+        for name, segment in zip(self.names, self.segments[1:]):
+            parts.append(dumps(values[name]))
+            parts.append(segment)
+        return b"".join(parts)
+
+
+def _replace_path(body: dict, path: tuple[str, ...], value) -> dict:
+    """Return a copy of body with the value at path replaced. Only the dicts on the
+    path are copied.
+    """
+    key, *rest = path
+    return {
+        **body,
+        key: _replace_path(body.get(key) or {}, tuple(rest), value) if rest else value,
+    }
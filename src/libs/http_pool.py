@@ -0,0 +1,182 @@
+import asyncio
+
+import httpx
+
+from src.libs.circuit import CircuitBreaker
+from src.libs.hedge import HedgePolicy
+from src.libs.ratelimit import HostLimiter
+from src.libs.retry import RetryPolicy, default_retry_policy
+
+# Connection pool limits used for any manufacturer which has not been given explicit
+# limits through ClientRegistry.configure().
+default_pool_limits = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=20,
+    keepalive_expiry=30.0,
+)
+
+
+class ClientRegistry:
+    def __init__(self):
+        """A process-wide registry of pooled httpx.AsyncClients, one per manufacturer
+        base URL. Reusing a client across requests reuses its open connections, so
+        the TLS and HTTP/2 handshakes to a manufacturer are paid once per connection
+        rather than once per inventory or VIN request.
+
+        Clients are created lazily the first time a base URL is requested and are
+        closed on application shutdown through aclose().
+        """
+        self._clients: dict[
+            tuple[str, bool, bool],
+            tuple[httpx.AsyncClient, asyncio.AbstractEventLoop | None],
+        ] = {}
+        self._limits: dict[str, httpx.Limits] = {}
+        self._retry_policies: dict[str, RetryPolicy] = {}
+        self._hedge_policies: dict[str, HedgePolicy] = {}
+        self._circuit_breakers: dict[str, CircuitBreaker] = {}
+        self._limiters: dict[str, HostLimiter] = {}
+
+    def configure(
+        self,
+        base_url: str,
+        limits: httpx.Limits | None = None,
+        retry_policy: RetryPolicy | None = None,
+        hedge_policy: HedgePolicy | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        limiter: HostLimiter | None = None,
+    ) -> None:
+        """Set the connection pool limits, retry policy, hedge policy, circuit
+        breaker or request limits for a manufacturer. Must be called before the first
+        request to base_url, typically at router import time.
+
+        Args:
+            base_url (str): The manufacturer base URL these settings apply to.
+            limits (httpx.Limits | None, optional): Connection pool limits for this
+            manufacturer. Defaults to None, leaving the limits unchanged.
+            retry_policy (RetryPolicy | None, optional): When to retry failed requests
+            to this manufacturer. Defaults to None, leaving the policy unchanged.
+            hedge_policy (HedgePolicy | None, optional): When to hedge slow requests
+            to this manufacturer. Requests are only hedged for manufacturers given a
+            policy. Defaults to None, leaving the policy unchanged.
+            circuit_breaker (CircuitBreaker | None, optional): The circuit breaker for
+            this manufacturer. Defaults to None, leaving the circuit breaker unchanged.
+            limiter (HostLimiter | None, optional): The concurrency and rate limits for
+            requests to this manufacturer. Defaults to None, leaving the limits
+            unchanged.
+        """
+        if limits is not None:
+            self._limits[base_url] = limits
+        if retry_policy is not None:
+            self._retry_policies[base_url] = retry_policy
+        if hedge_policy is not None:
+            self._hedge_policies[base_url] = hedge_policy
+        if circuit_breaker is not None:
+            self._circuit_breakers[base_url] = circuit_breaker
+        if limiter is not None:
+            self._limiters[base_url] = limiter
+
+    def limits_for(self, base_url: str) -> httpx.Limits:
+        """Return the connection pool limits configured for base_url."""
+        return self._limits.get(base_url, default_pool_limits)
+
+    def retry_policy_for(self, base_url: str) -> RetryPolicy:
+        """Return the retry policy configured for base_url."""
+        return self._retry_policies.get(base_url, default_retry_policy)
+
+    def hedge_policy_for(self, base_url: str) -> HedgePolicy | None:
+        """Return the hedge policy configured for base_url, if any."""
+        return self._hedge_policies.get(base_url)
+
+    def circuit_breaker_for(self, base_url: str) -> CircuitBreaker:
+        """Return the circuit breaker for base_url, creating one with the default
+        thresholds if none was configured.
+        """
+        breaker = self._circuit_breakers.get(base_url)
+        if breaker is None:
+            breaker = self._circuit_breakers[base_url] = CircuitBreaker(base_url)
+        return breaker
+
+    def circuit_stats(self) -> dict:
+        """Return the circuit state and counters for each manufacturer requested."""
+        return {
+            base_url: breaker.stats()
+            for base_url, breaker in self._circuit_breakers.items()
+        }
+
+    def limiter_for(self, base_url: str) -> HostLimiter:
+        """Return the request limiter for base_url, creating one with the default
+        limits if none was configured.
+        """
+        limiter = self._limiters.get(base_url)
+        if limiter is None:
+            limiter = self._limiters[base_url] = HostLimiter()
+        return limiter
+
+    def limiter_stats(self) -> dict:
+        """Return the request and queue wait counters for each manufacturer."""
+        return {
+            base_url: limiter.stats() for base_url, limiter in self._limiters.items()
+        }
+
+    def hedge_stats(self) -> dict:
+        """Return the hedging stats for each manufacturer with a hedge policy."""
+        return {
+            base_url: policy.stats()
+            for base_url, policy in self._hedge_policies.items()
+        }
+
+    def get_client(
+        self, base_url: str, use_http2: bool = True, verify: bool = True
+    ) -> httpx.AsyncClient:
+        """Return the pooled client for base_url, creating it if needed.
+
+        httpx connections are bound to the event loop they were opened on, so a
+        client is only reused on the loop which created it. In production uvicorn runs
+        a single loop for the life of the process; this mostly matters for test
+        clients which start a new loop per request.
+
+        Args:
+            base_url (str): A URL to use as the base when building request URLs.
+            use_http2 (bool, optional): Use HTTP/2 for requests? Defaults to True.
+            verify (bool, optional): Verify SSL certificates? Defaults to True.
+
+        Returns:
+            httpx.AsyncClient: A client shared by every caller using this base_url.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        key = (base_url, use_http2, verify)
+        pooled = self._clients.get(key)
+        if pooled is not None:
+            client, client_loop = pooled
+            if client_loop is loop and not client.is_closed:
+                return client
+
+        client = httpx.AsyncClient(
+            http2=use_http2,
+            base_url=base_url,
+            verify=verify,
+            limits=self.limits_for(base_url),
+        )
+        self._clients[key] = (client, loop)
+        return client
+
+    async def aclose(self) -> None:
+        """Close every pooled client owned by the running event loop."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        clients = list(self._clients.values())
+        self._clients.clear()
+
+        for client, client_loop in clients:
+            if client_loop is loop:
+                await client.aclose()
+
+
+client_registry = ClientRegistry()
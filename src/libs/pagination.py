@@ -0,0 +1,406 @@
+import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable
+
+from fastapi import HTTPException
+
+from src.libs.circuit import CircuitOpenError
+from src.libs.deadline import DeadlineExceeded
+from src.libs.http import BodyTemplate
+
+# Whether a manufacturer API honours offset paging, keyed by base URL. Learned at
+# runtime by CursorPaginator and kept for the life of the process.
+offset_paging_support: dict[str, bool] = {}
+
+# The largest beginIndex/endIndex window a manufacturer API has been seen to honour,
+# keyed by base URL. Learned at runtime by IndexWindowPaginator.
+page_window_sizes: dict[str, int] = {}
+
+
+class CursorPaginator:
+    def __init__(
+        self,
+        http,
+        uri: str,
+        headers: dict,
+        post_data: dict,
+        offset_field: str = "offset",
+    ):
+        """Fetches the remaining pages of a cursor (nextPageToken) paginated search,
+        as used by the GM discovery API.
+
+        A cursor can only be walked one page at a time, as each page carries the token
+        for the next. So the first time an API is paged, the request for page two is
+        sent both by token and by offset. If both return the same vehicles the API
+        honours offset paging, and every remaining page is then fetched concurrently
+        rather than one round trip after another. The result is remembered per base
+        URL in offset_paging_support; APIs which ignore the offset fall back to walking
+        the cursor.
+
+        Args:
+            http (AsyncHTTPClient): The HTTP client for the manufacturer API.
+            uri (str): The search URI to POST to.
+            headers (dict): HTTP headers to include with each request.
+            post_data (dict): The search POST body. Its pagination is replaced per page.
+            offset_field (str, optional): The pagination field carrying an offset.
+            Defaults to "offset".
+        """
+        self.http = http
+        self.uri = uri
+        self.headers = headers
+        self.post_data = post_data
+        self.offset_field = offset_field
+        # Only the pagination differs between pages, so the rest of the body is
+        # encoded once
+        self.template = BodyTemplate(post_data, pagination=("pagination",))
+
+    async def fetch_remaining(self, first_page: dict) -> list:
+        """Fetch every page after first_page.
+
+        Args:
+            first_page (dict): The parsed JSON response to the first search request.
+
+        Returns:
+            list: The hits from every remaining page, in order.
+        """
+        hits = self.hits(first_page)
+        total = self.count(first_page)
+        token = self.next_token(first_page)
+        page_size = len(hits)
+
+        if not token or page_size == 0 or page_size >= total:
+            return []
+
+        remaining = []
+        supported = offset_paging_support.get(self.http.base_url)
+
+        if supported:
+            return await self.fetch_offsets(
+                range(page_size, total, page_size), page_size
+            )
+
+        if supported is None:
+            # Send page two by token and by offset at once, and compare the results
+            token_page, offset_page = await asyncio.gather(
+                self.post(self.token_pagination(token, page_size)),
+                self.post(self.offset_pagination(page_size, page_size)),
+                return_exceptions=True,
+            )
+            for result in (token_page, offset_page):
+                if isinstance(result, (CircuitOpenError, DeadlineExceeded)):
+                    raise result
+            if isinstance(token_page, BaseException):
+                raise token_page
+
+            remaining = self.hits(token_page)
+            # An API which rejects the offset request doesn't support offset paging
+            supported = (
+                not isinstance(offset_page, BaseException)
+                and len(remaining) > 0
+                and [self.item_id(hit) for hit in remaining]
+                == [self.item_id(hit) for hit in self.hits(offset_page)]
+            )
+            offset_paging_support[self.http.base_url] = supported
+
+            if supported:
+                return remaining + await self.fetch_offsets(
+                    range(2 * page_size, total, page_size), page_size
+                )
+            token = self.next_token(token_page)
+
+        # Offset paging is not supported, walk the cursor one page at a time
+        while token and page_size + len(remaining) < total:
+            page = await self.post(self.token_pagination(token, page_size))
+            page_hits = self.hits(page)
+            if not page_hits:
+                break
+            remaining.extend(page_hits)
+            token = self.next_token(page)
+
+        return remaining
+
+    async def fetch_offsets(self, offsets: range, page_size: int) -> list:
+        """Fetch the pages starting at each offset concurrently."""
+        if not offsets:
+            return []
+
+        urls_to_fetch = [
+            [
+                self.uri,
+                self.headers,
+                self.template.render(
+                    pagination=self.offset_pagination(offset, page_size)
+                ),
+            ]
+            for offset in offsets
+        ]
+        pages = await self.http.post(uri=urls_to_fetch)
+
+        # A single remaining page returns one Response; normalize to a list.
+        if type(pages) is not list:
+            pages = [pages]
+
+        remaining = []
+        for page in pages:
+            remaining.extend(self.hits(await self.parse(page)))
+        return remaining
+
+    async def post(self, pagination: dict) -> dict:
+        page = await self.http.post(
+            uri=self.uri,
+            headers=self.headers,
+            post_data=self.template.render(pagination=pagination),
+        )
+        return await self.parse(page)
+
+    def token_pagination(self, token: str, page_size: int) -> dict:
+        return {"size": page_size, "nextPageToken": token}
+
+    def offset_pagination(self, offset: int, page_size: int) -> dict:
+        return {"size": page_size, self.offset_field: offset}
+
+    async def parse(self, page) -> dict:
+        try:
+            return await self.http.decode(page)
+        except AttributeError, ValueError:
+            return {}
+
+    @staticmethod
+    def hits(page: dict) -> list:
+        return (page.get("data") or {}).get("hits") or []
+
+    @staticmethod
+    def count(page: dict) -> int:
+        return (page.get("data") or {}).get("count") or 0
+
+    @staticmethod
+    def next_token(page: dict) -> str | None:
+        return ((page.get("data") or {}).get("pagination") or {}).get("nextPageToken")
+
+    @staticmethod
+    def item_id(hit: dict):
+        return hit.get("id")
+
+
+class IndexWindowPaginator:
+    def __init__(
+        self,
+        http,
+        uri: str,
+        headers: dict,
+        params: dict,
+        items: Callable[[dict], list],
+        max_window: int = 100,
+        min_window: int = 12,
+        max_in_flight: int = 4,
+        max_attempts: int = 3,
+        backoff: float = 0.5,
+        slow_response: float = 10.0,
+    ):
+        """Fetches the remaining pages of a search paged by beginIndex/endIndex, as
+        used by the Ford dealer-lot API.
+
+        Windows are requested as large as the API allows. When a page comes back with
+        fewer items than were asked for, the API has capped the window, so the rest of
+        that window is fetched and the smaller size is remembered per base URL in
+        page_window_sizes. Failed and slow responses are treated as a sign of bot
+        protection tarpitting: the number of requests in flight is halved and the
+        failed window retried after a jittered exponential backoff. As the API may
+        also have rejected the window for its size, the retry asks for half as many
+        items, down to min_window, and a smaller window which succeeds is remembered.
+
+        Args:
+            http (AsyncHTTPClient): The HTTP client for the manufacturer API.
+            uri (str): The search URI to GET.
+            headers (dict): HTTP headers to include with each request.
+            params (dict): The search query params. beginIndex and endIndex are added
+            per page.
+            items (Callable[[dict], list]): Returns the items in a parsed page. May
+            raise KeyError or TypeError for an error response.
+            max_window (int, optional): The largest window to request. Defaults to 100.
+            min_window (int, optional): The smallest window size which is learned or
+            retried. Defaults to 12.
+            max_in_flight (int, optional): Requests in flight for this search.
+            Defaults to 4. Requests in flight to the host across every search are
+            limited by the HTTP client, see src.libs.ratelimit.
+            max_attempts (int, optional): Attempts per window. Defaults to 3.
+            backoff (float, optional): Seconds to wait before the first retry, doubled
+            for each later retry. Defaults to 0.5.
+            slow_response (float, optional): Seconds after which a response is treated
+            as tarpitted. Defaults to 10.0.
+        """
+        self.http = http
+        self.uri = uri
+        self.headers = headers
+        self.params = params
+        self.items = items
+        self.max_window = max_window
+        self.min_window = min_window
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.slow_response = slow_response
+
+    async def fetch_remaining(self, begin: int, total: int) -> list[dict | None]:
+        """Fetch every item from begin up to total.
+
+        Args:
+            begin (int): The index of the first item not yet fetched.
+            total (int): The total number of items in the search.
+
+        Returns:
+            list[dict | None]: The parsed pages, in order. A window which failed on
+            every attempt is None.
+        """
+        self.window = page_window_sizes.get(self.http.base_url, self.max_window)
+        self.in_flight = self.max_in_flight
+        self.next_begin = begin
+        self.total = total
+        self.pages: dict[int, dict | None] = {}
+
+        await asyncio.gather(*(self.worker(n) for n in range(self.max_in_flight)))
+        return [self.pages[index] for index in sorted(self.pages)]
+
+    async def worker(self, n: int) -> None:
+        # Workers beyond the current in_flight limit stop once their window is done
+        while n < self.in_flight and self.next_begin < self.total:
+            begin = self.next_begin
+            end = min(begin + self.window, self.total)
+            self.next_begin = end
+            await self.fetch_window(begin, end)
+
+    async def fetch_window(self, begin: int, end: int) -> None:
+        attempt = 1
+        size = end - begin
+        shrunk = False
+        while begin < end:
+            request_end = min(begin + size, end)
+            try:
+                started = time.perf_counter()
+                response = await self.request(begin, request_end)
+                elapsed = time.perf_counter() - started
+                page = await self.http.decode(response)
+                items = self.items(page)
+            except CircuitOpenError, DeadlineExceeded:
+                # The API is down or the search is out of time, so there is no point
+                # backing off and trying again
+                raise
+            except HTTPException, AttributeError, ValueError, KeyError, TypeError:
+                self.tarpitted()
+                if attempt >= self.max_attempts:
+                    self.pages[begin] = None
+                    return
+                # The API may reject a window for being too large, so ask for a
+                # smaller one next time
+                if size > self.min_window:
+                    size = max(self.min_window, size // 2)
+                    shrunk = True
+                await asyncio.sleep(
+                    self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                )
+                attempt += 1
+                continue
+
+            if elapsed >= self.slow_response:
+                self.tarpitted()
+
+            self.pages[begin] = page
+            if not items:
+                return
+
+            if len(items) < request_end - begin:
+                # The API capped the window. Remember the smaller size.
+                self.learn_window(len(items))
+            elif shrunk:
+                # The smaller window was accepted where the larger one failed
+                self.learn_window(request_end - begin)
+                shrunk = False
+            begin += len(items)
+            attempt = 1
+
+    async def request(self, begin: int, end: int):
+        return await self.http.get(
+            uri=self.uri,
+            headers=self.headers,
+            params={**self.params, "beginIndex": begin, "endIndex": end},
+        )
+
+    def learn_window(self, size: int) -> None:
+        if self.min_window <= size < self.window:
+            self.window = size
+            page_window_sizes[self.http.base_url] = size
+
+    def tarpitted(self) -> None:
+        self.in_flight = max(1, self.in_flight // 2)
+
+
+class OffsetLimitPaginator(IndexWindowPaginator):
+    def __init__(
+        self,
+        http,
+        post: Callable[[int, int], Awaitable],
+        items: Callable[[dict], list],
+        count: Callable[[dict], int],
+        **kwargs,
+    ):
+        """Fetches a search POSTed with an offset and limit, as used by the Audi
+        onegraph API. Pages are fetched as an IndexWindowPaginator fetches windows,
+        with the window size as the limit.
+
+        Args:
+            http (AsyncHTTPClient): The HTTP client for the manufacturer API.
+            post (Callable[[int, int], Awaitable]): Sends the search request for an
+            offset and limit, returning the HTTP response.
+            items (Callable[[dict], list]): Returns the items in a parsed page. May
+            raise KeyError or TypeError for an error response.
+            count (Callable[[dict], int]): Returns the total number of items in the
+            search from a parsed page.
+            **kwargs: See IndexWindowPaginator.
+        """
+        super().__init__(http, uri="", headers={}, params={}, items=items, **kwargs)
+        self.post = post
+        self.count = count
+
+    async def fetch_first(self) -> dict:
+        """Fetch the first page, as large as the API is known or hoped to allow.
+
+        If the API rejects the limit, the first page is fetched again at min_window.
+        If it returns fewer items than the limit while more remain, it has capped the
+        limit. Either way the accepted size is remembered in page_window_sizes.
+
+        Raises:
+            ValueError: The response was not JSON. The message is the response body.
+
+        Returns:
+            dict: The parsed first page.
+        """
+        limit = page_window_sizes.get(self.http.base_url, self.max_window)
+        page = await self.fetch_page(0, limit)
+
+        try:
+            items = self.items(page)
+        except KeyError, TypeError:
+            if limit <= self.min_window:
+                return page
+            retry = await self.fetch_page(0, self.min_window)
+            try:
+                self.items(retry)
+            except KeyError, TypeError:
+                return page
+            page_window_sizes[self.http.base_url] = self.min_window
+            return retry
+
+        if self.min_window <= len(items) < min(limit, self.count(page)):
+            page_window_sizes[self.http.base_url] = len(items)
+        return page
+
+    async def fetch_page(self, offset: int, limit: int) -> dict:
+        response = await self.request(offset, offset + limit)
+        try:
+            return await self.http.decode(response)
+        except ValueError:
+            raise ValueError(response.text)
+
+    async def request(self, begin: int, end: int):
+        return await self.post(begin, end - begin)
@@ -0,0 +1,96 @@
+from typing import Any
+
+from src.libs.jsonlib import loads, msgspec
+
+
+class VehicleProjection:
+    def __init__(
+        self,
+        name: str,
+        fields: tuple[str, ...],
+        path: tuple[str, ...],
+        keep: tuple[str, ...] = (),
+    ):
+        """Decodes an inventory search response, keeping only the fields of each
+        vehicle the inventory UI renders.
+
+        When msgspec is installed the response is decoded straight into compact
+        Struct types, so the fields the UI never renders (spec sheets, feature lists,
+        image sets) are skipped by the decoder rather than built as Python objects and
+        thrown away. Otherwise the response is decoded in full and each vehicle
+        projected down to a dict of the listed fields.
+
+        Only the Hyundai (BSI) and Genesis routers use a projection, as theirs are the
+        only vehicle records whose UI fields are known. The other manufacturers'
+        vehicles are passed through whole; projecting them onto a guessed field
+        list would drop fields the frontend renders.
+
+        Args:
+            name (str): A name for the vehicle type, e.g. "HyundaiVehicle".
+            fields (tuple[str, ...]): The vehicle fields to keep.
+            path (tuple[str, ...]): The keys leading to the list of vehicles in the
+            response, e.g. ("data", "items").
+            keep (tuple[str, ...], optional): Other keys to keep alongside the list of
+            vehicles, e.g. ("totalPages",). Defaults to ().
+        """
+        self.fields = fields
+        self.path = path
+        self.keep = keep
+        self.response_type = None
+
+        if msgspec is not None:
+            vehicle_type = msgspec.defstruct(
+                name, [(field, Any, msgspec.UNSET) for field in fields]
+            )
+            response_type = msgspec.defstruct(
+                f"{name}Results",
+                [(path[-1], list[vehicle_type] | None, None)]
+                + [(key, Any, None) for key in keep],
+            )
+            for depth, key in enumerate(reversed(path[:-1])):
+                response_type = msgspec.defstruct(
+                    f"{name}Response{depth}", [(key, response_type | None, None)]
+                )
+            self.response_type = response_type
+            self._decoder = msgspec.json.Decoder(response_type)
+
+    def slim(self, vehicle: dict) -> dict:
+        """Project a decoded vehicle record down to the listed fields."""
+        return {key: vehicle[key] for key in self.fields if key in vehicle}
+
+    def loads(self, data: bytes) -> dict:
+        """Decode an inventory search response.
+
+        Args:
+            data (bytes): The JSON response body.
+
+        Raises:
+            ValueError: data is not valid JSON, or not shaped like a search response.
+
+        Returns:
+            dict: The response with only the keys on path and in keep, and only the
+            listed fields of each vehicle. UI fields missing from a vehicle are left
+            out rather than set to None.
+        """
+        if self.response_type is not None:
+            try:
+                return msgspec.to_builtins(self._decoder.decode(data))
+            except msgspec.DecodeError as e:
+                raise ValueError(str(e)) from e
+
+        return self._project(loads(data), depth=0)
+
+    def _project(self, value, depth: int) -> dict | None:
+        if value is None:
+            return None
+        if type(value) is not dict:
+            raise ValueError("The response is not an inventory search response")
+
+        key = self.path[depth]
+        if depth < len(self.path) - 1:
+            return {key: self._project(value.get(key), depth + 1)}
+
+        vehicles = value.get(key)
+        if vehicles is not None:
+            vehicles = [self.slim(vehicle) for vehicle in vehicles]
+        return {key: vehicles, **{k: value.get(k) for k in self.keep}}
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import time
+
+# Requests in flight to a manufacturer API which has not been given a HostLimiter
+# through ClientRegistry.configure(), across every concurrent search.
+default_host_concurrency = int(os.environ.get("HOST_CONCURRENCY_LIMIT", "16"))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        """Limits requests to rate per second on average, allowing bursts of up to
+        burst requests.
+
+        Each request reserves a token, and waits until its token would have been
+        added to the bucket. So waiting requests are let through in the order they
+        arrived, spaced 1 / rate seconds apart.
+
+        Args:
+            rate (float): Tokens added to the bucket per second.
+            burst (float): The most tokens the bucket holds.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token from the bucket. Returns how long, in seconds, to wait before
+        using it.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class HostLimiter:
+    def __init__(
+        self,
+        max_concurrent: int = default_host_concurrency,
+        rate: float | None = None,
+        burst: float | None = None,
+    ):
+        """Limits the requests to a manufacturer API across every concurrent search,
+        so a burst of users fanning out page requests doesn't turn into hundreds of
+        simultaneous requests to one host and get the API's bot protection to ban us.
+
+        Requests wait for one of max_concurrent slots, then, if a rate is set, for a
+        token from a TokenBucket. How long requests wait is kept in the limiter's stats.
+
+        Use as an async context manager around each request:
+
+            async with limiter:
+                response = await client.get(...)
+
+        Args:
+            max_concurrent (int, optional): The most requests in flight to the host.
+            Defaults to default_host_concurrency.
+            rate (float | None, optional): The most requests per second to the host.
+            Defaults to None, for no rate limit.
+            burst (float | None, optional): Requests which may be sent at once before
+            rate applies. Defaults to None, for max_concurrent.
+        """
+        self.max_concurrent = max_concurrent
+        self.bucket = (
+            TokenBucket(rate, burst if burst is not None else max_concurrent)
+            if rate is not None
+            else None
+        )
+        self._semaphore: tuple[asyncio.Semaphore, asyncio.AbstractEventLoop] | None = (
+            None
+        )
+
+        self.requests = 0
+        self.queued = 0
+        self.in_flight = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Semaphores are bound to the event loop which first waits on them
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore[1] is not loop:
+            self._semaphore = (asyncio.Semaphore(self.max_concurrent), loop)
+        return self._semaphore[0]
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        semaphore = self.semaphore
+        await semaphore.acquire()
+        try:
+            if self.bucket is not None:
+                delay = self.bucket.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        waited = time.perf_counter() - started
+        self.requests += 1
+        self.in_flight += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        if waited >= 0.001:
+            self.queued += 1
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "queued": self.queued,
+            "inFlight": self.in_flight,
+            "averageWaitSeconds": self.wait_seconds / self.requests
+            if self.requests
+            else 0.0,
+            "maxWaitSeconds": self.max_wait_seconds,
+        }
@@ -1,6 +1,69 @@
-from fastapi import HTTPException
+from fastapi import HTTPException, Response
 from fastapi.responses import JSONResponse
 
+from src.libs.compression import decompress, preferred_encoding
+from src.libs.jsonlib import dumps
+
+
+class FastJSONResponse(JSONResponse):
+    """A JSONResponse encoded with the fastest available JSON library, see
+    src.libs.jsonlib. Inventory responses run to several megabytes, and the standard
+    library encoder is the slowest step in sending one.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class EncodedResponse(Response):
+    def __init__(
+        self,
+        encodings: dict[str, bytes],
+        status_code: int,
+        raw_headers: list[tuple[bytes, bytes]],
+        accept_encoding: str = "",
+    ):
+        """A response whose body is already encoded, and compressed with each content
+        coding in encodings. The body is sent in the coding the client prefers, so
+        CompressionMiddleware passes it through without compressing it again.
+
+        Args:
+            encodings (dict[str, bytes]): The body by content coding, e.g. "gzip" and
+            "br". An "identity" body is only required if there's no "gzip" body.
+            status_code (int): The HTTP status code of the response.
+            raw_headers (list): The response headers as (name, value) byte pairs.
+            accept_encoding (str, optional): The request's Accept-Encoding header.
+            Defaults to "", sending the identity body.
+        """
+        self.encodings = encodings
+        self.source_headers = raw_headers
+
+        encoding = preferred_encoding(accept_encoding, encodings)
+        if encoding in encodings:
+            body = encodings[encoding]
+        elif "identity" in encodings:
+            body = encodings["identity"]
+        else:
+            body = decompress(encodings["gzip"], "gzip")
+
+        super().__init__(content=body, status_code=status_code)
+        self.raw_headers = [
+            (name, value)
+            for name, value in raw_headers
+            if name not in (b"content-length", b"content-encoding", b"vary")
+        ]
+        self.raw_headers.append((b"content-length", str(len(body)).encode()))
+        if encoding != "identity":
+            # CompressionMiddleware adds the Vary header to uncompressed responses
+            self.raw_headers.append((b"content-encoding", encoding.encode()))
+            self.raw_headers.append((b"vary", b"Accept-Encoding"))
+
+    def negotiate(self, accept_encoding: str) -> "EncodedResponse":
+        """Return a copy of this response for a request with another Accept-Encoding"""
+        return EncodedResponse(
+            self.encodings, self.status_code, self.source_headers, accept_encoding
+        )
+
 
 def send_response(
     response_data: dict,
@@ -11,7 +74,9 @@ def send_response(
     headers = {
         "Cache-Control": f"public, max-age={str(cache_control_age)}, immutable",
     }
-    return JSONResponse(content=response_data, headers=headers, status_code=status_code)
+    return FastJSONResponse(
+        content=response_data, headers=headers, status_code=status_code
+    )
 
 
 def error_response(
@@ -0,0 +1,109 @@
+import os
+import random
+
+import httpx
+
+# Share of first attempts which may be retried once the retry budget's reserve is
+# spent, e.g. 0.1 allows one retry for every ten requests.
+retry_budget_ratio = float(os.environ.get("RETRY_BUDGET_RATIO", "0.1"))
+
+# Retries which may be made in a burst, before retry_budget_ratio applies
+retry_budget_reserve = float(os.environ.get("RETRY_BUDGET_RESERVE", "20"))
+
+
+class RetryBudget:
+    def __init__(self, ratio: float, reserve: float):
+        """A process-wide cap on retries, shared by every manufacturer API.
+
+        Each request deposits ratio of a retry into the budget, up to reserve, and
+        each retry withdraws a whole one. While an API is healthy the budget stays
+        full and any failure can be retried. When an API is down, every request fails
+        and the budget soon runs dry, leaving retries at ratio of requests, so
+        retrying never multiplies the load on an API which is already failing.
+
+        Args:
+            ratio (float): Retries allowed per request, once the reserve is spent.
+            reserve (float): The most retries which may be saved up.
+        """
+        self.ratio = ratio
+        self.reserve = reserve
+        self.balance = reserve
+        self.retries = 0
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        """Record a first attempt at a request."""
+        self.balance = min(self.reserve, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Take a retry from the budget. Returns False if the budget is spent."""
+        if self.balance < 1:
+            self.exhausted += 1
+            return False
+        self.balance -= 1
+        self.retries += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "balance": self.balance,
+            "retries": self.retries,
+            "exhausted": self.exhausted,
+        }
+
+
+retry_budget = RetryBudget(ratio=retry_budget_ratio, reserve=retry_budget_reserve)
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff: float = 0.2,
+        max_backoff: float = 2.0,
+        methods: tuple[str, ...] = ("get",),
+        statuses: frozenset[int] = frozenset({500, 502, 503, 504}),
+    ):
+        """When and how to retry a failed request to a manufacturer API.
+
+        Only connection failures, dropped connections and the statuses in statuses
+        are retried; timeouts are not, as a request which timed out has already used
+        up the user's wait. Retries back off exponentially with full jitter.
+
+        Args:
+            max_attempts (int, optional): The most attempts at a request, including
+            the first. Defaults to 3.
+            backoff (float, optional): The base delay, in seconds, before a retry.
+            Defaults to 0.2.
+            max_backoff (float, optional): The longest delay, in seconds, before a
+            retry. Defaults to 2.0.
+            methods (tuple[str, ...], optional): The HTTP methods which are safe to
+            retry. POST is only safe for APIs whose POSTs are searches which change
+            nothing. Defaults to ("get",).
+            statuses (frozenset[int], optional): The HTTP status codes to retry.
+            Defaults to 500, 502, 503 and 504.
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.methods = methods
+        self.statuses = statuses
+
+    def retryable(self, method: str, error: Exception) -> bool:
+        """Whether a request which failed with error may be retried."""
+        if method not in self.methods:
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in self.statuses
+        return isinstance(
+            error, (httpx.NetworkError, httpx.RemoteProtocolError, httpx.ConnectTimeout)
+        )
+
+    def delay(self, attempt: int) -> float:
+        """The delay, in seconds, before retrying after the given failed attempt."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+# The policy for manufacturer APIs which have not been given one through
+# ClientRegistry.configure()
+default_retry_policy = RetryPolicy()
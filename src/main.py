@@ -1,8 +1,12 @@
 #!/usr/bin/python3
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 
+from src.libs.compression import CompressionMiddleware
+from src.libs.deadline import DeadlineMiddleware
+from src.libs.http_pool import client_registry
 from src.routers import (
     audi,
     bmw,
@@ -18,7 +22,18 @@ from src.routers import (
     volkswagen,
 )
 
-app = FastAPI(docs_url=None, redoc_url=None)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown. Pooled manufacturer HTTP clients are created
+    on first use and reused for the life of the process; close them, along with their
+    open connections, on shutdown.
+    """
+    yield
+    await client_registry.aclose()
+
+
+app = FastAPI(docs_url=None, redoc_url=None, lifespan=lifespan)
 
 app.include_router(bmw.router)
 app.include_router(audi.router)
@@ -34,6 +49,11 @@ app.include_router(volkswagen.router)
 app.include_router(helpers.router)
 app.include_router(logger.router)
 
+# Gives each request a deadline which every manufacturer API request made for it
+# shares, see src.libs.deadline. Added first so the 504 it sends on a missed deadline
+# still passes through CORS and compression.
+app.add_middleware(DeadlineMiddleware)
+
 # CORS support
 origins = [
     "https://theevfinder.com",
@@ -51,5 +71,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Handles Gzip responses for any request that includes "gzip" in the Accept-Encoding header.
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Compresses responses with brotli, zstd or gzip, per the request's Accept-Encoding
+# header. See src.libs.compression for the per route compression levels.
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
@@ -13,23 +13,47 @@
 # You should have received a copy of the GNU General Public License along with The EV Finder.
 # If not, see <https://www.gnu.org/licenses/>.
 
-import copy
-
+import httpx
 from fastapi import APIRouter, Depends, Request
 
+from src.libs.cache import cache_response
+from src.libs.coalesce import coalesce_requests
 from src.libs.common_query_params import CommonInventoryQueryParams
+from src.libs.graphql import GraphQLOperation, post_operation
+from src.libs.hedge import HedgePolicy
 from src.libs.http import AsyncHTTPClient
+from src.libs.http_pool import client_registry
+from src.libs.pagination import OffsetLimitPaginator
+from src.libs.ratelimit import HostLimiter
 from src.libs.responses import error_response, send_response
+from src.libs.retry import RetryPolicy
 
 router = APIRouter(prefix="/api")
 verify_ssl = False  # onegraph.audi.com uses a self-signed certificate chain
 audi_base_url = "https://onegraph.audi.com"
+# onegraph is an Apollo server, so queries are sent as automatic persisted queries:
+# just the query hash, with the full query only the first time onegraph sees it.
+persisted_queries = True
+
+# Inventory searches fan out one request per page of results, so keep enough warm
+# connections to onegraph for a full fan-out to reuse. onegraph POSTs are read only
+# GraphQL queries, so are safe to retry, and to hedge when one of the pages of a
+# fan-out is stuck well past onegraph's usual response time. Page requests across
+# every search are held to a few at a time.
+client_registry.configure(
+    audi_base_url,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+    retry_policy=RetryPolicy(methods=("get", "post")),
+    hedge_policy=HedgePolicy(percentile=0.95, methods=("get", "post")),
+    limiter=HostLimiter(max_concurrent=6),
+)
 
-# GraphQL query string for the StockCarSearch operation
-_STOCK_CAR_SEARCH_QUERY = (
+# GraphQL query strings for the StockCarSearch operation, by selection profile. The
+# results list renders only the fields in the "list" profile, leaving out images,
+# dynamic attributes, mileage and the like; the VIN detail page uses "detail".
+_STOCK_CAR_LIST_QUERY = (
     "query StockCarSearch($stockIdentifier: StockIdentifierInput!, "
-    "$searchParameter: StockCarSearchParameterInput, "
-    "$groupIds: [String!], $imageIds: [String!]) {\n"
+    "$searchParameter: StockCarSearchParameterInput) {\n"
     "  stockCarSearch(\n"
     "    stockIdentifier: $stockIdentifier\n"
     "    searchParameter: $searchParameter\n"
@@ -139,17 +163,6 @@ _STOCK_CAR_SEARCH_QUERY = (
     "            __typename\n"
     "          }\n"
     "          commissionNumber\n"
-    "          images(groupIds: $groupIds, imageIds: $imageIds) {\n"
-    "            url\n"
-    "            type\n"
-    "            mimeType\n"
-    "            id {\n"
-    "              group\n"
-    "              image\n"
-    "              __typename\n"
-    "            }\n"
-    "            __typename\n"
-    "          }\n"
     "          colorInfo {\n"
     "            exteriorColor {\n"
     "              colorInfo {\n"
@@ -178,11 +191,6 @@ _STOCK_CAR_SEARCH_QUERY = (
     "            __typename\n"
     "          }\n"
     "          driveText\n"
-    "          dynamicAttributes {\n"
-    "            id\n"
-    "            value\n"
-    "            __typename\n"
-    "          }\n"
     "          engineInfo {\n"
     "            fuel {\n"
     "              code\n"
@@ -201,15 +209,6 @@ _STOCK_CAR_SEARCH_QUERY = (
     "            statImport\n"
     "            __typename\n"
     "          }\n"
-    "          mileage {\n"
-    "            unitText\n"
-    "            value {\n"
-    "              formatted\n"
-    "              number\n"
-    "              __typename\n"
-    "            }\n"
-    "            __typename\n"
-    "          }\n"
     "          __typename\n"
     "        }\n"
     "        __typename\n"
@@ -221,8 +220,22 @@ _STOCK_CAR_SEARCH_QUERY = (
     "}"
 )
 
+_STOCK_CAR_DETAIL_QUERY = "query StockCarSearch($stockIdentifier: StockIdentifierInput!, $searchParameter: StockCarSearchParameterInput, $groupIds: [String!], $imageIds: [String!]) {\n  stockCarSearch(\n    stockIdentifier: $stockIdentifier\n    searchParameter: $searchParameter\n  ) {\n    resultNumber\n    results {\n      cars {\n        stockCar {\n          ...StockCarFragment\n          __typename\n        }\n        __typename\n      }\n      __typename\n    }\n    __typename\n  }\n}\n\nfragment StockCarFragment on StockCar {\n  id\n  vin\n  commissionNumber\n  titleText\n  subtitleText\n  cartypeText\n  model {\n    id {\n      year\n      code\n      __typename\n    }\n    name\n    __typename\n  }\n  modelInfo {\n    modelyear\n    genericModel {\n      code\n      text\n      __typename\n    }\n    __typename\n  }\n  dealer {\n    id\n    name\n    __typename\n  }\n  preUse {\n    text\n    __typename\n  }\n  descriptionByDealer\n  colorInfo {\n    exteriorColor {\n      label\n      colorInfo {\n        text\n        code\n        __typename\n      }\n      baseColorInfo {\n        text\n        code\n        __typename\n      }\n      imageUrl\n      __typename\n    }\n    interiorColor {\n      label\n      colorInfo {\n        text\n        code\n        __typename\n      }\n      baseColorInfo {\n        text\n        code\n        __typename\n      }\n      imageUrl\n      __typename\n    }\n    __typename\n  }\n  images(groupIds: $groupIds, imageIds: $imageIds) {\n    id {\n      group\n      image\n      __typename\n    }\n    url\n    __typename\n  }\n  salesInfo {\n    availableFromDateInfo {\n      value\n      __typename\n    }\n    __typename\n  }\n  dynamicAttributes {\n    id\n    value\n    __typename\n  }\n  manufacturerSpecificItems {\n    ... on StockCarManufacturerAudi {\n      cdbItems {\n        id\n        value\n        textInfos {\n          id\n          value\n          __typename\n        }\n        __typename\n      }\n      cdbCategories {\n        id\n        label\n        categories {\n          id\n          label\n          features {\n            text\n            featureType\n            prNumber {\n              class\n              __typename\n            }\n            textInfos {\n              name\n              details\n              benefits\n              __typename\n            }\n            imageResources {\n              id\n              value\n              __typename\n            }\n            __typename\n          }\n          __typename\n        }\n        __typename\n      }\n      __typename\n    }\n    __typename\n  }\n  techDataGroups {\n    id\n    label\n    techDataList {\n      id\n      text\n      label\n      __typename\n    }\n    __typename\n  }\n  engineInfo {\n    fuel {\n      text\n      __typename\n    }\n    __typename\n  }\n  __typename\n}"  # noqa: E501
+
+_STOCK_CAR_SEARCH_QUERIES = {
+    "list": _STOCK_CAR_LIST_QUERY,
+    "detail": _STOCK_CAR_DETAIL_QUERY,
+}
+
+_STOCK_CAR_SEARCH_OPERATIONS = {
+    profile: GraphQLOperation(query, operation_name="StockCarSearch")
+    for profile, query in _STOCK_CAR_SEARCH_QUERIES.items()
+}
+
 
 @router.get("/inventory/audi")
+@coalesce_requests("audi")
+@cache_response("audi", ttl=1800, stale_ttl=1800)
 async def get_audi_inventory(
     req: Request, common_params: CommonInventoryQueryParams = Depends()
 ) -> dict:
@@ -242,111 +255,92 @@ async def get_audi_inventory(
         "apollographql-client-version": "1.0.0",
     }
 
-    amount_to_page_by = 12
-    offset = 0
-
-    inventory_post_data = {
-        "operationName": "StockCarSearch",
-        "variables": {
-            "stockIdentifier": {
-                "marketIdentifier": {
-                    "brand": "A",
-                    "country": "us",
-                    "language": "en",
-                },
-                "stockCarsType": "NEW",
+    inventory_variables = {
+        "stockIdentifier": {
+            "marketIdentifier": {
+                "brand": "A",
+                "country": "us",
+                "language": "en",
+            },
+            "stockCarsType": "NEW",
+        },
+        "searchParameter": {
+            "geo": {
+                "latitude": float(lat),
+                "longitude": float(lng),
+                "maxDistance": radius,
             },
-            "searchParameter": {
-                "geo": {
-                    "latitude": float(lat),
-                    "longitude": float(lng),
-                    "maxDistance": radius,
-                },
-                "paging": {
-                    "limit": amount_to_page_by,
-                    "offset": offset,
-                },
-                "sort": {
-                    "id": "DATE_PREDATEEND",
-                    "direction": "ASC",
-                },
-                "criteria": [
-                    {"id": "model-range", "items": [model]},
-                    {"id": "stat-import", "items": ["AGC_USA_JDP"]},
-                    {"id": "sold-order", "items": ["no"]},
-                ],
+            "paging": {"limit": 12, "offset": 0},
+            "sort": {
+                "id": "DATE_PREDATEEND",
+                "direction": "ASC",
             },
-            "groupIds": ["renderImagesPNG", "dealerImages"],
-            "imageIds": ["sc5c01", "sc4c03", "sc4c11", "1", "2", "3"],
+            "criteria": [
+                {"id": "model-range", "items": [model]},
+                {"id": "stat-import", "items": ["AGC_USA_JDP"]},
+                {"id": "sold-order", "items": ["no"]},
+            ],
         },
-        "query": _STOCK_CAR_SEARCH_QUERY,
     }
 
-    # Setup the HTTPX client to be used for the many API calls throughout this router
-    http = AsyncHTTPClient(
+    async with AsyncHTTPClient(
         base_url=audi_base_url, timeout_value=30.0, verify=verify_ssl
-    )
-
-    inv = await http.post(
-        uri="/graphql", headers=headers, post_data=inventory_post_data
-    )
-    try:
-        inventory_data = inv.json()
-    except ValueError:
-        return error_response(
-            error_message=f"An error occurred with the Audi inventory service: {inv.text}"
+    ) as http:
+        # onegraph has historically paged 12 vehicles at a time. The paginator probes
+        # for the largest paging.limit the API accepts, and fetches the remaining
+        # pages a few at a time.
+        paginator = OffsetLimitPaginator(
+            http=http,
+            post=lambda offset, limit: post_operation(
+                http,
+                uri="/graphql",
+                headers=headers,
+                operation=_STOCK_CAR_SEARCH_OPERATIONS["list"],
+                variables=page_variables(inventory_variables, offset, limit),
+                persisted=persisted_queries,
+            ),
+            items=lambda page: page["data"]["stockCarSearch"]["results"]["cars"],
+            count=lambda page: page["data"]["stockCarSearch"]["resultNumber"],
         )
 
-    try:
-        # If the inventory request was successful, even if 0 vehicles are returned
-        # the response will have the ['data'] dict, so validating that
-        inventory_data["data"]["stockCarSearch"]
-    except KeyError:
-        error_message = "An error occurred with the Audi inventory service"
-        return error_response(error_message=error_message, error_data=inventory_data)
-
-    total_vehicle_count = inventory_data["data"]["stockCarSearch"]["resultNumber"]
-
-    if total_vehicle_count <= amount_to_page_by:
-        return send_response(response_data=inventory_data)
-    else:
-        begin_index = amount_to_page_by
-        end_index = total_vehicle_count
-        step = amount_to_page_by
-
-        urls_to_fetch = []
-
-        for i in range(begin_index, end_index, step):
-            # Make a deep copy of the inventory_post_data dict to allow for value updates
-            # in this loop
-            tmp = copy.deepcopy(inventory_post_data)
-            tmp["variables"]["searchParameter"]["paging"]["offset"] = i
+        try:
+            inventory_data = await paginator.fetch_first()
+        except ValueError as e:
+            return error_response(
+                error_message=f"An error occurred with the Audi inventory service: {e}"
+            )
 
-            # Add the post data to our URL list
-            urls_to_fetch.append(["/graphql", headers, tmp])
+        try:
+            # If the inventory request was successful, even if 0 vehicles are returned
+            # the response will have the ['data'] dict, so validating that
+            cars = inventory_data["data"]["stockCarSearch"]["results"]["cars"]
+        except KeyError, TypeError:
+            error_message = "An error occurred with the Audi inventory service"
+            return error_response(
+                error_message=error_message, error_data=inventory_data
+            )
 
-        remainder = await http.post(uri=urls_to_fetch)
+        total_vehicle_count = inventory_data["data"]["stockCarSearch"]["resultNumber"]
 
-        # HTTP requests to the Audi API are complete, close the connection.
-        await http.close()
+        if total_vehicle_count <= len(cars):
+            return send_response(response_data=inventory_data)
 
-        if type(remainder) is not list:
-            remainder = [remainder]
+        remainder = await paginator.fetch_remaining(
+            begin=len(cars), total=total_vehicle_count
+        )
 
-        for api_result in remainder:
-            try:
-                result = api_result.json()
-                remainder_cars = result["data"]["stockCarSearch"]["results"]["cars"]
-                inventory_data["data"]["stockCarSearch"]["results"]["cars"].extend(
-                    remainder_cars
-                )
-            except AttributeError:
-                inv["apiErrorResponse"] = True
+    for result in remainder:
+        try:
+            cars.extend(result["data"]["stockCarSearch"]["results"]["cars"])
+        except TypeError:
+            # The page failed on every attempt
+            inventory_data["apiErrorResponse"] = True
 
-        return send_response(response_data=inventory_data, cache_control_age=3600)
+    return send_response(response_data=inventory_data, cache_control_age=3600)
 
 
 @router.get("/vin/audi")
+@cache_response("audi-vin", ttl=3600)
 async def get_audi_vin_detail(req: Request) -> dict:
     # vehicleId holds the VIN string (e.g. "WAUJ8BFW5S7901084")
     vin = req.query_params.get("vehicleId")
@@ -358,28 +352,24 @@ async def get_audi_vin_detail(req: Request) -> dict:
         "apollographql-client-version": "1.0.0",
     }
 
-    vin_post_data = {
-        "operationName": "StockCarSearch",
-        "variables": {
-            "stockIdentifier": {
-                "stockCarsType": "NEW",
-                "marketIdentifier": {
-                    "language": "en",
-                    "country": "us",
-                    "brand": "A",
-                },
-            },
-            "searchParameter": {
-                "paging": {"limit": 2, "offset": 0},
-                "criteria": [
-                    {"id": "stat-import", "items": ["AGC_USA_JDP"]},
-                    {"id": "t_vin", "items": [vin]},
-                ],
+    vin_variables = {
+        "stockIdentifier": {
+            "stockCarsType": "NEW",
+            "marketIdentifier": {
+                "language": "en",
+                "country": "us",
+                "brand": "A",
             },
-            "groupIds": ["renderImagesPNG"],
-            "imageIds": ["sc4c14", "sc4c03"],
         },
-        "query": "query StockCarSearch($stockIdentifier: StockIdentifierInput!, $searchParameter: StockCarSearchParameterInput, $groupIds: [String!], $imageIds: [String!]) {\n  stockCarSearch(\n    stockIdentifier: $stockIdentifier\n    searchParameter: $searchParameter\n  ) {\n    resultNumber\n    results {\n      cars {\n        stockCar {\n          ...StockCarFragment\n          __typename\n        }\n        __typename\n      }\n      __typename\n    }\n    __typename\n  }\n}\n\nfragment StockCarFragment on StockCar {\n  id\n  vin\n  commissionNumber\n  titleText\n  subtitleText\n  cartypeText\n  model {\n    id {\n      year\n      code\n      __typename\n    }\n    name\n    __typename\n  }\n  modelInfo {\n    modelyear\n    genericModel {\n      code\n      text\n      __typename\n    }\n    __typename\n  }\n  dealer {\n    id\n    name\n    __typename\n  }\n  preUse {\n    text\n    __typename\n  }\n  descriptionByDealer\n  colorInfo {\n    exteriorColor {\n      label\n      colorInfo {\n        text\n        code\n        __typename\n      }\n      baseColorInfo {\n        text\n        code\n        __typename\n      }\n      imageUrl\n      __typename\n    }\n    interiorColor {\n      label\n      colorInfo {\n        text\n        code\n        __typename\n      }\n      baseColorInfo {\n        text\n        code\n        __typename\n      }\n      imageUrl\n      __typename\n    }\n    __typename\n  }\n  images(groupIds: $groupIds, imageIds: $imageIds) {\n    id {\n      group\n      image\n      __typename\n    }\n    url\n    __typename\n  }\n  salesInfo {\n    availableFromDateInfo {\n      value\n      __typename\n    }\n    __typename\n  }\n  dynamicAttributes {\n    id\n    value\n    __typename\n  }\n  manufacturerSpecificItems {\n    ... on StockCarManufacturerAudi {\n      cdbItems {\n        id\n        value\n        textInfos {\n          id\n          value\n          __typename\n        }\n        __typename\n      }\n      cdbCategories {\n        id\n        label\n        categories {\n          id\n          label\n          features {\n            text\n            featureType\n            prNumber {\n              class\n              __typename\n            }\n            textInfos {\n              name\n              details\n              benefits\n              __typename\n            }\n            imageResources {\n              id\n              value\n              __typename\n            }\n            __typename\n          }\n          __typename\n        }\n        __typename\n      }\n      __typename\n    }\n    __typename\n  }\n  techDataGroups {\n    id\n    label\n    techDataList {\n      id\n      text\n      label\n      __typename\n    }\n    __typename\n  }\n  engineInfo {\n    fuel {\n      text\n      __typename\n    }\n    __typename\n  }\n  __typename\n}",  # noqa: E501
+        "searchParameter": {
+            "paging": {"limit": 2, "offset": 0},
+            "criteria": [
+                {"id": "stat-import", "items": ["AGC_USA_JDP"]},
+                {"id": "t_vin", "items": [vin]},
+            ],
+        },
+        "groupIds": ["renderImagesPNG"],
+        "imageIds": ["sc4c14", "sc4c03"],
     }
 
     async with AsyncHTTPClient(
@@ -387,7 +377,14 @@ async def get_audi_vin_detail(req: Request) -> dict:
         timeout_value=30.0,
         verify=verify_ssl,
     ) as http:
-        v = await http.post(uri="/graphql", headers=headers, post_data=vin_post_data)
+        v = await post_operation(
+            http,
+            uri="/graphql",
+            headers=headers,
+            operation=_STOCK_CAR_SEARCH_OPERATIONS["detail"],
+            variables=vin_variables,
+            persisted=persisted_queries,
+        )
         data = v.json()
 
     try:
@@ -396,3 +393,27 @@ async def get_audi_vin_detail(req: Request) -> dict:
     except KeyError:
         error_message = "An error occurred with the Audi inventory service"
         return error_response(error_message=error_message, error_data=data)
+
+
+###
+# Helper functions
+###
+def page_variables(variables: dict, offset: int, limit: int) -> dict:
+    """Return a copy of the StockCarSearch variables for one page of results. Only the
+    dicts on the path to paging are copied; the rest is shared with variables.
+
+    Args:
+        variables (dict): The StockCarSearch variables.
+        offset (int): The index of the first vehicle on the page.
+        limit (int): The number of vehicles on the page.
+
+    Returns:
+        dict: The variables for the page.
+    """
+    return {
+        **variables,
+        "searchParameter": {
+            **variables["searchParameter"],
+            "paging": {"limit": limit, "offset": offset},
+        },
+    }
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, Depends, Request
 
+from src.libs.cache import cache_response
+from src.libs.coalesce import coalesce_requests
 from src.libs.common_query_params import CommonInventoryQueryParams
+from src.libs.graphql import fill_query_template, query_template
 from src.libs.http import AsyncHTTPClient
 from src.libs.responses import error_response, send_response
 
@@ -8,39 +11,62 @@ router = APIRouter(prefix="/api")
 verify_ssl = True
 bmw_base_url = "https://www.bmwusa.com/inventory/graphql"
 
+# Vehicle fields selected from the BMW GraphQL API, by selection profile. The results
+# list renders only the fields in the "list" profile, leaving out the marketing and
+# technical text and the cosy (360 degree view) images; the VIN detail page uses
+# "detail".
+_VEHICLE_FIELDS = {
+    "list": "name modelYear sold daysOnLot orderType dealerEstArrivalDate interiorGenericColor exteriorGenericColor hybridFlag sportsFlag vehicleDetailsPage milesPerGallon milesPerGallonEqv code bodyStyle { name } engineDriveType { name } series { name code } qualifiedModelCode totalMsrp dealerId dealerLocation distanceToLocatorZip orderStatus vin options { name isPaint isUpholstery } vehicleProcessingCenter isAtPmaDealer",  # noqa: B950
+    "detail": "code id dealerId dealerLocation vin totalMsrp name powertrain fuelType marketingText orderStatus technicalText acceleration horsepower milesPerGallon milesPerGallonEqv modelYear productionNumber initialCOSYURL sold hybridFlag sportsFlag vehicleDetailsPage destinationAndHandling cosy { panoramaViewUrlPart walkaround360DegViewUrlPart crops { lg md sm xl } } qualifiedModelCode series { code name } bodyStyle { code name } engineDriveType { code name } options { name code optionPackageCodeKey price wholesalePrice optionType optionAttribute isPaint isUpholstery isPackage isTrim isAccessory isWheel isStandard isLine isTop isUni isMetallic isIndividual isMarketing } vehicleDetailsPage vehicleProcessingCenter isAtPmaDealer packagesDisclaimer",  # noqa: B950
+}
+_DEALER_INFO_FIELDS = "dealerInfo { centerID newVehicleSales { dealerName distance longitude locationID dealerURL phoneNumber address { lineOne lineTwo city state zipcode } } }"  # noqa: B950
+
+# The BMW API has a pageSize attribute which is 24 by default. Setting a larger
+# pageSize to avoid API request pagination
+max_page_size = 2000
+
+# The BMW API takes the search values inline in the query rather than as variables,
+# so these queries can't be sent as persisted queries. The query documents are built
+# and serialized as POST bodies once, with the search values filled in per request.
+_INVENTORY_QUERY = query_template(
+    "query inventory {getInventory(zip: %(zip)s"
+    ", bucket: BYO, filter: { locatorRange: %(radius)s"
+    " excludeStopSale: false series: %(model)s"
+    " minModelYear: %(year)s"
+    " maxModelYear: %(year)s"
+    # Order statuses 0 and 1: Vehicle is at the dealership
+    # 2, 3, 4, and 5: Vehicle is in transit or in production"
+    ', statuses:["0","1","2","3","4","5"] }, sorting: [{order: ASC, criteria: DISTANCE_TO_LOCATOR_ZIP},{order:ASC,criteria:PRICE}] pagination: {pageIndex: 1, '  # noqa: B950
+    f"pageSize: {max_page_size}"
+    "}) { numberOfFilteredVehicles pageNumber totalPages errorCode filter { modelsWithSeries { series { code name } model { code name } } } "  # noqa: B950
+    + _DEALER_INFO_FIELDS
+    + f" result {{ {_VEHICLE_FIELDS['list']} }} }} }}"
+)
+_VIN_QUERY = query_template(
+    "query inventory { getInventoryByIdentifier(identifier: %(vin)s)"
+    + f" {{ result {{ {_VEHICLE_FIELDS['detail']} }} "
+    + _DEALER_INFO_FIELDS
+    + " } }"
+)
+
 
 @router.get("/inventory/bmw")
+@coalesce_requests("bmw")
+@cache_response("bmw", ttl=900, stale_ttl=2700)
 async def get_bmw_inventory(
     req: Request, common_params: CommonInventoryQueryParams = Depends()
 ) -> dict:
-    # The BMW API has a pageSize attribute which is 24 by default. Setting a larger
-    # pageSize to avoid API request pagination
-    max_page_size = 2000
-
-    zip_code = str(common_params.zip)
-    year = str(common_params.year)
-    model = common_params.model
-    radius = str(common_params.radius)
-
     headers = {
         "Referer": "https://www.bmwusa.com/inventory.html",
     }
 
-    inventory_post_data = {
-        "query": "query inventory {getInventory(zip: "
-        + f'"{zip_code}"'
-        + ", bucket: BYO, filter: { locatorRange: "
-        + radius
-        + " excludeStopSale: false series: "
-        + f'"{model}"'
-        + f" minModelYear: {year}"
-        + f" maxModelYear: {year}"
-        # Order statuses 0 and 1: Vehicle is at the dealership
-        # 2, 3, 4, and 5: Vehicle is in transit or in production"
-        + ', statuses:["0","1","2","3","4","5"] }, sorting: [{order: ASC, criteria: DISTANCE_TO_LOCATOR_ZIP},{order:ASC,criteria:PRICE}] pagination: {pageIndex: 1, '  # noqa: B950
-        + f"pageSize: {max_page_size}"
-        + "}) { numberOfFilteredVehicles pageNumber totalPages errorCode filter { modelsWithSeries { series { code name } model { code name } } } dealerInfo { centerID newVehicleSales { dealerName distance longitude locationID dealerURL phoneNumber address { lineOne lineTwo city state zipcode } } } result { name modelYear sold daysOnLot orderType dealerEstArrivalDate marketingText technicalText interiorGenericColor exteriorGenericColor hybridFlag sportsFlag vehicleDetailsPage milesPerGallon milesPerGallonEqv code bodyStyle { name } engineDriveType { name } series { name code } qualifiedModelCode technicalText totalMsrp dealerId dealerLocation distanceToLocatorZip orderStatus vin initialCOSYURL cosy { panoramaViewUrlPart walkaround360DegViewUrlPart } options { name isPaint isUpholstery } vehicleDetailsPage vehicleProcessingCenter isAtPmaDealer } } }"  # noqa: B950
-    }
+    inventory_post_data = fill_query_template(
+        _INVENTORY_QUERY,
+        zip=str(common_params.zip),
+        radius=common_params.radius,
+        model=common_params.model,
+        year=common_params.year,
+    )
 
     async with AsyncHTTPClient(
         base_url=bmw_base_url, timeout_value=30.0, verify=verify_ssl
@@ -52,7 +78,7 @@ async def get_bmw_inventory(
         )
 
     try:
-        data = inv.json()
+        data = await http.decode(inv)
     except ValueError:
         return error_response(
             error_message=f"An error occurred with the BMW API: {inv.text}"
@@ -72,6 +98,7 @@ async def get_bmw_inventory(
 
 
 @router.get("/vin/bmw")
+@cache_response("bmw-vin", ttl=3600)
 async def get_bmw_vin_detail(req: Request) -> dict:
     headers = {
         "Referer": "https://www.bmwusa.com/inventory/",
@@ -79,11 +106,7 @@ async def get_bmw_vin_detail(req: Request) -> dict:
 
     vin = req.query_params.get("vin")
 
-    vin_post_data = {
-        "query": "query inventory { getInventoryByIdentifier("
-        + f'identifier: "{vin}")'
-        + " { result { code id dealerId dealerLocation vin totalMsrp name powertrain fuelType marketingText orderStatus technicalText acceleration horsepower milesPerGallon milesPerGallonEqv modelYear productionNumber initialCOSYURL sold hybridFlag sportsFlag vehicleDetailsPage destinationAndHandling cosy { panoramaViewUrlPart walkaround360DegViewUrlPart crops { lg md sm xl } } qualifiedModelCode series { code name } bodyStyle { code name } engineDriveType { code name } options { name code optionPackageCodeKey price wholesalePrice optionType optionAttribute isPaint isUpholstery isPackage isTrim isAccessory isWheel isStandard isLine isTop isUni isMetallic isIndividual isMarketing } vehicleDetailsPage vehicleProcessingCenter isAtPmaDealer packagesDisclaimer } dealerInfo { centerID newVehicleSales { dealerName distance longitude locationID dealerURL phoneNumber address { lineOne lineTwo city state zipcode } } } } }"  # noqa: B950
-    }
+    vin_post_data = fill_query_template(_VIN_QUERY, vin=vin)
 
     async with AsyncHTTPClient(
         base_url=bmw_base_url,
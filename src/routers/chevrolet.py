@@ -15,7 +15,10 @@
 
 from fastapi import APIRouter, Depends, Request
 
+from src.libs.cache import cache_response
+from src.libs.coalesce import coalesce_requests
 from src.libs.common_query_params import CommonInventoryQueryParams
+from src.libs.gm import GMInventory
 from src.libs.http import AsyncHTTPClient
 from src.libs.responses import error_response, send_response
 
@@ -24,83 +27,42 @@ verify_ssl = True
 chevrolet_base_url = "https://www.chevrolet.com/chevrolet/shopping/api"
 error_message = "An error occurred with the Chevrolet inventory service"
 
+chevrolet_inventory = GMInventory(
+    program_id="CHEVROLET", base_url=chevrolet_base_url, error_message=error_message
+)
+
 
 @router.get("/inventory/chevrolet")
+@coalesce_requests("chevrolet")
+@cache_response("chevrolet", ttl=900, stale_ttl=2700)
 async def get_chevrolet_inventory(
     req: Request, common_params: CommonInventoryQueryParams = Depends()
 ) -> dict:
-    headers = {
-        "User-Agent": req.headers.get("User-Agent"),
-        "referer": "https://www.chevrolet.com/shopping/inventory/search",
-        "client": "T1_VSR",
-        "tenantId": "0",
-        "dealerId": "0",
-        "oemId": "GM",
-        "programId": "CHEVROLET",
-    }
-
-    inventory_post_data = {
-        "filters": {
+    inventory = await chevrolet_inventory.search(
+        user_agent=req.headers.get("User-Agent"),
+        referer="https://www.chevrolet.com/shopping/inventory/search",
+        filters={
             "stockType": {"values": ["DealerStock"]},
             "year": {"values": [str(common_params.year)]},
             "model": {"values": [common_params.model.lower()]},
             "geo": {"zipCode": common_params.zip, "radius": common_params.radius},
         },
-        "sort": {"name": "distance", "order": "ASC"},
-        "paymentTypes": ["CASH"],
-        "pagination": {"size": 100},
-    }
-
-    facets_post_data = {
-        "filters": {
+        # Some Chevrolet vehicle detail is accessible through the separate facets API
+        # endpoint, which is combined with the inventory results.
+        facets_filters={
             "year": {"values": [str(common_params.year)]},
             "model": {"values": [common_params.model.lower()]},
             "geo": {"zipCode": common_params.zip, "radius": common_params.radius},
-        }
-    }
-
-    async with AsyncHTTPClient(
-        base_url=chevrolet_base_url,
-        timeout_value=30.0,
-    ) as http:
-        i = await http.post(
-            uri="/aec-cp-discovery-api/p/v1/vehicles/search",
-            headers=headers,
-            post_data=inventory_post_data,
-        )
-        # Some Chevrolet vehicle detail is accessible through a separate API endpoint.
-        # Making that call here, and will combine with the inventory results later.
-        f = await http.post(
-            uri="/aec-cp-discovery-api/p/v1/vehicles/facets",
-            headers=headers,
-            post_data=facets_post_data,
-        )
-    try:
-        inventory = i.json()
-        facets = f.json()
-    except ValueError:
-        return error_response(
-            error_message=f"An error occurred with the Chevrolet inventory service: {i.text}"
-        )
-
-    # Add vehicle facets to the inventory response
-    inventory["facets"] = facets
+        },
+    )
 
-    try:
-        inventory["data"]["hits"]
-        return send_response(
-            response_data=inventory,
-            cache_control_age=3600,
-        )
-    except KeyError:
-        try:
-            inventory["errorDetails"]["key"]
-            return send_response(response_data={})
-        except Exception:
-            return error_response(error_message=error_message, error_data=inventory)
+    if not inventory:
+        return send_response(response_data={})
+    return send_response(response_data=inventory, cache_control_age=3600)
 
 
 @router.get("/vin/chevrolet")
+@cache_response("chevrolet-vin", ttl=3600)
 async def get_chevrolet_vin_detail(req: Request) -> dict:
     headers = {
         "User-Agent": req.headers.get("User-Agent"),
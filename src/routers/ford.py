@@ -1,17 +1,91 @@
 import time
 
-from fastapi import APIRouter, Depends, Request
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Request
 
+from src.libs.cache import cache_response, response_cache
+from src.libs.circuit import CircuitOpenError
+from src.libs.coalesce import coalesce_requests
 from src.libs.common_query_params import CommonInventoryQueryParams
+from src.libs.deadline import DeadlineExceeded
+from src.libs.hedge import HedgePolicy
 from src.libs.http import AsyncHTTPClient
+from src.libs.http_pool import client_registry
+from src.libs.pagination import IndexWindowPaginator
+from src.libs.ratelimit import HostLimiter
 from src.libs.responses import error_response, send_response
+from src.libs.retry import RetryPolicy
 
 router = APIRouter(prefix="/api")
 verify_ssl = True
 ford_base_url = "https://shop.ford.com"
 
+# shop.ford.com is behind Akamai, which tarpits clients opening many parallel
+# connections. Keep a small pool of warm connections and multiplex over HTTP/2. A 500
+# from Akamai usually means it's tarpitting, which the dealer-lot paginator backs off
+# from itself, so only gateway errors and dropped connections are retried here.
+# Requests stuck behind a slow Akamai edge are hedged, though sparingly, as hedges
+# are multiplexed over the same few connections. Across every search, requests are
+# held to a few at a time and a steady rate, well under what Akamai bans for.
+client_registry.configure(
+    ford_base_url,
+    limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+    retry_policy=RetryPolicy(
+        max_attempts=2, backoff=0.5, statuses=frozenset({502, 503, 504})
+    ),
+    hedge_policy=HedgePolicy(percentile=0.99, max_hedge_rate=0.02),
+    limiter=HostLimiter(max_concurrent=6, rate=8.0),
+)
+
+dealers_uri = "/aemservices/cache/inventory/dealer/dealers"
+inventory_uri = "/aemservices/cache/inventory/dealer-lot"
+
+# The dealer slug for a search depends only on the zip code and model, and rarely
+# changes, so it's cached for a day in the response cache backend.
+dealer_slug_ttl = 86400.0
+
+
+def page_dealers(page: dict) -> list:
+    """Return the dealers listed in the filterSet of a dealer-lot inventory page.
+
+    Raises:
+        KeyError, TypeError, IndexError: The page has no dealers, e.g. a failed page.
+    """
+    filter_groups = page["data"]["filterSet"]["filterGroupsMap"]
+    return filter_groups["Dealer"][0]["filterItemsMetadata"]["filterItems"]
+
+
+def slim_inventory(exact_match: dict, dealers: list) -> dict:
+    """Build the inventory response for the frontend from the first dealer-lot page,
+    keeping just the vehicles and dealers at the paths the frontend reads them from.
+
+    Args:
+        exact_match (dict): The page's data.filterResults.ExactMatch.
+        dealers (list): The page's dealers, see page_dealers().
+
+    Returns:
+        dict: The slimmed inventory response.
+    """
+    return {
+        "data": {
+            "filterResults": {
+                "ExactMatch": {
+                    "totalCount": exact_match["totalCount"],
+                    "vehicles": exact_match["vehicles"],
+                }
+            },
+            "filterSet": {
+                "filterGroupsMap": {
+                    "Dealer": [{"filterItemsMetadata": {"filterItems": dealers}}]
+                }
+            },
+        }
+    }
+
 
 @router.get("/inventory/ford")
+@coalesce_requests("ford")
+@cache_response("ford", ttl=1800, stale_ttl=1800)
 async def main(
     req: Request, common_params: CommonInventoryQueryParams = Depends()
 ) -> dict:
@@ -51,45 +125,11 @@ async def main(
         "zipcode": zip_code,
     }
 
-    dealers_uri = "/aemservices/cache/inventory/dealer/dealers"
-    inventory_uri = "/aemservices/cache/inventory/dealer-lot"
-
-    # Retrieve the dealer slug, which is needed for the inventory API call
-    dealers = await http.get(
-        uri=dealers_uri,
-        headers=headers,
-        params=common_params,
+    # Retrieve the dealer slug, which is needed for the inventory API call, and the
+    # initial batch of 12 vehicles
+    inv, slug, inventory_params = await get_first_page(
+        http, headers, common_params, radius
     )
-    try:
-        dealers = dealers.json()
-    except AttributeError:
-        error_response(generic_error_message)
-    else:
-        slug = parse_dealer_slug(dealers)
-
-        if "ERROR" in slug:
-            error_message = generic_error_message
-            return error_response(
-                error_message=error_message,
-                error_data="",
-            )
-
-    if slug:
-        inventory_params = {
-            **common_params,
-            "dealerSlug": slug,
-            "Radius": radius,
-            "Order": "Distance",
-        }
-    # Retrieve the initial batch of 12 vehicles
-    inv = await http.get(uri=inventory_uri, headers=headers, params=inventory_params)
-    try:
-        inv = inv.json()
-    except AttributeError:
-        error_response(generic_error_message)
-
-    # Add the dealer_slug to the response, the frontend will need this for future API calls
-    inv["dealerSlug"] = slug
 
     try:
         inv["data"]["filterResults"]
@@ -101,92 +141,68 @@ async def main(
 
     if len(inv["data"]["filterResults"]) == 0:
         # If filterResults is empty, no inventory was found. Returning the inv JSON
-        # as is, and the frontend will handle it.
+        # as is, and the frontend will handle it. The dealer_slug is needed for
+        # future API calls.
+        inv["dealerSlug"] = slug
         return send_response(response_data=inv)
-    else:
-        total_count = inv["data"]["filterResults"]["ExactMatch"]["totalCount"]
-
-        # The Ford inventory API pages 12 vehicles at a time, and their API does not
-        # accept a random high value for endIndex, nor does it seem to allow for
-        # paging by greater than 100 vehicles at a time. So making N number of API
-        # requests, incremented by step.
-        begin_index = 12
-        end_index = 0
-        step = 50
-
-        urls_to_fetch = []
-        vehicles = []
-        dealers = []
-
-        for i in range(begin_index, total_count, step):
-            begin_index = i
-
-            # Ensure we don't request more than the total_count of pages returned for this
-            # inventory request
-            if i + step < total_count:
-                end_index = i + step
-            else:
-                end_index = total_count
-
-            # Adding beginIndex and endIndex to the query params used to make subsequent
-            # API requests
-            remainder_inventory_params = {
-                **inventory_params,
-                "beginIndex": begin_index,
-                "endIndex": end_index,
-            }
-
-            # Create a list of requests which will be passed to httpx
-            urls_to_fetch.append(
-                [
-                    inventory_uri,
-                    headers,
-                    remainder_inventory_params,
-                ]
-            )
 
-        remainder = await http.get(uri=urls_to_fetch)
-
-        # If we only have the initial API call and one additional API call, the response
-        # back from the http helper library is a httpx.Response object. If we have multiple
-        # additional API calls, the response back is a list. Catching this situation and
-        # throwing that single httpx.Response object into a list for further processing.
-        if type(remainder) is not list:
-            remainder = [remainder]
+    # A ton of data is returned from the Ford API, most of it unused by the site (the
+    # filterSet holds every filter group and its metadata). Only the vehicles and the
+    # dealers are returned to the frontend, for the first page as for the rest.
+    exact_match = inv["data"]["filterResults"]["ExactMatch"]
+    total_count = exact_match["totalCount"]
+    try:
+        first_dealers = page_dealers(inv)
+    except KeyError, TypeError, IndexError:
+        first_dealers = []
+
+    response_data = slim_inventory(exact_match, first_dealers)
+    # Add the dealer_slug to the response, the frontend will need this for future API
+    # calls
+    response_data["dealerSlug"] = slug
+
+    # The Ford inventory API pages 12 vehicles at a time, and does not accept a
+    # random high value for endIndex. The paginator requests the remaining vehicles in
+    # the largest windows the API honours, backing off if Akamai starts tarpitting.
+    paginator = IndexWindowPaginator(
+        http=http,
+        uri=inventory_uri,
+        headers=headers,
+        params=inventory_params,
+        items=lambda page: page["data"]["filterResults"]["ExactMatch"]["vehicles"],
+    )
+    remainder = await paginator.fetch_remaining(
+        begin=len(exact_match["vehicles"]), total=total_count
+    )
 
-        # Loop through the inventory results list
-        for api_result in remainder:
-            # When issuing concurrent API requests, some may come back with non-200
-            # responses (e.g. 500) and thus no JSON response data. Catching that condition
-            # and adding an item to the dict which is returned to the front end.
-            try:
-                result = api_result.json()
-            except AttributeError:
-                inv["apiErrorResponse"] = True
-            else:
-                # A ton of data is returned from the Ford API, most of it unused by the site.
-                # Just storing what's actually used to dramatically reduce the response size
-                # back to the front end.
-                vehicles.append(
-                    result["data"]["filterResults"]["ExactMatch"]["vehicles"]
-                )
-                dealers.append(
-                    result["data"]["filterSet"]["filterGroupsMap"]["Dealer"][0][
-                        "filterItemsMetadata"
-                    ]["filterItems"]
-                )
-
-        # Add the remainder API responses to the inventory dict
-        inv["rdata"] = {"vehicles": vehicles, "dealers": dealers}
+    vehicles = []
+    dealers = []
+
+    # Loop through the inventory results list
+    for result in remainder:
+        # Some pages may fail on every attempt (e.g. a 500 response) and thus have no
+        # JSON response data. Catching that condition and adding an item to the dict
+        # which is returned to the front end.
+        try:
+            page_vehicles = result["data"]["filterResults"]["ExactMatch"]["vehicles"]
+            dealers.append(page_dealers(result))
+        except KeyError, TypeError, IndexError:
+            response_data["apiErrorResponse"] = True
+        else:
+            vehicles.append(page_vehicles)
+
+    # Add the remainder API responses to the inventory dict
+    response_data["rdata"] = {"vehicles": vehicles, "dealers": dealers}
 
     end = time.perf_counter()
     print(f"\n\n-----\nTime taken for Ford API transaction: {end - start} sec")
 
     await http.close()
-    return send_response(response_data=inv, cache_control_age=3600)
+    return send_response(response_data=response_data, cache_control_age=3600)
 
 
 @router.get("/vin/ford")
+@cache_response("ford-vin", ttl=3600)
 async def get_ford_vin_detail(req: Request) -> dict:
     model = req.query_params.get("model")
     vin = req.query_params.get("vin")
@@ -234,6 +250,107 @@ async def get_ford_vin_detail(req: Request) -> dict:
 ###
 # Helper functions
 ###
+def dealer_slug_key(zip_code: str, model: str) -> str:
+    return f"ford-dealer-slug?zip={zip_code}&model={model}"
+
+
+async def get_dealer_slug(
+    http: AsyncHTTPClient, headers: dict, params: dict, refresh: bool = False
+) -> tuple[str, bool]:
+    """Look up the dealer slug for a search, from the cache where possible.
+
+    Args:
+        http (AsyncHTTPClient): The HTTP client for the Ford API.
+        headers (dict): HTTP headers for the dealers API request.
+        params (dict): The dealers API query params, including zipcode and model.
+        refresh (bool, optional): Skip the cache and fetch the slug from the Ford API.
+        Defaults to False.
+
+    Returns:
+        tuple[str, bool]: The dealer slug (see parse_dealer_slug()), and whether it was
+        served from the cache.
+    """
+    key = dealer_slug_key(params["zipcode"], params["model"])
+
+    if not refresh:
+        cached = await response_cache.backend.get(key)
+        if cached:
+            return cached.decode(), True
+
+    dealers = await http.get(uri=dealers_uri, headers=headers, params=params)
+    try:
+        dealers = dealers.json()
+    except AttributeError:
+        return "ERROR: The dealers API response could not be read.", False
+
+    slug = parse_dealer_slug(dealers)
+    if "ERROR" not in slug:
+        await response_cache.backend.set(key, slug.encode(), ttl=dealer_slug_ttl)
+    return slug, False
+
+
+async def get_first_page(
+    http: AsyncHTTPClient, headers: dict, params: dict, radius: int
+) -> tuple[dict, str, dict]:
+    """Look up the dealer slug for a search and fetch the first dealer-lot inventory
+    page with it.
+
+    A cached slug may have gone stale, e.g. the dealer left the Ford program. If the
+    inventory request made with a cached slug fails, the slug is looked up again and
+    the request retried once.
+
+    Args:
+        http (AsyncHTTPClient): The HTTP client for the Ford API.
+        headers (dict): HTTP headers to include with each request.
+        params (dict): The dealers API query params, including zipcode and model.
+        radius (int): The search radius, in miles.
+
+    Raises:
+        HTTPException: No dealer slug was found, or the inventory request failed.
+
+    Returns:
+        tuple[dict, str, dict]: The parsed first page, the dealer slug and the
+        inventory query params.
+    """
+    generic_error_message = "An error occurred obtaining Ford inventory results."
+    slug, cached = await get_dealer_slug(http, headers, params)
+
+    while True:
+        if "ERROR" in slug:
+            return error_response(
+                error_message=generic_error_message,
+                error_data="",
+            )
+
+        inventory_params = {
+            **params,
+            "dealerSlug": slug,
+            "Radius": radius,
+            "Order": "Distance",
+        }
+        try:
+            inv = await http.get(
+                uri=inventory_uri, headers=headers, params=inventory_params
+            )
+        except CircuitOpenError, DeadlineExceeded:
+            raise
+        except HTTPException:
+            # A stale slug usually fails the dealer-lot request outright
+            if not cached:
+                raise
+            inv = {}
+        else:
+            try:
+                inv = await http.decode(inv)
+            except AttributeError:
+                return error_response(generic_error_message)
+
+        if cached and type(inv.get("data")) is not dict:
+            slug, cached = await get_dealer_slug(http, headers, params, refresh=True)
+            continue
+        return inv, slug, inventory_params
+
+
 def parse_dealer_slug(dealers: dict) -> str:
     """Helper function which retrieves a dealer slug from the Ford API. This dealer slug
     is needed for all future inventory/VIN API requests
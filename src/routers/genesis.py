@@ -15,8 +15,11 @@
 
 from fastapi import APIRouter, Depends, Request
 
+from src.libs.cache import cache_response
+from src.libs.coalesce import coalesce_requests
 from src.libs.common_query_params import CommonInventoryQueryParams
 from src.libs.http import AsyncHTTPClient
+from src.libs.projection import VehicleProjection
 from src.libs.responses import error_response, send_response
 
 router = APIRouter(prefix="/api")
@@ -31,7 +34,8 @@ genesis_max_dealers = 100
 
 # Each v2 vehicle record carries fields the inventory UI never renders. Project each
 # record down to just the fields the frontend maps onto its table columns (keeping the
-# OEM field names; the frontend does the OEM -> column-key mapping).
+# OEM field names; the frontend does the OEM -> column-key mapping). The other fields
+# are skipped while decoding, see src.libs.projection.
 genesis_vehicle_fields = (
     "VIN",
     "ModelYear",
@@ -48,19 +52,14 @@ genesis_vehicle_fields = (
 )
 
 
-def slim_vehicle(vehicle: dict) -> dict:
-    """Project a v2 vehicle record down to the fields the inventory UI renders.
-
-    Args:
-        vehicle: A single vehicle record from the v2 search response.
-
-    Returns:
-        A dict containing only the fields in genesis_vehicle_fields that are present.
-    """
-    return {key: vehicle[key] for key in genesis_vehicle_fields if key in vehicle}
+genesis_vehicles = VehicleProjection(
+    "GenesisVehicle", fields=genesis_vehicle_fields, path=("result", "vehicles")
+)
 
 
 @router.get("/inventory/genesis")
+@coalesce_requests("genesis")
+@cache_response("genesis", ttl=900, stale_ttl=2700)
 async def get_genesis_inventory(
     req: Request,
     common_params: CommonInventoryQueryParams = Depends(),
@@ -105,14 +104,14 @@ async def get_genesis_inventory(
         )
 
     try:
-        payload = inv.json()
+        payload = await http.decode(inv, projection=genesis_vehicles)
     except ValueError:
         return error_response(
             error_message=f"An error occurred with the Genesis API: {inv.text}"
         )
 
     result = payload.get("result") or {}
-    vehicles = [slim_vehicle(v) for v in result.get("vehicles") or []]
+    vehicles = result.get("vehicles") or []
 
     # If no vehicles were returned, there is no inventory. Return an empty dict response
     # which the UI uses to display the no inventory message. An empty search yields a
@@ -126,6 +125,7 @@ async def get_genesis_inventory(
 
 
 @router.get("/vin/genesis")
+@cache_response("genesis-vin", ttl=3600)
 async def get_genesis_vin_detail(req: Request) -> dict:
     vin_params = {
         "zip": req.query_params.get("zip"),
@@ -16,7 +16,10 @@
 
 from fastapi import APIRouter, Depends, Request
 
+from src.libs.cache import cache_response
+from src.libs.coalesce import coalesce_requests
 from src.libs.common_query_params import CommonInventoryQueryParams
+from src.libs.gm import GMInventory
 from src.libs.http import AsyncHTTPClient
 from src.libs.responses import error_response, send_response
 from src.routers.logger import send_error_to_gcp
@@ -26,6 +29,10 @@ verify_ssl = True
 gmc_base_url = "https://www.gmc.com/gmc/shopping/api"
 generic_error_message = "An error occurred obtaining GMC inventory results."
 
+gmc_inventory = GMInventory(
+    program_id="GMC", base_url=gmc_base_url, error_message=generic_error_message
+)
+
 # Known trim names for all GMC EVs. Any trim name returned by the inventory API
 # that is not in this set will trigger a GCP alert so the map can be kept current.
 _KNOWN_GMC_TRIMS: frozenset[str] = frozenset(
@@ -71,93 +78,36 @@ def _log_unknown_trims(hits: list[dict], request: Request) -> None:
 
 
 @router.get("/inventory/gmc")
+@coalesce_requests("gmc")
+@cache_response("gmc", ttl=900, stale_ttl=2700)
 async def get_gmc_inventory(
     req: Request, req_params: CommonInventoryQueryParams = Depends()
 ) -> dict:
-    headers = {
-        "User-Agent": req.headers.get("User-Agent"),
-        "referer": "https://www.gmc.com/",
-        "client": "T1_VSR",
-        "tenantId": "0",
-        "dealerId": "0",
-        "oemId": "GM",
-        "programId": "GMC",
-    }
-
-    post_data = {
-        "filters": {
+    # The GMC API caps page size at 20, so every remaining page is fetched until all
+    # vehicles matching the search have been collected. The facets are unfiltered.
+    inventory = await gmc_inventory.search(
+        user_agent=req.headers.get("User-Agent"),
+        referer="https://www.gmc.com/",
+        filters={
             "geo": {
                 "zipCode": req_params.zip,
                 "radius": req_params.radius,
             },
             "model": {"values": [req_params.model.lower()]},
         },
-        "sort": {"name": "distance", "order": "ASC"},
-        "paymentTypes": ["CASH"],
-        "pagination": {"size": 100},
-    }
-
-    inventory_uri = "/aec-cp-discovery-api/p/v1/vehicles/search"
-    facets_uri = "/aec-cp-discovery-api/p/v1/vehicles/facets"
-
-    async with AsyncHTTPClient(
-        base_url=gmc_base_url, timeout_value=30.0, verify=verify_ssl
-    ) as http:
-        i = await http.post(uri=inventory_uri, headers=headers, post_data=post_data)
-        f = await http.post(uri=facets_uri, headers=headers, post_data={})
-
-        try:
-            inventory = i.json()
-        except ValueError:
-            return error_response(error_message=generic_error_message)
-
-        try:
-            all_hits = list(inventory["data"]["hits"])
-        except KeyError:
-            try:
-                inventory["errorDetails"]["key"]
-                return send_response(response_data={})
-            except Exception:
-                return error_response(
-                    error_message=generic_error_message,
-                    error_data=inventory,
-                    status_code=500,
-                )
-
-        # The GMC API caps page size at 20. Fetch remaining pages via cursor token
-        # until all vehicles matching the search have been collected.
-        while next_token := (
-            inventory.get("data", {}).get("pagination", {}).get("nextPageToken")
-        ):
-            page_post_data = {
-                **post_data,
-                "pagination": {
-                    **post_data["pagination"],
-                    "nextPageToken": next_token,
-                },
-            }
-            page = await http.post(
-                uri=inventory_uri, headers=headers, post_data=page_post_data
-            )
-            try:
-                inventory = page.json()
-                all_hits.extend(inventory.get("data", {}).get("hits", []))
-            except ValueError:
-                break
-
-    inventory["data"]["hits"] = all_hits
+        verify=verify_ssl,
+    )
 
-    try:
-        inventory["facets"] = f.json()
-    except ValueError, AttributeError:
-        pass
+    if not inventory:
+        return send_response(response_data={})
 
-    _log_unknown_trims(all_hits, req)
+    _log_unknown_trims(inventory["data"]["hits"], req)
 
     return send_response(response_data=inventory, cache_control_age=3600)
 
 
 @router.get("/vin/gmc")
+@cache_response("gmc-vin", ttl=3600)
 async def get_gmc_vin_detail(req: Request) -> dict:
     # TODO: Update this endpoint to the new GMC API once the VIN detail endpoint is identified
     _vin_base_url = "https://cws.gm.com"
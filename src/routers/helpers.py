@@ -2,8 +2,11 @@ import os
 
 from fastapi import APIRouter, Path
 
+from src.libs.cache import response_cache
 from src.libs.http import AsyncHTTPClient
+from src.libs.http_pool import client_registry
 from src.libs.responses import error_response, send_response
+from src.libs.retry import retry_budget
 
 router = APIRouter(prefix="/api")
 verify_ssl = True
@@ -43,6 +46,36 @@ async def get_manufacturer_inventory():
     return send_response(v)
 
 
+@router.get("/cache/stats")
+async def get_response_cache_stats():
+    """Returns the hit, miss and size counters for the inventory response cache."""
+    return send_response(response_cache.stats(), cache_control_age=0)
+
+
+@router.get("/retry/stats")
+async def get_retry_budget_stats():
+    """Returns the remaining balance and the retry counters of the retry budget."""
+    return send_response(retry_budget.stats(), cache_control_age=0)
+
+
+@router.get("/circuit/stats")
+async def get_circuit_stats():
+    """Returns the circuit state and counters of each manufacturer API requested."""
+    return send_response(client_registry.circuit_stats(), cache_control_age=0)
+
+
+@router.get("/limiter/stats")
+async def get_limiter_stats():
+    """Returns the request and queue wait counters of each manufacturer API requested."""
+    return send_response(client_registry.limiter_stats(), cache_control_age=0)
+
+
+@router.get("/hedge/stats")
+async def get_hedge_stats():
+    """Returns the request, hedge and hedge win counters of each hedged manufacturer."""
+    return send_response(client_registry.hedge_stats(), cache_control_age=0)
+
+
 @router.get("/test/error/{status_code}")
 def send_error_response(
     status_code: int = Path(
@@ -1,8 +1,14 @@
+import httpx
 from fastapi import APIRouter, Depends, Request
 
+from src.libs.cache import cache_response
+from src.libs.coalesce import coalesce_requests
 from src.libs.common_query_params import CommonInventoryQueryParams
-from src.libs.http import AsyncHTTPClient
+from src.libs.http import AsyncHTTPClient, BodyTemplate
+from src.libs.http_pool import client_registry
+from src.libs.projection import VehicleProjection
 from src.libs.responses import error_response, send_response
+from src.libs.retry import RetryPolicy
 
 router = APIRouter(prefix="/api")
 verify_ssl = True
@@ -26,9 +32,19 @@ hyundai_model_codes = {
 # The BSI search API caps the page size at 30 regardless of the requested value.
 bsi_page_size = 30
 
+# Dense searches fan out one BSI request per page of 30 vehicles, so keep enough warm
+# connections for a full fan-out to reuse. BSI search POSTs change nothing, so are
+# safe to retry.
+client_registry.configure(
+    bsi_base_url,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+    retry_policy=RetryPolicy(methods=("get", "post")),
+)
+
 # Each BSI vehicle record carries large blobs the inventory UI never uses (full
 # spec sheets, feature lists, 360 image sets). Project each record down to just the
-# fields the UI renders to keep response sizes small.
+# fields the UI renders to keep response sizes small. The blobs are skipped while
+# decoding, see src.libs.projection.
 bsi_vehicle_fields = (
     "vin",
     "modelYear",
@@ -50,16 +66,12 @@ bsi_vehicle_fields = (
 )
 
 
-def slim_vehicle(vehicle: dict) -> dict:
-    """Project a BSI vehicle record down to the fields the inventory UI renders.
-
-    Args:
-        vehicle: A single vehicle record from the BSI search response.
-
-    Returns:
-        A dict containing only the fields in bsi_vehicle_fields that are present.
-    """
-    return {key: vehicle[key] for key in bsi_vehicle_fields if key in vehicle}
+bsi_vehicles = VehicleProjection(
+    "HyundaiVehicle",
+    fields=bsi_vehicle_fields,
+    path=("data", "items"),
+    keep=("totalPages",),
+)
 
 
 def normalize_model(model: str) -> str:
@@ -78,6 +90,8 @@ def normalize_model(model: str) -> str:
 
 
 @router.get("/inventory/hyundai")
+@coalesce_requests("hyundai")
+@cache_response("hyundai", ttl=900, stale_ttl=2700)
 async def get_hyundai_inventory(
     req: Request, req_params: CommonInventoryQueryParams = Depends()
 ) -> dict:
@@ -97,16 +111,19 @@ async def get_hyundai_inventory(
         "Referer": f"{hyundai_base_url}/",
     }
 
-    def build_body(page: int) -> dict:
-        return {
+    # Only the page number differs between pages, so the body is encoded once
+    search_body = BodyTemplate(
+        {
             "zipCode": req_params.zip,
             "distance": req_params.radius,
-            "page": page,
+            "page": 1,
             "pageSize": bsi_page_size,
             "modelYear": [req_params.year] if req_params.year else [],
             "modelName": [{"code": model_code, "trims": []}],
             "sort": {"attributeName": "distance", "order": "asc"},
-        }
+        },
+        page=("page",),
+    )
 
     # Make a call to the Hyundai BSI search API
     async with AsyncHTTPClient(
@@ -115,17 +132,17 @@ async def get_hyundai_inventory(
         first = await http.post(
             uri="/inventory/item/v2/search",
             headers=headers,
-            post_data=build_body(1),
+            post_data=search_body.render(page=1),
         )
         try:
-            payload = first.json()
+            payload = await http.decode(first, projection=bsi_vehicles)
         except ValueError:
             return error_response(
                 error_message=f"An error occurred with the Hyundai API: {first.text}"
             )
 
         data = payload.get("data") or {}
-        vehicles = [slim_vehicle(v) for v in data.get("items") or []]
+        vehicles = data.get("items") or []
         total_pages = data.get("totalPages") or 1
 
         # Fetch any remaining pages in parallel. The API caps pageSize at 30, so a
@@ -134,7 +151,7 @@ async def get_hyundai_inventory(
         # every page at once.
         if total_pages > 1:
             urls_to_fetch = [
-                ["/inventory/item/v2/search", headers, build_body(page)]
+                ["/inventory/item/v2/search", headers, search_body.render(page=page)]
                 for page in range(2, total_pages + 1)
             ]
             remainder = await http.post(uri=urls_to_fetch)
@@ -145,10 +162,10 @@ async def get_hyundai_inventory(
 
             for api_result in remainder:
                 try:
-                    page_data = api_result.json().get("data") or {}
+                    page = await http.decode(api_result, projection=bsi_vehicles)
                 except AttributeError, ValueError:
                     continue
-                vehicles.extend(slim_vehicle(v) for v in page_data.get("items") or [])
+                vehicles.extend((page.get("data") or {}).get("items") or [])
 
     # If no vehicles were returned, there is no inventory. Return an empty dict
     # response which the UI uses to display the no inventory message. This most
@@ -161,6 +178,7 @@ async def get_hyundai_inventory(
 
 @router.get("/vin")
 @router.get("/vin/hyundai")
+@cache_response("hyundai-vin", ttl=3600)
 async def get_hyundai_vin_detail(req: Request) -> dict:
     # Make a call to the Hyundai API
     async with AsyncHTTPClient(
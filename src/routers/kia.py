@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Depends, Request
 
+from src.libs.cache import cache_response
+from src.libs.coalesce import coalesce_requests
 from src.libs.common_query_params import CommonInventoryQueryParams
 from src.libs.http import AsyncHTTPClient
 from src.libs.responses import error_response, send_response
@@ -18,6 +20,8 @@ kia_series_codes = {
 
 
 @router.get("/inventory/kia")
+@coalesce_requests("kia")
+@cache_response("kia", ttl=900, stale_ttl=2700)
 async def get_kia_inventory(
     req: Request, common_params: CommonInventoryQueryParams = Depends()
 ) -> dict:
@@ -53,7 +57,7 @@ async def get_kia_inventory(
         )
 
         try:
-            data = inv.json()
+            data = await http.decode(inv)
         except ValueError:
             # A search for a year/model the Kia API does not recognize returns a 200
             # with a non-JSON error string rather than inventory. Treat it as no
@@ -70,6 +74,7 @@ async def get_kia_inventory(
 
 
 @router.get("/vin/kia")
+@cache_response("kia-vin", ttl=3600)
 async def get_kia_vin_detail(req: Request) -> dict:
     """Makes a request to the Kia VIN detail API and returns the full detail for a
     single vehicle. The inventory API returns a slim record per vehicle, so the rich
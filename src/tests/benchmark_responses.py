@@ -0,0 +1,127 @@
+"""Compare the time to encode inventory responses with JSONResponse (the standard
+library encoder) and FastJSONResponse (src.libs.jsonlib).
+
+The payloads are synthetic, shaped like large Audi, BMW and Ford inventory responses.
+
+    python -m src.tests.benchmark_responses
+"""
+
+import timeit
+
+from fastapi.responses import JSONResponse
+
+from src.libs.jsonlib import json_backend
+from src.libs.responses import FastJSONResponse
+
+
+def audi_payload(cars: int = 600) -> dict:
+    return {
+        "data": {
+            "stockCarSearch": {
+                "resultNumber": cars,
+                "results": {
+                    "cars": [
+                        {
+                            "stockCar": {
+                                "id": f"car-{n}",
+                                "vin": f"WA1AAAGE{n:09d}",
+                                "titleText": "Audi Q8 e-tron 55 Premium quattro",
+                                "dealer": {"id": f"{n % 40}", "name": "Audi Dealer"},
+                                "colorInfo": {
+                                    "exteriorColor": {
+                                        "label": "Exterior",
+                                        "colorInfo": {
+                                            "text": "Glacier White",
+                                            "code": "2Y",
+                                        },
+                                    }
+                                },
+                                "techDataGroups": [
+                                    {
+                                        "id": "range",
+                                        "label": "Range",
+                                        "techDataList": [
+                                            {"id": f"t{t}", "text": f"{t * 13} mi"}
+                                            for t in range(6)
+                                        ],
+                                    }
+                                ],
+                                "__typename": "StockCar",
+                            }
+                        }
+                        for n in range(cars)
+                    ]
+                },
+            }
+        }
+    }
+
+
+def bmw_payload(vehicles: int = 2000) -> dict:
+    return {
+        "data": {
+            "getInventory": {
+                "numberOfFilteredVehicles": vehicles,
+                "result": [
+                    {
+                        "vin": f"WBY73AW0{n:09d}",
+                        "name": "i4 eDrive40 Gran Coupe",
+                        "modelYear": 2025,
+                        "totalMsrp": 57900 + n,
+                        "distanceToLocatorZip": n * 0.7,
+                        "series": {"name": "i4", "code": "I4"},
+                        "options": [
+                            {"name": f"Option {o}", "isPaint": o == 0}
+                            for o in range(12)
+                        ],
+                    }
+                    for n in range(vehicles)
+                ],
+            }
+        }
+    }
+
+
+def ford_payload(vehicles: int = 1000) -> dict:
+    return {
+        "data": {
+            "filterResults": {
+                "ExactMatch": {
+                    "totalCount": vehicles,
+                    "vehicles": [
+                        {
+                            "vin": f"1FTVW1EL{n:09d}",
+                            "modelYear": "2025",
+                            "model": "F-150 Lightning",
+                            "trim": "Flash",
+                            "dealerPaCode": f"{n % 50:05d}",
+                            "pricing": {"msrp": 69995.0, "finalPrice": 65995.0},
+                            "features": [f"Feature {f}" for f in range(10)],
+                        }
+                        for n in range(vehicles)
+                    ],
+                }
+            }
+        }
+    }
+
+
+def main(number: int = 20) -> None:
+    print(f"JSON backend: {json_backend}")
+    for name, payload in (
+        ("Audi", audi_payload()),
+        ("BMW", bmw_payload()),
+        ("Ford", ford_payload()),
+    ):
+        size = len(FastJSONResponse(payload).body)
+        stdlib = timeit.timeit(lambda: JSONResponse(payload), number=number) / number
+        fast = timeit.timeit(lambda: FastJSONResponse(payload), number=number) / number
+        print(
+            f"{name:5} {size / 1024:8.0f} KiB"
+            f"  JSONResponse {stdlib * 1000:7.2f} ms"
+            f"  FastJSONResponse {fast * 1000:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
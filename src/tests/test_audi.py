@@ -3,6 +3,7 @@ from faker import Faker
 from fastapi.testclient import TestClient
 
 from src.main import app
+from src.routers.audi import _STOCK_CAR_SEARCH_QUERIES, page_variables
 from src.tests.test_helpers import program_vcr
 
 client = TestClient(app)
@@ -165,3 +166,25 @@ def test_audi_vin_detail():
     assert "vin" in stock_car
     assert "titleText" in stock_car
     assert "colorInfo" in stock_car
+
+
+def test_audi_page_variables():
+    """Page variables replace the paging without modifying the shared variables"""
+    variables = {
+        "stockIdentifier": {"stockCarsType": "NEW"},
+        "searchParameter": {"paging": {"limit": 12, "offset": 0}, "criteria": []},
+    }
+
+    page = page_variables(variables, offset=48, limit=24)
+
+    assert page["searchParameter"]["paging"] == {"limit": 24, "offset": 48}
+    assert variables["searchParameter"]["paging"] == {"limit": 12, "offset": 0}
+    assert page["stockIdentifier"] is variables["stockIdentifier"]
+
+
+def test_audi_query_profiles():
+    """The results list query leaves out fields only the VIN detail page uses"""
+    assert "images(" not in _STOCK_CAR_SEARCH_QUERIES["list"]
+    assert "$imageIds" not in _STOCK_CAR_SEARCH_QUERIES["list"]
+    assert "images(" in _STOCK_CAR_SEARCH_QUERIES["detail"]
+    assert "techDataGroups" in _STOCK_CAR_SEARCH_QUERIES["detail"]
@@ -3,6 +3,7 @@ from faker import Faker
 from fastapi.testclient import TestClient
 
 from src.main import app
+from src.routers.bmw import _VEHICLE_FIELDS
 from src.tests.test_helpers import program_vcr
 
 client = TestClient(app)
@@ -224,3 +225,11 @@ def test_bmw_error_handling_invalid_model():
 
     # Should return 422 validation error
     assert r.status_code == 422
+
+
+def test_bmw_vehicle_field_profiles():
+    """The results list query leaves out fields only the VIN detail page uses"""
+    assert "cosy" not in _VEHICLE_FIELDS["list"]
+    assert "cosy" in _VEHICLE_FIELDS["detail"]
+    for profile in _VEHICLE_FIELDS.values():
+        assert profile.count("{") == profile.count("}")
@@ -0,0 +1,411 @@
+import asyncio
+import gzip
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from src.libs.cache import (
+    CacheEntry,
+    MemoryBackend,
+    RedisBackend,
+    ResponseCache,
+    cache_response,
+    create_backend,
+    encode_command,
+    read_reply,
+    refresh_in_background,
+    response_cache,
+)
+from src.libs.circuit import CircuitOpenError
+from src.libs.compression import accepted_encodings, decompress, supported_encodings
+from src.libs.responses import error_response
+
+inventory = {"vehicles": [{"vin": f"KM8KRDAF1PU{n:06d}"} for n in range(500)]}
+
+
+def build_request(query_string: bytes, accept_encoding: bytes | None = None) -> Request:
+    headers = [(b"accept-encoding", accept_encoding)] if accept_encoding else []
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/inventory/test",
+            "headers": headers,
+            "query_string": query_string,
+        }
+    )
+
+
+@pytest.fixture
+async def redis_standin():
+    """A minimal in-memory stand-in for a Redis server, implementing just enough of
+    the protocol (GET, SET with PX, FLUSHDB) for the RedisBackend tests.
+    """
+    store = {}
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                command = await read_reply(reader)
+                name = command[0].upper()
+                if name == b"GET":
+                    value = store.get(command[1])
+                    writer.write(
+                        b"$-1\r\n"
+                        if value is None
+                        else b"$%d\r\n%s\r\n" % (len(value), value)
+                    )
+                elif name == b"SET":
+                    store[command[1]] = command[2]
+                    writer.write(b"+OK\r\n")
+                elif name == b"FLUSHDB":
+                    store.clear()
+                    writer.write(b"+OK\r\n")
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    yield f"redis://127.0.0.1:{port}/0", store
+    server.close()
+
+
+def test_cache_entry_round_trips_response():
+    original = JSONResponse(content={"status": "SUCCESS"}, headers={"X-Test": "1"})
+    restored = CacheEntry.loads(CacheEntry.from_response(original).dumps())
+
+    response = restored.to_response()
+    assert response.body == original.body
+    assert response.status_code == 200
+    assert response.headers["x-test"] == "1"
+    assert response.headers["content-type"] == "application/json"
+
+
+def test_cache_entry_stores_compressed_body():
+    body = b'{"vehicles": [' + b'{"vin": "KM8KRDAF1PU000000"},' * 500 + b"{}]}"
+    entry = CacheEntry(body=body, status_code=200, raw_headers=[])
+
+    assert len(entry.dumps()) < len(body) / 10
+
+
+def test_cache_entry_serves_precompressed_bodies():
+    original = JSONResponse(content=inventory, headers={"X-Test": "1"})
+    restored = CacheEntry.loads(CacheEntry.from_response(original).dumps())
+
+    for accept_encoding in ("gzip", "gzip, deflate, br"):
+        response = restored.to_response(accept_encoding)
+        encoding = response.headers["content-encoding"]
+        preferred = supported_encodings[0] if "br" in accept_encoding else "gzip"
+        assert encoding == preferred
+        assert decompress(response.body, encoding) == original.body
+        assert response.headers["content-length"] == str(len(response.body))
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["x-test"] == "1"
+
+    identity = restored.to_response("br;q=0, gzip;q=0")
+    assert "content-encoding" not in identity.headers
+    assert identity.body == original.body
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate, br;q=0.9") == {"gzip", "deflate", "br"}
+    assert accepted_encodings("br;q=0, gzip;q=0.5") == {"gzip"}
+    assert accepted_encodings("") == set()
+
+
+def test_create_backend_selects_backend_from_url():
+    assert isinstance(create_backend(None), MemoryBackend)
+    assert isinstance(create_backend("redis://10.0.0.3:6379/1"), RedisBackend)
+
+
+@pytest.mark.anyio
+async def test_response_cache_hit_and_miss_counters():
+    cache = ResponseCache(backend=MemoryBackend(max_bytes=10_000))
+    entry = CacheEntry(body=b"payload", status_code=200, raw_headers=[])
+
+    assert await cache.get("missing") is None
+    await cache.set("key", entry, ttl=60.0)
+    assert (await cache.get("key")).body == b"payload"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+@pytest.mark.anyio
+async def test_memory_backend_entries_expire():
+    backend = MemoryBackend(max_bytes=10_000)
+
+    with patch("src.libs.cache.time.monotonic", return_value=1000.0):
+        await backend.set("key", b"payload", ttl=60.0)
+
+    with patch("src.libs.cache.time.monotonic", return_value=1059.0):
+        assert await backend.get("key") == b"payload"
+
+    with patch("src.libs.cache.time.monotonic", return_value=1060.0):
+        assert await backend.get("key") is None
+
+    assert len(backend) == 0
+    assert backend.stats()["bytes"] == 0
+
+
+@pytest.mark.anyio
+async def test_memory_backend_evicts_least_recently_used_by_size():
+    backend = MemoryBackend(max_bytes=200)
+
+    await backend.set("a", b"a" * 100, ttl=60.0)
+    await backend.set("b", b"b" * 100, ttl=60.0)
+    # Touch "a" so "b" becomes the least recently used entry
+    await backend.get("a")
+    await backend.set("c", b"c" * 100, ttl=60.0)
+
+    assert await backend.get("a") is not None
+    assert await backend.get("b") is None
+    assert await backend.get("c") is not None
+    assert backend.stats()["evictions"] == 1
+    assert backend.stats()["bytes"] <= backend.max_bytes
+
+
+@pytest.mark.anyio
+async def test_memory_backend_skips_values_larger_than_the_cache():
+    backend = MemoryBackend(max_bytes=50)
+    await backend.set("small", b"s", ttl=60.0)
+    await backend.set("huge", b"h" * 1000, ttl=60.0)
+
+    assert await backend.get("huge") is None
+    assert await backend.get("small") == b"s"
+
+
+@pytest.mark.anyio
+async def test_redis_backend_get_and_set(redis_standin):
+    url, store = redis_standin
+    backend = RedisBackend(url)
+
+    assert await backend.get("key") is None
+    await backend.set("key", b"payload\r\nwith separators", ttl=60.0)
+    assert await backend.get("key") == b"payload\r\nwith separators"
+    assert backend.errors == 0
+
+    await backend.clear()
+    assert store == {}
+
+
+@pytest.mark.anyio
+async def test_redis_backend_shared_between_instances(redis_standin):
+    """Entries written by one API instance are served to another"""
+    url, _ = redis_standin
+    first_instance = ResponseCache(backend=RedisBackend(url))
+    second_instance = ResponseCache(backend=RedisBackend(url))
+
+    entry = CacheEntry(body=b'{"status":"SUCCESS"}', status_code=200, raw_headers=[])
+    await first_instance.set("hyundai?zip=90210", entry, ttl=60.0)
+
+    cached = await second_instance.get("hyundai?zip=90210")
+    assert cached.body == b'{"status":"SUCCESS"}'
+
+
+@pytest.mark.anyio
+async def test_redis_backend_unavailable_is_a_miss():
+    # Nothing listens on port 1, so every command fails to connect
+    backend = RedisBackend("redis://127.0.0.1:1/0", timeout=0.2)
+
+    assert await backend.get("key") is None
+    await backend.set("key", b"payload", ttl=60.0)
+    assert backend.errors == 2
+
+
+@pytest.mark.anyio
+async def test_redis_backend_closes_connection_on_failed_setup():
+    disconnected = asyncio.Event()
+
+    async def never_answer(reader, writer):
+        # Reads AUTH but never replies, until the client hangs up
+        await reader.read()
+        disconnected.set()
+        writer.close()
+
+    server = await asyncio.start_server(never_answer, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    backend = RedisBackend(f"redis://:secret@127.0.0.1:{port}/0", timeout=0.1)
+
+    assert await backend.get("key") is None
+    assert backend.errors == 1
+    await asyncio.wait_for(disconnected.wait(), 1.0)
+    server.close()
+
+
+def test_redis_backend_stats_omit_the_server_location():
+    backend = RedisBackend("redis://10.0.0.3:6379/1")
+
+    assert backend.stats() == {"backend": "redis", "errors": 0}
+
+
+def test_encode_command():
+    assert encode_command(b"GET", b"key") == b"*2\r\n$3\r\nGET\r\n$3\r\nkey\r\n"
+
+
+@pytest.mark.anyio
+async def test_cache_response_decorator_skips_upstream_on_hit():
+    await response_cache.clear()
+    calls = 0
+
+    @cache_response("test", ttl=60.0)
+    async def endpoint(req: Request):
+        nonlocal calls
+        calls += 1
+        return JSONResponse(content={"calls": calls})
+
+    first = await endpoint(req=build_request(b"vin=1"))
+    second = await endpoint(req=build_request(b"vin=1"))
+    other = await endpoint(req=build_request(b"vin=2"))
+
+    assert calls == 2
+    assert first.body == second.body == b'{"calls":1}'
+    assert other.body == b'{"calls":2}'
+
+
+@pytest.mark.anyio
+async def test_cache_response_decorator_sends_compressed_bodies():
+    await response_cache.clear()
+
+    @cache_response("test", ttl=60.0)
+    async def endpoint(req: Request):
+        return JSONResponse(content=inventory)
+
+    miss = await endpoint(req=build_request(b"vin=1", accept_encoding=b"gzip"))
+    hit = await endpoint(req=build_request(b"vin=1", accept_encoding=b"gzip"))
+    plain = await endpoint(req=build_request(b"vin=1"))
+
+    assert miss.headers["content-encoding"] == hit.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(miss.body) == gzip.decompress(hit.body) == plain.body
+    assert "content-encoding" not in plain.headers
+
+
+@pytest.mark.anyio
+async def test_cache_response_decorator_does_not_cache_errors():
+    await response_cache.clear()
+    calls = 0
+
+    @cache_response("test", ttl=60.0)
+    async def endpoint(req: Request):
+        nonlocal calls
+        calls += 1
+        return error_response(error_message="Upstream failed")
+
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await endpoint(req=build_request(b"vin=1"))
+
+    assert calls == 2
+
+
+@pytest.mark.anyio
+async def test_cache_response_serves_stale_while_revalidating():
+    await response_cache.clear()
+    calls = 0
+    upstream_released = asyncio.Event()
+
+    @cache_response("test", ttl=60.0, stale_ttl=600.0)
+    async def endpoint(req: Request):
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            # Simulate a slow manufacturer API on refresh
+            await upstream_released.wait()
+        return JSONResponse(content={"calls": calls})
+
+    with patch("src.libs.cache.time.time", return_value=1000.0):
+        await endpoint(req=build_request(b"vin=1"))
+
+    # Past the soft TTL, the stale entry is served without waiting on upstream
+    with patch("src.libs.cache.time.time", return_value=1100.0):
+        stale = await asyncio.wait_for(endpoint(req=build_request(b"vin=1")), 1.0)
+        assert stale.body == b'{"calls":1}'
+
+        # Only one background refresh is started for a key
+        await endpoint(req=build_request(b"vin=1"))
+        await asyncio.sleep(0.01)
+        assert calls == 2
+
+        upstream_released.set()
+        await asyncio.sleep(0.01)
+
+        refreshed = await endpoint(req=build_request(b"vin=1"))
+        assert refreshed.body == b'{"calls":2}'
+
+    assert response_cache.stats()["staleHits"] >= 2
+
+
+@pytest.mark.anyio
+async def test_cache_response_blocks_after_hard_ttl():
+    await response_cache.clear()
+    calls = 0
+
+    @cache_response("test", ttl=60.0, stale_ttl=60.0)
+    async def endpoint(req: Request):
+        nonlocal calls
+        calls += 1
+        return JSONResponse(content={"calls": calls})
+
+    with patch("src.libs.cache.time.monotonic", return_value=1000.0):
+        await endpoint(req=build_request(b"vin=1"))
+
+    # The backend expires the entry once both the fresh and stale periods have passed
+    with patch("src.libs.cache.time.monotonic", return_value=1120.0):
+        response = await endpoint(req=build_request(b"vin=1"))
+
+    assert calls == 2
+    assert response.body == b'{"calls":2}'
+
+
+@pytest.mark.anyio
+async def test_cache_response_failed_refresh_keeps_stale_entry():
+    await response_cache.clear()
+    calls = 0
+
+    @cache_response("test", ttl=60.0, stale_ttl=600.0)
+    async def endpoint(req: Request):
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            return error_response(error_message="Upstream failed")
+        return JSONResponse(content={"calls": calls})
+
+    with patch("src.libs.cache.time.time", return_value=1000.0):
+        await endpoint(req=build_request(b"vin=1"))
+
+    with patch("src.libs.cache.time.time", return_value=1100.0):
+        await endpoint(req=build_request(b"vin=1"))
+        await asyncio.sleep(0.01)
+        response = await endpoint(req=build_request(b"vin=1"))
+
+    assert response.body == b'{"calls":1}'
+    assert response_cache.stats()["refreshErrors"] >= 1
+
+
+@pytest.mark.anyio
+async def test_refresh_keeps_stale_entry_while_circuit_open():
+    await response_cache.clear()
+    entry = CacheEntry.from_response(JSONResponse(content={"calls": 1}))
+
+    async def fetch():
+        raise CircuitOpenError("https://down.example.com", retry_after=30)
+
+    with patch("src.libs.cache.time.monotonic", return_value=1000.0):
+        await response_cache.set("test:vin=1", entry, ttl=120.0)
+    with patch("src.libs.cache.time.monotonic", return_value=1100.0):
+        await refresh_in_background(
+            "test:vin=1", fetch, ttl=120.0, stale=entry, stale_ttl=60.0
+        )
+
+    # Past the entry's original expiry, it is still served
+    with patch("src.libs.cache.time.monotonic", return_value=1150.0):
+        kept = await response_cache.get("test:vin=1")
+
+    assert kept.body == b'{"calls":1}'
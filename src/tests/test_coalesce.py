@@ -0,0 +1,237 @@
+import asyncio
+import gzip
+
+import pytest
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from src.libs.coalesce import (
+    SingleFlight,
+    clone_response,
+    coalesce_requests,
+    request_key,
+)
+from src.libs.common_query_params import CommonInventoryQueryParams
+from src.libs.deadline import (
+    DeadlineExceeded,
+    remaining,
+    request_deadline_seconds,
+    set_deadline,
+)
+from src.libs.responses import EncodedResponse
+
+
+def build_request(query_string: bytes) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/inventory/test",
+            "headers": [],
+            "query_string": query_string,
+        }
+    )
+
+
+def build_common_params(zip_code=90210, year=2025, radius=100, model="Ioniq 5"):
+    return CommonInventoryQueryParams(
+        zip=zip_code, year=year, radius=radius, model=model
+    )
+
+
+@pytest.mark.anyio
+async def test_single_flight_runs_concurrent_calls_once():
+    """Concurrent calls with the same key share a single execution"""
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"calls": calls}
+
+    results = await asyncio.gather(*[flights.do("key", fetch) for _ in range(10)])
+
+    assert calls == 1
+    assert all(result == {"calls": 1} for result in results)
+    assert not flights.in_flight("key")
+
+
+@pytest.mark.anyio
+async def test_single_flight_separates_keys():
+    """Calls with different keys are not coalesced"""
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    results = await asyncio.gather(
+        flights.do("a", lambda: fetch("a")),
+        flights.do("b", lambda: fetch("b")),
+    )
+
+    assert results == ["a", "b"]
+    assert sorted(calls) == ["a", "b"]
+
+
+@pytest.mark.anyio
+async def test_single_flight_shares_exceptions():
+    """Every coalesced caller receives the exception raised by the shared call"""
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    results = await asyncio.gather(
+        flights.do("key", fetch), flights.do("key", fetch), return_exceptions=True
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert not flights.in_flight("key")
+
+
+@pytest.mark.anyio
+async def test_single_flight_runs_again_after_completion():
+    """A completed call is not reused by later callers"""
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert await flights.do("key", fetch) == 1
+    assert await flights.do("key", fetch) == 2
+
+
+@pytest.mark.anyio
+async def test_single_flight_callers_keep_their_own_deadlines():
+    """The shared call isn't cut short by the first caller's deadline, and each
+    caller gives up at its own
+    """
+    flights = SingleFlight()
+    finished = asyncio.Event()
+    budgets = []
+
+    async def fetch():
+        budgets.append(remaining())
+        await asyncio.sleep(0.1)
+        finished.set()
+        return "inventory"
+
+    async def call(deadline):
+        # Each caller sets its deadline in a task of its own, as for a request
+        if deadline is not None:
+            set_deadline(deadline)
+        return await flights.do("key", fetch)
+
+    hurried, patient = await asyncio.gather(
+        asyncio.create_task(call(0.02)),
+        asyncio.create_task(call(None)),
+        return_exceptions=True,
+    )
+
+    assert isinstance(hurried, DeadlineExceeded)
+    assert patient == "inventory"
+    assert finished.is_set()
+    assert budgets[0] > request_deadline_seconds - 1
+
+
+def test_request_key_uses_normalized_common_params():
+    """The key is built from the validated query params, not the raw query string"""
+    padded = request_key(
+        "hyundai",
+        {
+            "req": build_request(b"zip=00501&year=2025&radius=100&model=Ioniq+5"),
+            "common_params": build_common_params(zip_code=501),
+        },
+    )
+    unpadded = request_key(
+        "hyundai",
+        {
+            "req": build_request(b"model=Ioniq+5&radius=100&year=2025&zip=501"),
+            "common_params": build_common_params(zip_code=501),
+        },
+    )
+
+    assert padded == unpadded
+    assert padded == "hyundai?model=Ioniq+5&radius=100&year=2025&zip=00501"
+
+
+def test_request_key_includes_manufacturer_and_extra_params():
+    """Extra query params and the manufacturer distinguish otherwise equal keys"""
+    common_params = build_common_params(model="etron")
+    west = request_key(
+        "audi",
+        {"req": build_request(b"geo=34.0_-118.3"), "common_params": common_params},
+    )
+    east = request_key(
+        "audi",
+        {"req": build_request(b"geo=40.7_-74.0"), "common_params": common_params},
+    )
+    other_brand = request_key(
+        "bmw",
+        {"req": build_request(b"geo=34.0_-118.3"), "common_params": common_params},
+    )
+
+    assert len({west, east, other_brand}) == 3
+
+
+def test_clone_response_copies_headers():
+    """Editing the headers of a cloned response leaves the original untouched"""
+    original = JSONResponse(content={"status": "SUCCESS"}, headers={"X-Test": "1"})
+    clone = clone_response(original)
+    clone.headers["Content-Encoding"] = "gzip"
+
+    assert clone.body == original.body
+    assert "content-encoding" not in original.headers
+    assert clone.headers["x-test"] == "1"
+
+
+@pytest.mark.anyio
+async def test_coalesce_requests_decorator():
+    """Concurrent identical requests to a decorated endpoint fetch once"""
+    calls = 0
+
+    @coalesce_requests("test")
+    async def endpoint(req: Request, common_params: CommonInventoryQueryParams):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return JSONResponse(content={"calls": calls})
+
+    responses = await asyncio.gather(
+        *[
+            endpoint(
+                req=build_request(b"zip=90210&year=2025&radius=100&model=Ioniq+5"),
+                common_params=build_common_params(),
+            )
+            for _ in range(5)
+        ]
+    )
+
+    assert calls == 1
+    assert len({id(response) for response in responses}) == 5
+    assert all(response.body == b'{"calls":1}' for response in responses)
+
+
+def test_clone_response_negotiates_encoded_responses():
+    """Callers sharing a precompressed response each get the coding they accept"""
+    body = JSONResponse(content={"vins": list(range(1000))}).body
+    shared = EncodedResponse(
+        {"gzip": gzip.compress(body)}, status_code=200, raw_headers=[]
+    )
+
+    compressed = clone_response(shared, accept_encoding="gzip, deflate")
+    identity = clone_response(shared)
+
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(compressed.body) == body
+    assert identity.body == body
+    assert "content-encoding" not in identity.headers
@@ -0,0 +1,111 @@
+import gzip
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from src.libs.compression import (
+    CompressionMiddleware,
+    compression_levels,
+    encoding_weights,
+    levels_for,
+    preferred_encoding,
+    supported_encodings,
+)
+
+inventory = {"vehicles": [{"vin": f"1FTVW1EL{n:09d}"} for n in range(500)]}
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
+
+
+@app.get("/api/inventory/test")
+async def large():
+    return JSONResponse(content=inventory)
+
+
+@app.get("/api/small")
+async def small():
+    return JSONResponse(content={"status": "SUCCESS"})
+
+
+@app.get("/api/encoded")
+async def encoded():
+    return Response(
+        content=gzip.compress(b"{}" * 1000),
+        media_type="application/json",
+        headers={"Content-Encoding": "gzip"},
+    )
+
+
+client = TestClient(app)
+
+
+@pytest.mark.parametrize("encoding", supported_encodings)
+def test_compression_middleware_negotiates_encoding(encoding):
+    response = client.get("/api/inventory/test", headers={"Accept-Encoding": encoding})
+
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == inventory
+
+
+@pytest.mark.parametrize("offload_bytes", [128 * 1024, 0])
+def test_compression_middleware_prefers_the_best_coding(offload_bytes):
+    with patch("src.libs.compression.compress_offload_bytes", offload_bytes):
+        response = client.get(
+            "/api/inventory/test",
+            headers={"Accept-Encoding": "gzip, deflate, br, zstd"},
+        )
+
+    assert response.headers["content-encoding"] == supported_encodings[0]
+    assert response.json() == inventory
+
+
+def test_compression_middleware_skips_small_and_encoded_bodies():
+    small = client.get("/api/small", headers={"Accept-Encoding": "gzip"})
+    encoded = client.get("/api/encoded", headers={"Accept-Encoding": "br, gzip"})
+
+    assert "content-encoding" not in small.headers
+    assert encoded.headers["content-encoding"] == "gzip"
+    assert encoded.content == b"{}" * 1000
+
+
+def test_levels_for_route():
+    assert levels_for("/api/liveness") == compression_levels
+    assert levels_for("/api/inventory/bmw")["br"] > compression_levels["br"]
+
+
+def test_encoding_weights():
+    assert encoding_weights("gzip, br;q=0.9, zstd; q=0") == {
+        "gzip": 1.0,
+        "br": 0.9,
+        "zstd": 0.0,
+    }
+    assert encoding_weights("gzip;q=high, br;level=5;q=0.5") == {
+        "gzip": 1.0,
+        "br": 0.5,
+    }
+
+
+@patch("src.libs.compression.supported_encodings", ("br", "zstd", "gzip"))
+def test_preferred_encoding_skips_refused_codings():
+    everything = ("br", "zstd", "gzip")
+
+    assert preferred_encoding("br;q=0, gzip", everything) == "gzip"
+    assert preferred_encoding("*, br;q=0", everything) == "zstd"
+    assert preferred_encoding("*;q=0", everything) == "identity"
+    assert preferred_encoding("gzip;q=0", everything) == "identity"
+
+
+@patch("src.libs.compression.supported_encodings", ("br", "zstd", "gzip"))
+def test_preferred_encoding_follows_weights():
+    everything = ("br", "zstd", "gzip")
+
+    assert preferred_encoding("br;q=0.5, gzip;q=0.8", everything) == "gzip"
+    assert preferred_encoding("gzip;q=0.5, *;q=0.9", everything) == "br"
+    # Equal weights go to the best compressing coding
+    assert preferred_encoding("gzip, zstd, br", everything) == "br"
+    assert preferred_encoding("gzip;q=0.9, br;q=0.5", ("br",)) == "br"
@@ -0,0 +1,126 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.libs.circuit import CircuitBreaker
+from src.libs.deadline import (
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    remaining,
+    set_deadline,
+)
+from src.libs.http import AsyncHTTPClient
+from src.libs.http_pool import client_registry
+from src.libs.retry import RetryPolicy
+
+app = FastAPI()
+app.add_middleware(DeadlineMiddleware, seconds=0.2)
+cancelled = asyncio.Event()
+
+
+@app.get("/api/slow")
+async def slow():
+    try:
+        await asyncio.sleep(10)
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+
+@app.get("/api/hung")
+async def hung():
+    http = AsyncHTTPClient(base_url="https://hung.example.com", timeout_value=30.0)
+    await http.send_through_circuit("/test", {}, {}, "get")
+
+
+@app.get("/api/remaining")
+async def time_remaining():
+    return {"remaining": remaining()}
+
+
+client = TestClient(app)
+
+
+def test_deadline_middleware_cancels_slow_requests():
+    response = client.get("/api/slow")
+
+    assert response.status_code == 504
+    assert "errorMessage" in response.json()["detail"]
+    assert cancelled.is_set()
+
+
+def test_deadline_middleware_sets_the_deadline():
+    assert 0 < client.get("/api/remaining").json()["remaining"] <= 0.2
+
+
+@pytest.mark.anyio
+async def test_http_client_skips_requests_past_the_deadline():
+    http = AsyncHTTPClient(base_url="https://deadline.example.com", timeout_value=30.0)
+
+    async def request():
+        # Set in a task of its own, so the deadline doesn't outlive the test
+        set_deadline(0)
+        await http.send("/test", {}, {}, "get")
+
+    with patch.object(httpx.AsyncClient, "get", new_callable=AsyncMock) as get:
+        with pytest.raises(DeadlineExceeded):
+            await asyncio.create_task(request())
+
+    get.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_http_client_requests_get_the_time_remaining():
+    http = AsyncHTTPClient(base_url="https://deadline.example.com", timeout_value=30.0)
+
+    async def request():
+        set_deadline(0.05)
+        await http.send("/test", {}, {}, "get")
+
+    async def hang(*args, timeout, **kwargs):
+        assert timeout.read <= 0.05
+        await asyncio.sleep(10)
+
+    with patch.object(httpx.AsyncClient, "get", side_effect=hang):
+        with pytest.raises(DeadlineExceeded):
+            await asyncio.wait_for(asyncio.create_task(request()), 1.0)
+
+
+async def hang(*args, **kwargs):
+    await asyncio.sleep(10)
+
+
+def test_requests_cut_off_by_the_deadline_open_the_circuit():
+    base_url = "https://hung.example.com"
+    breaker = CircuitBreaker(base_url, failure_threshold=2)
+    client_registry.configure(
+        base_url, retry_policy=RetryPolicy(max_attempts=1), circuit_breaker=breaker
+    )
+
+    with patch.object(httpx.AsyncClient, "get", side_effect=hang):
+        responses = [client.get("/api/hung") for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [504, 504, 503]
+    assert breaker.state == "open"
+
+
+@pytest.mark.anyio
+async def test_requests_never_sent_for_lack_of_time_leave_the_circuit_closed():
+    base_url = "https://unsent.example.com"
+    breaker = CircuitBreaker(base_url, failure_threshold=1)
+    client_registry.configure(base_url, circuit_breaker=breaker)
+    http = AsyncHTTPClient(base_url=base_url, timeout_value=30.0)
+
+    async def request():
+        set_deadline(0)
+        await http.send_through_circuit("/test", {}, {}, "get")
+
+    with pytest.raises(DeadlineExceeded):
+        await asyncio.create_task(request())
+
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
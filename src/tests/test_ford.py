@@ -1,8 +1,20 @@
+from unittest.mock import Mock
+
 import pytest
 from faker import Faker
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 
+from src.libs.cache import response_cache
 from src.main import app
+from src.routers.ford import (
+    dealer_slug_key,
+    get_dealer_slug,
+    get_first_page,
+    inventory_uri,
+    page_dealers,
+    slim_inventory,
+)
 from src.tests.test_helpers import program_vcr
 
 client = TestClient(app)
@@ -304,3 +316,117 @@ def test_ford_api_error_response_flag():
         r = client.get("/api/inventory/ford", headers=headers, params=params)
 
     assert r.status_code in [200, 400, 500]
+
+
+class FakeDealersAPI:
+    def __init__(self, slug: str):
+        self.slug = slug
+        self.requests = 0
+
+    async def get(self, uri, headers=None, params=None):
+        self.requests += 1
+        response = Mock()
+        response.json.return_value = {
+            "status": "SUCCESS",
+            "data": {"firstFDDealerSlug": self.slug},
+        }
+        return response
+
+
+@pytest.mark.anyio
+async def test_ford_dealer_slug_is_cached():
+    await response_cache.clear()
+    api = FakeDealersAPI("DealerSlug")
+    params = {"zipcode": "90210", "model": "mache"}
+
+    assert await get_dealer_slug(api, {}, params) == ("DealerSlug", False)
+    assert await get_dealer_slug(api, {}, params) == ("DealerSlug", True)
+    assert api.requests == 1
+
+    # A refresh bypasses the cache, and replaces the cached slug
+    api.slug = "NewDealerSlug"
+    assert await get_dealer_slug(api, {}, params, refresh=True) == (
+        "NewDealerSlug",
+        False,
+    )
+    assert await get_dealer_slug(api, {}, params) == ("NewDealerSlug", True)
+    assert api.requests == 2
+
+
+class FakeDealerLotAPI(FakeDealersAPI):
+    """Serves the dealers API, and a dealer-lot API which fails with an HTTP error for
+    any slug but lot_slug.
+    """
+
+    def __init__(self, slug: str, lot_slug: str | None = None):
+        super().__init__(slug)
+        self.lot_slug = lot_slug or slug
+
+    async def get(self, uri, headers=None, params=None):
+        if uri != inventory_uri:
+            return await super().get(uri, headers=headers, params=params)
+        if params["dealerSlug"] != self.lot_slug:
+            raise HTTPException(status_code=500)
+        response = Mock()
+        response.json.return_value = {"data": {"filterResults": []}}
+        return response
+
+    async def decode(self, response):
+        return response.json()
+
+
+@pytest.mark.anyio
+async def test_ford_stale_dealer_slug_is_refreshed():
+    await response_cache.clear()
+    params = {"zipcode": "90210", "model": "mache"}
+    key = dealer_slug_key("90210", "mache")
+    await response_cache.backend.set(key, b"StaleSlug", ttl=60.0)
+    api = FakeDealerLotAPI("NewDealerSlug")
+
+    inv, slug, inventory_params = await get_first_page(api, {}, params, radius=20)
+
+    assert inv == {"data": {"filterResults": []}}
+    assert slug == inventory_params["dealerSlug"] == "NewDealerSlug"
+    assert api.requests == 1
+    assert await response_cache.backend.get(key) == b"NewDealerSlug"
+
+
+@pytest.mark.anyio
+async def test_ford_fresh_dealer_slug_is_not_retried():
+    await response_cache.clear()
+    params = {"zipcode": "90210", "model": "mache"}
+    api = FakeDealerLotAPI("DealerSlug", lot_slug="OtherSlug")
+
+    with pytest.raises(HTTPException):
+        await get_first_page(api, {}, params, radius=20)
+    assert api.requests == 1
+
+
+def test_ford_slim_inventory():
+    dealers = [{"value": "12345", "displayName": "Ford Dealer"}]
+    page = {
+        "data": {
+            "filterResults": {
+                "ExactMatch": {
+                    "totalCount": 30,
+                    "vehicles": [{"vin": "3FMTK3SU0RMA00001"}],
+                    "sortOptions": ["Distance", "Price"],
+                }
+            },
+            "filterSet": {
+                "filterGroupsMap": {
+                    "Dealer": [{"filterItemsMetadata": {"filterItems": dealers}}],
+                    "Trim": [{"filterItemsMetadata": {"filterItems": ["Premium"]}}],
+                }
+            },
+        }
+    }
+
+    slim = slim_inventory(page["data"]["filterResults"]["ExactMatch"], dealers)
+
+    assert page_dealers(slim) == page_dealers(page) == dealers
+    assert slim["data"]["filterResults"]["ExactMatch"] == {
+        "totalCount": 30,
+        "vehicles": [{"vin": "3FMTK3SU0RMA00001"}],
+    }
+    assert "Trim" not in slim["data"]["filterSet"]["filterGroupsMap"]
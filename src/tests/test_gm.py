@@ -0,0 +1,196 @@
+import asyncio
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from src.libs.gm import (
+    GMInventory,
+    facets_uri,
+    search_uri,
+    search_with_facets,
+)
+from src.libs.pagination import offset_paging_support
+
+vehicles = [{"id": f"1GKKNRL4{n:09d}"} for n in range(30)]
+
+
+class FakeDiscoveryAPI:
+    """Serves a 30 vehicle search, 20 per page, with a facets endpoint that only
+    responds once the test releases it.
+    """
+
+    def __init__(self, facets_fail: bool = False):
+        self.base_url = "https://gm.example.com"
+        self.facets_released = asyncio.Event()
+        self.facets_fail = facets_fail
+        self.search_requests = 0
+
+    def response(self, data) -> Mock:
+        response = Mock()
+        response.json.return_value = data
+        return response
+
+    async def decode(self, response):
+        return response.json()
+
+    async def post(self, uri, headers=None, post_data=None):
+        if uri == facets_uri:
+            await self.facets_released.wait()
+            if self.facets_fail:
+                raise HTTPException(status_code=500)
+            return self.response({"facets": ["trim"]})
+
+        assert uri == search_uri
+        self.search_requests += 1
+        if self.search_requests == 1:
+            # Every page of the search completes while facets is still in flight
+            assert not self.facets_released.is_set()
+        if type(post_data) is bytes:
+            post_data = json.loads(post_data)
+        start = int(post_data["pagination"].get("nextPageToken", 0))
+        if self.search_requests == 2:
+            self.facets_released.set()
+        end = min(start + 20, len(vehicles))
+        return self.response(
+            {
+                "data": {
+                    "count": len(vehicles),
+                    "hits": vehicles[start:end],
+                    "pagination": {"nextPageToken": str(end) if end < 30 else None},
+                }
+            }
+        )
+
+
+@pytest.fixture(autouse=True)
+def walk_the_cursor():
+    offset_paging_support["https://gm.example.com"] = False
+    yield
+    offset_paging_support.clear()
+
+
+@pytest.mark.anyio
+async def test_search_with_facets_runs_concurrently():
+    api = FakeDiscoveryAPI()
+
+    inventory, facets = await search_with_facets(
+        api, headers={}, search_post_data={"pagination": {}}, facets_post_data={}
+    )
+
+    assert inventory["data"]["hits"] == vehicles
+    assert facets == {"facets": ["trim"]}
+
+
+@pytest.mark.anyio
+async def test_search_with_facets_tolerates_facets_failure():
+    api = FakeDiscoveryAPI(facets_fail=True)
+
+    inventory, facets = await search_with_facets(
+        api, headers={}, search_post_data={"pagination": {}}, facets_post_data={}
+    )
+
+    assert inventory["data"]["hits"] == vehicles
+    assert facets is None
+
+
+class FakeAsyncHTTPClient:
+    """Stands in for AsyncHTTPClient, serving every request from api"""
+
+    def __init__(self, api):
+        self.api = api
+
+    def __call__(self, **kwargs):
+        return self
+
+    async def __aenter__(self):
+        return self.api
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class CannedDiscoveryAPI:
+    base_url = "https://gm.example.com"
+
+    def __init__(self, search_response):
+        self.search_response = search_response
+        self.post_data = []
+
+    async def decode(self, response):
+        return response.json()
+
+    async def post(self, uri, headers=None, post_data=None):
+        self.post_data.append((uri, headers, post_data))
+        response = Mock()
+        if uri == facets_uri:
+            response.json.return_value = {"facets": []}
+        else:
+            response.json.return_value = self.search_response
+        return response
+
+
+def gm_inventory() -> GMInventory:
+    return GMInventory(
+        program_id="GMC",
+        base_url="https://gm.example.com",
+        error_message="An error occurred obtaining GMC inventory results.",
+    )
+
+
+@pytest.mark.anyio
+async def test_gm_inventory_search():
+    api = CannedDiscoveryAPI(
+        {
+            "status": "SUCCESS",
+            "data": {
+                "count": 1,
+                "hits": [{"id": "1GT000000TEST001", "disclaimers": ["..."]}],
+            },
+        }
+    )
+
+    with patch("src.libs.gm.AsyncHTTPClient", FakeAsyncHTTPClient(api)):
+        inventory = await gm_inventory().search(
+            user_agent="test",
+            referer="https://www.gmc.com/",
+            filters={"model": {"values": ["sierra ev"]}},
+        )
+
+    # Hits are slimmed and combined with the facets
+    assert inventory["data"]["hits"] == [{"id": "1GT000000TEST001"}]
+    assert inventory["facets"] == {"facets": []}
+
+    search, facets = sorted(api.post_data, key=lambda request: request[0] != search_uri)
+    assert search[1]["programId"] == "GMC"
+    assert search[2]["filters"] == {"model": {"values": ["sierra ev"]}}
+    assert search[2]["pagination"] == {"size": 100}
+    assert facets[2] == {}
+
+
+@pytest.mark.anyio
+async def test_gm_inventory_not_found():
+    api = CannedDiscoveryAPI(
+        {"status": "FAILURE", "errorDetails": {"key": "inventory.notFound"}}
+    )
+
+    with patch("src.libs.gm.AsyncHTTPClient", FakeAsyncHTTPClient(api)):
+        inventory = await gm_inventory().search(
+            user_agent="test", referer="https://www.gmc.com/", filters={}
+        )
+
+    assert inventory == {}
+
+
+@pytest.mark.anyio
+async def test_gm_inventory_unexpected_response():
+    api = CannedDiscoveryAPI({"status": "FAILURE"})
+
+    with patch("src.libs.gm.AsyncHTTPClient", FakeAsyncHTTPClient(api)):
+        with pytest.raises(HTTPException) as e:
+            await gm_inventory().search(
+                user_agent="test", referer="https://www.gmc.com/", filters={}
+            )
+
+    assert e.value.status_code == 500
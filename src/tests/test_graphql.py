@@ -0,0 +1,200 @@
+import json
+from unittest.mock import Mock
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from src.libs.graphql import (
+    GraphQLOperation,
+    fill_query_template,
+    persisted_query_errors,
+    persisted_query_max_errors,
+    persisted_query_support,
+    post_operation,
+    query_template,
+)
+
+operation = GraphQLOperation(
+    "query StockCarSearch($vin: String) { stockCarSearch(vin: $vin) { id } }",
+    operation_name="StockCarSearch",
+)
+
+
+class FakeApolloAPI:
+    """A GraphQL API which accepts automatic persisted queries if supports_apq is set,
+    and otherwise answers a request without a query with an error.
+    """
+
+    def __init__(self, supports_apq: bool):
+        self.base_url = "https://graphql.example.com"
+        self.supports_apq = supports_apq
+        self.registered = set()
+        self.bodies = []
+
+    async def post(self, uri, headers=None, post_data=None):
+        body = json.loads(post_data)
+        self.bodies.append(body)
+        response = Mock()
+
+        persisted = body.get("extensions", {}).get("persistedQuery")
+        if "query" in body:
+            # Apollo only registers a hash sent along with its query
+            if persisted and self.supports_apq:
+                self.registered.add(persisted["sha256Hash"])
+            result = {"data": {"stockCarSearch": {"id": body["variables"]["vin"]}}}
+        elif self.supports_apq and persisted["sha256Hash"] in self.registered:
+            result = {"data": {"stockCarSearch": {"id": body["variables"]["vin"]}}}
+        elif self.supports_apq:
+            result = {"errors": [{"message": "PersistedQueryNotFound"}]}
+        else:
+            result = {"errors": [{"message": "PersistedQueryNotSupported"}]}
+
+        response.content = json.dumps(result).encode()
+        response.json.return_value = result
+        return response
+
+
+@pytest.fixture(autouse=True)
+def reset_persisted_query_support():
+    persisted_query_support.clear()
+    persisted_query_errors.clear()
+    yield
+    persisted_query_support.clear()
+    persisted_query_errors.clear()
+
+
+def test_operation_body():
+    body = json.loads(operation.body({"vin": "WAUJ8BFW5S7901084"}))
+    assert body == {
+        "operationName": "StockCarSearch",
+        "query": operation.query,
+        "variables": {"vin": "WAUJ8BFW5S7901084"},
+    }
+
+    persisted = json.loads(operation.body({"vin": "1"}, persisted=True))
+    assert "query" not in persisted
+    assert persisted["extensions"]["persistedQuery"]["sha256Hash"] == (
+        operation.sha256_hash
+    )
+
+
+@pytest.mark.anyio
+async def test_persisted_query_registered_then_sent_by_hash():
+    api = FakeApolloAPI(supports_apq=True)
+
+    for vin in ("1", "2"):
+        response = await post_operation(
+            api, "/graphql", {}, operation, {"vin": vin}, persisted=True
+        )
+        assert response.json()["data"]["stockCarSearch"]["id"] == vin
+
+    # Hash (not found), full query, then the hash alone for the second request
+    assert ["query" in body for body in api.bodies] == [False, True, False]
+    assert api.bodies[1]["extensions"]["persistedQuery"]["sha256Hash"] == (
+        operation.sha256_hash
+    )
+    assert persisted_query_support[api.base_url] is True
+
+
+@pytest.mark.anyio
+async def test_persisted_queries_unsupported():
+    api = FakeApolloAPI(supports_apq=False)
+
+    for vin in ("1", "2"):
+        response = await post_operation(
+            api, "/graphql", {}, operation, {"vin": vin}, persisted=True, batch=False
+        )
+        assert response.json()["data"]["stockCarSearch"]["id"] == vin
+
+    # Only the first request tries the hash
+    assert ["query" in body for body in api.bodies] == [False, True, True]
+    assert persisted_query_support[api.base_url] is False
+
+
+@pytest.mark.anyio
+async def test_failed_persisted_query_does_not_disable_persisted_queries():
+    api = FakeApolloAPI(supports_apq=True)
+    api.registered.add(operation.sha256_hash)
+    post = api.post
+    failures = iter([HTTPException(status_code=504)])
+
+    async def flaky_post(uri, headers=None, post_data=None):
+        failure = next(failures, None)
+        if failure is not None:
+            raise failure
+        return await post(uri, headers=headers, post_data=post_data)
+
+    api.post = flaky_post
+    for vin in ("1", "2"):
+        await post_operation(
+            api, "/graphql", {}, operation, {"vin": vin}, persisted=True
+        )
+
+    # The timed out hash is retried with the full query, then hashes are sent again
+    assert ["query" in body for body in api.bodies] == [True, False]
+    assert persisted_query_support[api.base_url] is True
+
+
+def upstream_error(status_code: int) -> HTTPException:
+    """The HTTPException AsyncHTTPClient raises for an error status from the API"""
+    request = httpx.Request("POST", "https://graphql.example.com/graphql")
+    response = httpx.Response(status_code, request=request)
+    error = HTTPException(status_code=500)
+    error.__cause__ = httpx.HTTPStatusError("", request=request, response=response)
+    return error
+
+
+@pytest.mark.anyio
+async def test_persisted_query_rejected_with_client_error_disables_persisted_queries():
+    api = FakeApolloAPI(supports_apq=False)
+    post = api.post
+
+    async def reject_hashes(uri, headers=None, post_data=None):
+        if b'"query"' not in post_data:
+            raise upstream_error(400)
+        return await post(uri, headers=headers, post_data=post_data)
+
+    api.post = reject_hashes
+    for vin in ("1", "2", "3"):
+        response = await post_operation(
+            api, "/graphql", {}, operation, {"vin": vin}, persisted=True
+        )
+        assert response.json()["data"]["stockCarSearch"]["id"] == vin
+
+    # Only the first request tries the hash
+    assert ["query" in body for body in api.bodies] == [True, True, True]
+    assert persisted_query_support[api.base_url] is False
+
+
+@pytest.mark.anyio
+async def test_persisted_query_other_errors_disable_persisted_queries():
+    api = FakeApolloAPI(supports_apq=False)
+    post = api.post
+
+    async def require_query(uri, headers=None, post_data=None):
+        response = await post(uri, headers=headers, post_data=post_data)
+        if b'"query"' not in post_data:
+            result = {"errors": [{"message": "Must provide query string."}]}
+            response.content = json.dumps(result).encode()
+            response.json.return_value = result
+        return response
+
+    api.post = require_query
+    searches = persisted_query_max_errors + 2
+    for vin in range(searches):
+        await post_operation(
+            api, "/graphql", {}, operation, {"vin": str(vin)}, persisted=True
+        )
+
+    assert len(api.bodies) == 2 * persisted_query_max_errors + 2
+    assert persisted_query_support[api.base_url] is False
+
+
+def test_query_template_escapes_values():
+    template = query_template("query { search(series: %(model)s, year: %(year)s) }")
+    body = fill_query_template(template, model='i4 "M50"', year=2025)
+
+    assert json.loads(body)["query"] == (
+        'query { search(series: "i4 \\"M50\\"", year: 2025) }'
+    )
@@ -1,9 +1,17 @@
+import asyncio
+import json
 from unittest.mock import AsyncMock, Mock, patch
 
 import httpx
 import pytest
+from fastapi import HTTPException
 
-from src.libs.http import AsyncHTTPClient
+from src.libs.circuit import CircuitBreaker, CircuitOpenError
+from src.libs.hedge import HedgePolicy
+from src.libs.http import AsyncHTTPClient, BodyTemplate
+from src.libs.http_pool import ClientRegistry, client_registry, default_pool_limits
+from src.libs.ratelimit import HostLimiter, TokenBucket
+from src.libs.retry import RetryBudget, RetryPolicy
 
 
 @pytest.mark.anyio
@@ -327,3 +335,307 @@ async def test_http_timeout_configuration():
     # Verify the client has timeout configured
     assert client.timeout_value == 30.5
     await client.close()
+
+
+@pytest.mark.anyio
+async def test_http_client_reuses_pooled_client():
+    """AsyncHTTPClients with the same base_url share one pooled httpx client"""
+    async with AsyncHTTPClient(
+        base_url="https://pooled.example.com", timeout_value=10.0
+    ) as first:
+        pass
+    async with AsyncHTTPClient(
+        base_url="https://pooled.example.com", timeout_value=30.0
+    ) as second:
+        pass
+
+    assert first.client is second.client
+    # Leaving the context manager must not close the shared client
+    assert not second.client.is_closed
+    await client_registry.aclose()
+
+
+@pytest.mark.anyio
+async def test_http_client_registry_separates_base_urls():
+    """Each base_url and SSL verification setting gets its own pooled client"""
+    registry = ClientRegistry()
+
+    a = registry.get_client("https://a.example.com")
+    b = registry.get_client("https://b.example.com")
+    a_unverified = registry.get_client("https://a.example.com", verify=False)
+
+    assert a is not b
+    assert a is not a_unverified
+    assert registry.get_client("https://a.example.com") is a
+
+    await registry.aclose()
+    assert a.is_closed and b.is_closed and a_unverified.is_closed
+
+
+@pytest.mark.anyio
+async def test_http_client_registry_pool_limits():
+    """Per-manufacturer pool limits fall back to the defaults"""
+    registry = ClientRegistry()
+    limits = httpx.Limits(max_connections=5, max_keepalive_connections=5)
+    registry.configure("https://limited.example.com", limits=limits)
+
+    assert registry.limits_for("https://limited.example.com") is limits
+    assert registry.limits_for("https://other.example.com") is default_pool_limits
+
+
+@pytest.mark.anyio
+async def test_http_client_registry_replaces_closed_client():
+    """A closed pooled client is replaced on the next request"""
+    registry = ClientRegistry()
+    client = registry.get_client("https://example.com")
+    await client.aclose()
+
+    assert registry.get_client("https://example.com") is not client
+    await registry.aclose()
+
+
+def test_body_template_renders_slots():
+    body = {
+        "filters": {"model": {"values": ["lyriq"]}},
+        "pagination": {"size": 20},
+        "page": 1,
+    }
+    template = BodyTemplate(body, pagination=("pagination",), page=("page",))
+
+    rendered = template.render(pagination={"size": 20, "nextPageToken": "abc"}, page=3)
+
+    assert json.loads(rendered) == {
+        "filters": {"model": {"values": ["lyriq"]}},
+        "pagination": {"size": 20, "nextPageToken": "abc"},
+        "page": 3,
+    }
+    # The body the template was built from is unchanged
+    assert body["pagination"] == {"size": 20}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("offload_bytes", [1024 * 1024, 0])
+async def test_http_client_decode(offload_bytes):
+    response = httpx.Response(200, content=b'{"data": {"hits": [1, 2, 3]}}')
+
+    with patch("src.libs.http.decode_offload_bytes", offload_bytes):
+        async with AsyncHTTPClient(
+            base_url="https://example.com", timeout_value=10.0
+        ) as client:
+            assert await client.decode(response) == {"data": {"hits": [1, 2, 3]}}
+
+            with pytest.raises(ValueError):
+                await client.decode(httpx.Response(200, content=b"<html>"))
+
+
+def network_error() -> httpx.NetworkError:
+    return httpx.NetworkError("Connection reset", request=httpx.Request("GET", "/"))
+
+
+@pytest.fixture
+def retrying_client():
+    base_url = "https://retry.example.com"
+    client_registry.configure(base_url, retry_policy=RetryPolicy(backoff=0))
+    with patch("src.libs.http.retry_budget", RetryBudget(ratio=0.1, reserve=1)):
+        yield AsyncHTTPClient(base_url=base_url, timeout_value=10.0)
+
+
+@pytest.mark.anyio
+async def test_http_client_retries_transient_failures(retrying_client):
+    ok = httpx.Response(200, request=httpx.Request("GET", "/"))
+    with patch.object(
+        httpx.AsyncClient,
+        "get",
+        new_callable=AsyncMock,
+        side_effect=[network_error(), ok],
+    ) as get:
+        assert await retrying_client.get("/test", headers={"User-Agent": "Test"}) is ok
+
+    assert get.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_http_client_does_not_retry_posts_by_default(retrying_client):
+    with patch.object(
+        httpx.AsyncClient, "post", new_callable=AsyncMock, side_effect=network_error()
+    ) as post:
+        with pytest.raises(httpx.NetworkError):
+            await retrying_client.send_with_retries("/test", {}, {}, "post")
+
+    assert post.await_count == 1
+
+
+@pytest.mark.anyio
+async def test_http_client_retries_are_bounded_by_the_budget(retrying_client):
+    with patch.object(
+        httpx.AsyncClient, "get", new_callable=AsyncMock, side_effect=network_error()
+    ) as get:
+        # The budget holds one retry, so the first request is retried once
+        with pytest.raises(httpx.NetworkError):
+            await retrying_client.send_with_retries("/test", {}, {}, "get")
+        assert get.await_count == 2
+
+        # and the second not at all
+        with pytest.raises(httpx.NetworkError):
+            await retrying_client.send_with_retries("/test", {}, {}, "get")
+        assert get.await_count == 3
+
+
+@pytest.fixture
+def hedged_client():
+    base_url = "https://hedge.example.com"
+    policy = HedgePolicy(percentile=0.5, max_hedge_rate=0, min_delay=0, min_samples=1)
+    policy.record(0.01)
+    client_registry.configure(base_url, hedge_policy=policy)
+    yield AsyncHTTPClient(base_url=base_url, timeout_value=10.0), policy
+
+
+def slow_then_fast(*responses):
+    """A side effect whose first call takes a second and later calls return at once"""
+    calls = iter(range(len(responses)))
+
+    async def get(*args, **kwargs):
+        call = next(calls)
+        if call == 0:
+            await asyncio.sleep(1)
+        return responses[call]
+
+    return get
+
+
+@pytest.mark.anyio
+async def test_http_client_hedges_slow_requests(hedged_client):
+    client, policy = hedged_client
+    slow = httpx.Response(200, request=httpx.Request("GET", "/"))
+    fast = httpx.Response(200, request=httpx.Request("GET", "/"))
+    with patch.object(
+        httpx.AsyncClient, "get", side_effect=slow_then_fast(slow, fast)
+    ) as get:
+        assert await client.send_with_retries("/test", {}, {}, "get") is fast
+
+    assert get.call_count == 2
+    assert policy.stats()["hedgeWins"] == 1
+
+
+@pytest.mark.anyio
+async def test_http_client_hedges_are_capped(hedged_client):
+    client, policy = hedged_client
+    responses = [httpx.Response(200, request=httpx.Request("GET", "/"))] * 3
+    with patch.object(httpx.AsyncClient, "get", side_effect=slow_then_fast(*responses)):
+        await client.send_with_retries("/test", {}, {}, "get")
+
+    # A hedge rate of 0 allows only the first hedge, so the next request waits out
+    # its slow response
+    policy.record(0)
+    with patch.object(
+        httpx.AsyncClient, "get", side_effect=slow_then_fast(*responses)
+    ) as get:
+        await client.send_with_retries("/test", {}, {}, "get")
+
+    assert get.call_count == 1
+    assert policy.stats()["hedges"] == 1
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("https://down.example.com", failure_threshold=2)
+    with patch("src.libs.circuit.time.monotonic", return_value=1000.0):
+        for _ in range(2):
+            breaker.after_request(network_error(), breaker.before_request())
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError) as e:
+            breaker.before_request()
+        assert e.value.status_code == 503
+
+    # Once recovery_time has passed a single trial request is let through
+    with patch("src.libs.circuit.time.monotonic", return_value=1031.0):
+        trial = breaker.before_request()
+        assert trial
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request()
+        breaker.after_request(None, trial)
+
+    assert breaker.state == "closed"
+    assert breaker.stats()["rejected"] == 2
+
+
+def test_circuit_breaker_ignores_client_errors():
+    breaker = CircuitBreaker("https://down.example.com", failure_threshold=1)
+    response = httpx.Response(404, request=httpx.Request("GET", "/"))
+    error = httpx.HTTPStatusError(
+        "Not found", request=response.request, response=response
+    )
+
+    breaker.after_request(error, breaker.before_request())
+
+    assert breaker.state == "closed"
+
+
+@pytest.mark.anyio
+async def test_http_client_fails_fast_while_circuit_open():
+    base_url = "https://circuit.example.com"
+    client_registry.configure(
+        base_url,
+        retry_policy=RetryPolicy(max_attempts=1),
+        circuit_breaker=CircuitBreaker(base_url, failure_threshold=1),
+    )
+    client = AsyncHTTPClient(base_url=base_url, timeout_value=10.0)
+    headers = {"User-Agent": "Test"}
+    with patch.object(
+        httpx.AsyncClient, "get", new_callable=AsyncMock, side_effect=network_error()
+    ) as get:
+        with pytest.raises(HTTPException):
+            await client.get("/test", headers=headers)
+        with pytest.raises(CircuitOpenError):
+            await client.get("/test", headers=headers)
+
+    assert get.await_count == 1
+    assert client_registry.circuit_stats()[base_url]["state"] == "open"
+
+
+def test_token_bucket_spaces_requests_past_the_burst():
+    with patch("src.libs.ratelimit.time.monotonic", return_value=1000.0):
+        bucket = TokenBucket(rate=10.0, burst=2)
+        delays = [bucket.reserve() for _ in range(4)]
+
+    assert delays == pytest.approx([0, 0, 0.1, 0.2])
+
+
+@pytest.mark.anyio
+async def test_host_limiter_bounds_requests_in_flight():
+    limiter = HostLimiter(max_concurrent=2)
+    in_flight = peak = 0
+
+    async def request():
+        nonlocal in_flight, peak
+        async with limiter:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    await asyncio.gather(*(request() for _ in range(6)))
+
+    stats = limiter.stats()
+    assert peak == 2
+    assert stats["requests"] == 6
+    assert stats["queued"] == 4
+    assert stats["inFlight"] == 0
+    assert stats["maxWaitSeconds"] >= 0.02
+
+
+@pytest.mark.anyio
+async def test_http_client_requests_wait_for_the_host_limiter():
+    base_url = "https://limited.example.com"
+    limiter = HostLimiter(max_concurrent=1)
+    client_registry.configure(base_url, limiter=limiter)
+    client = AsyncHTTPClient(base_url=base_url, timeout_value=10.0)
+    ok = httpx.Response(200, request=httpx.Request("GET", "/"))
+
+    with patch.object(
+        httpx.AsyncClient, "get", new_callable=AsyncMock, return_value=ok
+    ):
+        headers = {"User-Agent": "Test"}
+        await client.get([[f"/{page}", headers, {}] for page in range(3)])
+
+    assert limiter.stats()["requests"] == 3
+    assert client_registry.limiter_stats()[base_url] == limiter.stats()
@@ -0,0 +1,314 @@
+import json
+from unittest.mock import Mock
+
+import pytest
+from fastapi import HTTPException
+
+from src.libs.pagination import (
+    CursorPaginator,
+    IndexWindowPaginator,
+    OffsetLimitPaginator,
+    offset_paging_support,
+    page_window_sizes,
+)
+
+vehicles = [{"id": f"1GYKPMRL{n:09d}"} for n in range(45)]
+
+
+class FakeGMSearchAPI:
+    """Serves a 45 vehicle search, 20 per page, paged by nextPageToken. Offset paging
+    is only honoured when supports_offset is True; otherwise the offset is ignored and
+    the first page is returned, as an API ignoring an unknown field would.
+    """
+
+    def __init__(self, base_url: str, supports_offset: bool):
+        self.base_url = base_url
+        self.supports_offset = supports_offset
+        self.requests = []
+
+    def page(self, start: int) -> Mock:
+        end = min(start + 20, len(vehicles))
+        response = Mock()
+        response.json.return_value = {
+            "data": {
+                "count": len(vehicles),
+                "hits": vehicles[start:end],
+                "pagination": {"nextPageToken": str(end) if end < 45 else None},
+            }
+        }
+        return response
+
+    def respond(self, post_data: dict | bytes) -> Mock:
+        if type(post_data) is bytes:
+            post_data = json.loads(post_data)
+        pagination = post_data["pagination"]
+        self.requests.append(pagination)
+        if "nextPageToken" in pagination:
+            return self.page(int(pagination["nextPageToken"]))
+        if self.supports_offset:
+            return self.page(pagination.get("offset", 0))
+        return self.page(0)
+
+    async def post(self, uri, headers=None, post_data=None):
+        if type(uri) is list:
+            return [self.respond(url[2]) for url in uri]
+        return self.respond(post_data)
+
+    async def decode(self, response):
+        return response.json()
+
+
+@pytest.fixture(autouse=True)
+def reset_learned_paging():
+    offset_paging_support.clear()
+    page_window_sizes.clear()
+    yield
+    offset_paging_support.clear()
+    page_window_sizes.clear()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("supports_offset", [True, False])
+async def test_paginator_fetches_every_page(supports_offset):
+    api = FakeGMSearchAPI("https://gm.example.com", supports_offset=supports_offset)
+    paginator = CursorPaginator(api, uri="/search", headers={}, post_data={})
+    first_page = api.page(0).json()
+
+    remaining = await paginator.fetch_remaining(first_page)
+
+    assert first_page["data"]["hits"] + remaining == vehicles
+    assert offset_paging_support["https://gm.example.com"] is supports_offset
+
+
+@pytest.mark.anyio
+async def test_paginator_walks_cursor_when_offset_probe_fails():
+    api = FakeGMSearchAPI("https://gm.example.com", supports_offset=True)
+    respond = api.respond
+
+    def reject_offsets(post_data):
+        if b"nextPageToken" not in post_data:
+            raise HTTPException(status_code=400, detail="Unknown field offset")
+        return respond(post_data)
+
+    api.respond = reject_offsets
+    paginator = CursorPaginator(api, uri="/search", headers={}, post_data={})
+
+    remaining = await paginator.fetch_remaining(api.page(0).json())
+
+    assert remaining == vehicles[20:]
+    assert offset_paging_support["https://gm.example.com"] is False
+
+
+@pytest.mark.anyio
+async def test_paginator_uses_offsets_once_supported():
+    api = FakeGMSearchAPI("https://gm.example.com", supports_offset=True)
+    offset_paging_support["https://gm.example.com"] = True
+    paginator = CursorPaginator(api, uri="/search", headers={}, post_data={})
+
+    remaining = await paginator.fetch_remaining(api.page(0).json())
+
+    assert remaining == vehicles[20:]
+    assert api.requests == [
+        {"size": 20, "offset": 20},
+        {"size": 20, "offset": 40},
+    ]
+
+
+@pytest.mark.anyio
+async def test_paginator_walks_cursor_when_offsets_unsupported():
+    api = FakeGMSearchAPI("https://gm.example.com", supports_offset=False)
+    offset_paging_support["https://gm.example.com"] = False
+    paginator = CursorPaginator(api, uri="/search", headers={}, post_data={})
+
+    remaining = await paginator.fetch_remaining(api.page(0).json())
+
+    assert remaining == vehicles[20:]
+    assert all("nextPageToken" in request for request in api.requests)
+
+
+@pytest.mark.anyio
+async def test_paginator_single_page():
+    api = FakeGMSearchAPI("https://gm.example.com", supports_offset=True)
+    paginator = CursorPaginator(api, uri="/search", headers={}, post_data={})
+    single_page = {"data": {"count": 3, "hits": vehicles[:3], "pagination": {}}}
+
+    assert await paginator.fetch_remaining(single_page) == []
+    assert api.requests == []
+
+
+class FakeDealerLotAPI:
+    """Serves a 100 vehicle search paged by beginIndex/endIndex, returning at most
+    max_window vehicles per request. The windows in fail_windows fail failures times,
+    and windows larger than reject_above always fail.
+    """
+
+    def __init__(
+        self,
+        max_window: int,
+        fail_windows=(),
+        failures: int = 1,
+        reject_above: int | None = None,
+    ):
+        self.base_url = "https://ford.example.com"
+        self.max_window = max_window
+        self.reject_above = reject_above
+        self.failures = {begin: failures for begin in fail_windows}
+        self.requests = []
+
+    async def get(self, uri, headers=None, params=None):
+        begin, end = params["beginIndex"], params["endIndex"]
+        self.requests.append((begin, end))
+        if self.failures.get(begin):
+            self.failures[begin] -= 1
+            raise HTTPException(status_code=500)
+        if self.reject_above is not None and end - begin > self.reject_above:
+            raise HTTPException(status_code=500)
+
+        response = Mock()
+        end = min(end, begin + self.max_window)
+        response.json.return_value = {"vehicles": list(range(begin, end))}
+        return response
+
+    async def decode(self, response):
+        return response.json()
+
+
+def window_paginator(api) -> IndexWindowPaginator:
+    return IndexWindowPaginator(
+        api,
+        uri="/dealer-lot",
+        headers={},
+        params={},
+        items=lambda page: page["vehicles"],
+        backoff=0,
+    )
+
+
+def flatten(pages: list) -> list:
+    return [vehicle for page in pages for vehicle in page["vehicles"]]
+
+
+@pytest.mark.anyio
+async def test_window_paginator_learns_the_largest_window():
+    api = FakeDealerLotAPI(max_window=30)
+
+    pages = await window_paginator(api).fetch_remaining(begin=12, total=100)
+
+    assert flatten(pages) == list(range(12, 100))
+    assert page_window_sizes["https://ford.example.com"] == 30
+
+    # Later searches request the learned window straight away
+    api.requests.clear()
+    await window_paginator(api).fetch_remaining(begin=12, total=100)
+    assert all(end - begin <= 30 for begin, end in api.requests)
+    assert len(api.requests) == 3
+
+
+@pytest.mark.anyio
+async def test_window_paginator_retries_and_backs_off():
+    api = FakeDealerLotAPI(max_window=100, fail_windows=[12])
+    page_window_sizes["https://ford.example.com"] = 20
+    paginator = window_paginator(api)
+
+    pages = await paginator.fetch_remaining(begin=12, total=100)
+
+    assert flatten(pages) == list(range(12, 100))
+    # The failed window is retried at half the size, down to min_window
+    assert api.requests.count((12, 32)) == 1
+    assert api.requests.count((12, 24)) == 1
+    assert paginator.in_flight == 2
+
+
+@pytest.mark.anyio
+async def test_window_paginator_gives_up_on_a_failing_window():
+    api = FakeDealerLotAPI(max_window=100, fail_windows=[12], failures=10)
+    page_window_sizes["https://ford.example.com"] = 50
+
+    pages = await window_paginator(api).fetch_remaining(begin=12, total=100)
+
+    assert pages[0] is None
+    assert pages[1]["vehicles"] == list(range(62, 100))
+    assert [request for request in api.requests if request[0] == 12] == [
+        (12, 62),
+        (12, 37),
+        (12, 24),
+    ]
+
+
+@pytest.mark.anyio
+async def test_window_paginator_shrinks_rejected_windows():
+    api = FakeDealerLotAPI(max_window=100, reject_above=30)
+
+    pages = await window_paginator(api).fetch_remaining(begin=12, total=100)
+
+    assert flatten(pages) == list(range(12, 100))
+    # 88, then 44, are rejected, and 22 accepted for the rest of the search
+    assert api.requests == [
+        (12, 100),
+        (12, 56),
+        (12, 34),
+        (34, 56),
+        (56, 78),
+        (78, 100),
+    ]
+    assert page_window_sizes["https://ford.example.com"] == 22
+
+
+class FakeOnegraphAPI:
+    """Serves a 100 vehicle search paged by offset and limit. Limits above max_limit
+    are capped, or rejected with a GraphQL error if reject_large_limits is set.
+    """
+
+    def __init__(self, max_limit: int, reject_large_limits: bool = False):
+        self.base_url = "https://onegraph.example.com"
+        self.max_limit = max_limit
+        self.reject_large_limits = reject_large_limits
+        self.requests = []
+
+    async def post(self, uri, headers=None, post_data=None):
+        offset, limit = post_data["offset"], post_data["limit"]
+        self.requests.append((offset, limit))
+        response = Mock()
+        if limit > self.max_limit and self.reject_large_limits:
+            response.json.return_value = {"errors": [{"message": "limit too large"}]}
+            return response
+
+        end = min(offset + min(limit, self.max_limit), 100)
+        response.json.return_value = {
+            "data": {"count": 100, "cars": list(range(offset, end))}
+        }
+        return response
+
+    async def decode(self, response):
+        return response.json()
+
+
+def offset_paginator(api) -> OffsetLimitPaginator:
+    return OffsetLimitPaginator(
+        api,
+        post=lambda offset, limit: api.post(
+            uri="/graphql", post_data={"offset": offset, "limit": limit}
+        ),
+        items=lambda page: page["data"]["cars"],
+        count=lambda page: page["data"]["count"],
+        max_in_flight=2,
+        backoff=0,
+    )
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("reject_large_limits", [False, True])
+async def test_offset_paginator_probes_the_page_limit(reject_large_limits):
+    api = FakeOnegraphAPI(max_limit=24, reject_large_limits=reject_large_limits)
+    paginator = offset_paginator(api)
+
+    first_page = await paginator.fetch_first()
+    cars = first_page["data"]["cars"]
+    remaining = await paginator.fetch_remaining(begin=len(cars), total=100)
+
+    assert cars + [car for page in remaining for car in page["data"]["cars"]] == list(
+        range(100)
+    )
+    learned = page_window_sizes["https://onegraph.example.com"]
+    assert learned == (12 if reject_large_limits else 24)
+    assert all(limit <= learned for _, limit in api.requests[2:])
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from src.libs.projection import VehicleProjection
+
+search_response = json.dumps(
+    {
+        "data": {
+            "items": [
+                {"vin": "KM8KRDAF1PU000001", "msrp": 52500, "specs": [{"a": 1}] * 50},
+                {"vin": "KM8KRDAF1PU000002", "features": ["Heated seats"]},
+            ],
+            "totalPages": 3,
+            "facets": {"trim": ["SEL", "Limited"]},
+        },
+        "status": "SUCCESS",
+    }
+).encode()
+
+
+def projection(use_msgspec: bool) -> VehicleProjection:
+    vehicles = VehicleProjection(
+        "TestVehicle",
+        fields=("vin", "msrp"),
+        path=("data", "items"),
+        keep=("totalPages",),
+    )
+    # msgspec is a project dependency, so the Struct decoder is always built
+    assert vehicles.response_type is not None
+    if not use_msgspec:
+        vehicles.response_type = None
+    return vehicles
+
+
+@pytest.mark.parametrize("use_msgspec", [True, False])
+def test_projection_keeps_listed_fields(use_msgspec):
+    vehicles = projection(use_msgspec)
+
+    assert vehicles.loads(search_response) == {
+        "data": {
+            "items": [
+                {"vin": "KM8KRDAF1PU000001", "msrp": 52500},
+                {"vin": "KM8KRDAF1PU000002"},
+            ],
+            "totalPages": 3,
+        }
+    }
+
+
+@pytest.mark.parametrize("use_msgspec", [True, False])
+def test_projection_of_empty_and_invalid_responses(use_msgspec):
+    vehicles = projection(use_msgspec)
+
+    assert vehicles.loads(b"{}") == {"data": None}
+    assert vehicles.loads(b'{"data": {}}') == {
+        "data": {"items": None, "totalPages": None}
+    }
+    for invalid in (b"<html>", b"[]", b'{"data": []}'):
+        with pytest.raises(ValueError):
+            vehicles.loads(invalid)